@@ -1,12 +1,44 @@
+import inspect
+import io
+import itertools
+import math
+import subprocess
 import librosa
 import librosa.filters
 import numpy as np
+import soundfile
+import torch
 # import tensorflow as tf
 from scipy import signal
 from scipy.io import wavfile
 from hparams import hparams as hp
 
 def load_wav(path, sr):
+    """Mono float32 samples of ``path`` at ``sr`` Hz, as librosa.core.load returns them.
+
+    Files libsndfile reads (WAV, FLAC, Ogg) are read directly; other
+    containers are decoded to WAV through an ffmpeg pipe. Channels are
+    averaged, and a polyphase filter resamples only when the rate differs.
+    """
+    try:
+        wav, file_sr = soundfile.read(path, dtype='float32', always_2d=True)
+    except RuntimeError:  # soundfile.LibsndfileError, for containers libsndfile cannot read
+        wav, file_sr = soundfile.read(io.BytesIO(_ffmpeg_decode(path)), dtype='float32', always_2d=True)
+    wav = wav[:, 0] if wav.shape[1] == 1 else wav.mean(axis=1)
+    if file_sr != sr:
+        gcd = math.gcd(file_sr, sr)
+        wav = signal.resample_poly(wav, sr // gcd, file_sr // gcd).astype(np.float32)
+    return wav
+
+def _ffmpeg_decode(path, ffmpeg='ffmpeg'):
+    """The first audio stream of ``path`` as the bytes of a float WAV file, at its own rate and channels."""
+    command = [ffmpeg, '-loglevel', 'error', '-nostdin', '-i', path, '-vn', '-c:a', 'pcm_f32le', '-f', 'wav', '-']
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError('ffmpeg failed to read audio of {}: {}'.format(path, process.stderr.decode(errors='replace').strip()))
+    return process.stdout
+
+def librosa_load_wav(path, sr):
     return librosa.core.load(path, sr=sr)[0]
 
 def save_wav(wav, path, sr):
@@ -43,6 +75,11 @@ def linearspectrogram(wav):
     return S
 
 def melspectrogram(wav):
+    if hp.mel_frontend == 'torch':
+        return melspectrograms([wav])[0]
+    return librosa_melspectrogram(wav)
+
+def librosa_melspectrogram(wav):
     D = _stft(preemphasis(wav, hp.preemphasis, hp.preemphasize))
     S = _amp_to_db(_linear_to_mel(np.abs(D))) - hp.ref_level_db
     
@@ -50,6 +87,186 @@ def melspectrogram(wav):
         return _normalize(S)
     return S
 
+def melspectrograms(wavs, device='cpu', dtype=torch.float32, block_frames=16384):
+    """Mel spectrograms of several waveforms at once with torch.stft, as melspectrogram returns them.
+
+    The waveforms are pre-emphasised, padded as librosa.stft centres them and
+    stacked, then transformed ``block_frames`` STFT frames at a time, which
+    bounds memory for long audio. torch runs each block on its intra-op
+    threads. Returns a list of arrays of shape (num_mels, frames).
+    """
+    hop_size, n_fft = get_hop_size(), hp.n_fft
+    frames = [len(wav) // hop_size + 1 for wav in wavs]
+    batch = torch.zeros(len(wavs), (max(frames) - 1) * hop_size + n_fft, dtype=dtype, device=device)
+    for row, wav in zip(batch, wavs):
+        y = _pad(_preemphasise(torch.as_tensor(np.asarray(wav)).to(dtype)), n_fft // 2, n_fft // 2)
+        row[:len(y)] = y[:len(row)]
+    S = _padded_melspectrogram(batch, max(frames), block_frames)
+    return [S[i, :, :n] for i, n in enumerate(frames)]
+
+class MelStream(object):
+    """Incremental melspectrogram: mel frames of audio pushed block by block.
+
+    The frames pushed and finished add up to melspectrogram of the whole
+    signal. The pre-emphasis filter state and the STFT frames' overlap with
+    the next block are carried over, so each frame is computed once, as soon
+    as the samples under its window have arrived.
+    """
+
+    def __init__(self, dtype=torch.float32):
+        self.dtype = dtype
+        self.frames = 0  # emitted so far
+        self.samples = 0  # pushed so far
+        self._last = 0.  # the previous sample, for pre-emphasis
+        self._buffer = None  # the padded, pre-emphasised signal from frame self.frames on
+        self._pending = []  # samples before the start padding can be made
+        self._tail = torch.zeros(0, dtype=dtype)  # the last samples, for the end padding
+
+    def push(self, wav):
+        """The mel frames, of shape (num_mels, frames), completed by the samples ``wav``."""
+        wav = torch.as_tensor(np.asarray(wav)).to(self.dtype)
+        if len(wav) == 0:
+            return self._empty()
+        y = _preemphasise(wav, self._last)
+        self._last = float(wav[-1])
+        self.samples += len(y)
+        pad = hp.n_fft // 2
+        self._tail = torch.cat([self._tail, y])[-(pad + 1):]
+        if self._buffer is None:
+            self._pending.append(y)
+            if sum(len(p) for p in self._pending) <= pad:
+                return self._empty()
+            y = torch.cat(self._pending)
+            self._pending = None
+            self._buffer = _pad(y, pad, 0)
+        else:
+            self._buffer = torch.cat([self._buffer, y])
+        return self._emit((len(self._buffer) - hp.n_fft) // get_hop_size() + 1)
+
+    def finish(self):
+        """The remaining mel frames once all the audio has been pushed."""
+        pad = hp.n_fft // 2
+        if self._buffer is None:
+            y = torch.cat(self._pending) if self._pending else torch.zeros(0, dtype=self.dtype)
+            self._pending = None
+            self._buffer = _pad(y, pad, pad)
+        else:
+            self._buffer = torch.cat([self._buffer, _pad(self._tail, 0, pad)[-pad:]])
+        return self._emit(self.samples // get_hop_size() + 1 - self.frames)
+
+    def _emit(self, count):
+        if count <= 0:
+            return self._empty()
+        hop_size = get_hop_size()
+        padded = self._buffer[:(count - 1) * hop_size + hp.n_fft]
+        self._buffer = self._buffer[count * hop_size:]
+        self.frames += count
+        return _padded_melspectrogram(padded[None], count)[0]
+
+    def _empty(self):
+        return np.zeros((hp.num_mels, 0), np.float32)
+
+def mel_chunk_starts(num_frames, fps, step):
+    """First mel frame of the ``step``-frame window paired with each video frame at ``fps``.
+
+    Windows start 80 / fps mel frames apart; the last one ends at the last mel frame.
+    """
+    if num_frames < step:
+        raise ValueError('The audio is shorter than one window of {} mel frames'.format(step))
+    mel_idx_multiplier = 80. / fps
+    starts = (np.arange(int((num_frames - step + 1) / mel_idx_multiplier) + 2) * mel_idx_multiplier).astype(int)
+    return np.append(starts[starts + step <= num_frames], num_frames - step)
+
+def num_mel_chunks(num_samples, fps, step):
+    """How many mel chunks ``num_samples`` samples of audio make."""
+    return len(mel_chunk_starts(num_samples // get_hop_size() + 1, fps, step))
+
+class MelChunks(object):
+    """The ``step``-frame windows of ``mel`` paired with each video frame, as views into it."""
+
+    def __init__(self, mel, fps, step):
+        self.starts = mel_chunk_starts(mel.shape[1], fps, step)
+        self.windows = np.lib.stride_tricks.sliding_window_view(mel, step, axis=1)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return self.windows[:, self.starts[i]]
+
+def stream_mel_chunks(blocks, fps, step, dtype=torch.float32):
+    """Yield the windows of MelChunks of the audio ``blocks`` as soon as their mel frames exist.
+
+    Only the mel frames of windows not yet yielded are kept; each window is a
+    view into the frames computed around it.
+    """
+    stream = MelStream(dtype)
+    mel_idx_multiplier = 80. / fps
+    mel, base, i = np.zeros((hp.num_mels, 0), np.float32), 0, 0
+    for block in itertools.chain(blocks, [None]):
+        new = stream.finish() if block is None else stream.push(block)
+        mel = np.concatenate([mel, new], axis=1)  # a new array, so earlier windows stay valid
+        end = base + mel.shape[1]
+        if mel.shape[1] >= step:
+            windows = np.lib.stride_tricks.sliding_window_view(mel, step, axis=1)
+            while int(i * mel_idx_multiplier) + step <= end:
+                yield windows[:, int(i * mel_idx_multiplier) - base]
+                i += 1
+        if block is None:
+            if end < step:
+                raise ValueError('The audio is shorter than one window of {} mel frames'.format(step))
+            yield windows[:, -1]
+            return
+        keep = max(min(int(i * mel_idx_multiplier), end - step), base)
+        mel, base = mel[:, keep - base:], keep
+
+def wav_blocks(path, sr, block_size):
+    """The number of samples of load_wav(path, sr) and an iterator over them in blocks of ``block_size``.
+
+    Files libsndfile reads at ``sr`` are read block by block; others are
+    loaded whole first.
+    """
+    try:
+        info = soundfile.info(path)
+    except RuntimeError:
+        info = None
+    if info is None or info.samplerate != sr:
+        wav = load_wav(path, sr)
+        return len(wav), (wav[i:i + block_size] for i in range(0, len(wav), block_size))
+
+    def blocks():
+        for block in soundfile.blocks(path, blocksize=block_size, dtype='float32', always_2d=True):
+            yield block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+    return info.frames, blocks()
+
+def _preemphasise(y, last=0.):
+    """preemphasis of a torch tensor whose previous sample was ``last``."""
+    if not hp.preemphasize or len(y) == 0:
+        return y
+    return torch.cat([y[:1] - hp.preemphasis * last, y[1:] - hp.preemphasis * y[:-1]])
+
+def _pad(y, left, right):
+    """``y`` padded as librosa.stft pads the ends of a signal."""
+    return torch.from_numpy(np.pad(y.numpy(), (left, right), mode=_stft_pad_mode() if len(y) else 'constant'))
+
+def _padded_melspectrogram(batch, frames, block_frames=16384):
+    """The normalised mel spectrograms of the first ``frames`` STFT frames of each padded row of ``batch``."""
+    hop_size, n_fft = get_hop_size(), hp.n_fft
+    window, mel_basis = _stft_constants(batch.device, batch.dtype)
+    mel = torch.empty(len(batch), hp.num_mels, frames, dtype=torch.float32)
+    with torch.no_grad():
+        for start in range(0, frames, block_frames):
+            count = min(block_frames, frames - start)
+            block = batch[:, start * hop_size:(start + count - 1) * hop_size + n_fft]
+            D = torch.stft(block, n_fft, hop_length=hop_size, win_length=hp.win_size, window=window,
+                           center=False, return_complex=True)
+            mel[:, :, start:start + count] = torch.matmul(mel_basis, D.abs()).cpu()
+
+    S = _amp_to_db(mel.numpy()) - hp.ref_level_db
+    if hp.signal_normalization:
+        S = _normalize(S)
+    return S
+
 def _lws_processor():
     import lws
     return lws.lws(hp.n_fft, get_hop_size(), fftsize=hp.win_size, mode="speech")
@@ -95,6 +312,29 @@ def _linear_to_mel(spectogram):
         _mel_basis = _build_mel_basis()
     return np.dot(_mel_basis, spectogram)
 
+_torch_constants = {}
+
+def _stft_constants(device, dtype):
+    """The STFT window and mel filterbank as tensors, built once per device and dtype."""
+    key = (str(device), dtype)
+    if key not in _torch_constants:
+        global _mel_basis
+        if _mel_basis is None:
+            _mel_basis = _build_mel_basis()
+        _torch_constants[key] = (torch.hann_window(hp.win_size, dtype=dtype, device=device),
+                                 torch.as_tensor(_mel_basis, dtype=dtype, device=device))
+    return _torch_constants[key]
+
+_pad_mode = None
+
+def _stft_pad_mode():
+    """How librosa.stft pads the signal ends: 'reflect' before librosa 0.10, zeros from it."""
+    global _pad_mode
+    if _pad_mode is None:
+        mode = inspect.signature(librosa.stft).parameters['pad_mode'].default
+        _pad_mode = 'constant' if mode == 'constant' else 'reflect'
+    return _pad_mode
+
 def _build_mel_basis():
     assert hp.fmax <= hp.sample_rate // 2
     return librosa.filters.mel(sr=hp.sample_rate, n_fft=hp.n_fft, n_mels=hp.num_mels,
@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import torch
+from torch import nn
+
+from models import Wav2Lip
+
+BACKENDS = ('eager', 'torchscript', 'onnx')
+
+
+def load_wav2lip(checkpoint_path, device):
+    """The Wav2Lip generator of a training checkpoint, in eval mode on ``device``."""
+    model = Wav2Lip()
+    print("Load checkpoint from: {}".format(checkpoint_path))
+    if device == 'cuda':
+        checkpoint = torch.load(checkpoint_path)
+    else:
+        checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+    s = checkpoint["state_dict"]
+    new_s = {}
+    for k, v in s.items():
+        new_s[k.replace('module.', '')] = v
+    model.load_state_dict(new_s)
+
+    model = model.to(device)
+    return model.eval().fuse_for_inference()
+
+
+class EagerBackend(object):
+    """Runs the PyTorch module as is.
+
+    Every backend is called with the (mel, img) batch of BatchBuffers.tensors()
+    and returns the generated faces (N, 3, H, W) in [0, 1] as a torch tensor,
+    which is only valid until the next call.
+    """
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+
+    def __call__(self, mel_batch, img_batch):
+        mel_batch = mel_batch.to(self.device, non_blocking=True)
+        img_batch = img_batch.to(self.device, non_blocking=True)
+        with torch.no_grad():
+            return self.model(mel_batch, img_batch)
+
+
+class TorchScriptBackend(EagerBackend):
+    """Runs the module traced and frozen by TorchScript, with weights folded into the graph."""
+
+    def __init__(self, model, device, img_size=96, mel_shape=(80, 16)):
+        mel = torch.zeros((1, 1) + tuple(mel_shape), device=device)
+        img = torch.zeros((1, 6, img_size, img_size), device=device).contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            traced = torch.jit.trace(model.eval(), (mel, img))
+        super().__init__(torch.jit.freeze(traced), device)
+
+
+class ChannelsLastWav2Lip(nn.Module):
+    """Wav2Lip taking faces as N x H x W x 6, the memory order BatchBuffers fills,
+    so the exported graph reads the batch buffers in place."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, mel, face):
+        return self.model(mel, face.permute(0, 3, 1, 2))
+
+
+def export_onnx(model, path, img_size=96, mel_shape=(80, 16), opset=17):
+    """Export the generator to ONNX with a dynamic batch size.
+
+    Inputs are ``mel`` (N, 1, 80, 16) and ``face`` (N, H, W, 6); the output
+    ``pred`` is (N, 3, H, W).
+    """
+    wrapper = ChannelsLastWav2Lip(model).cpu().eval()
+    mel = torch.zeros((2, 1) + tuple(mel_shape))
+    face = torch.zeros((2, img_size, img_size, 6))
+    batch = {0: 'batch'}
+    with torch.no_grad():
+        torch.onnx.export(wrapper, (mel, face), path, dynamo=False, opset_version=opset,
+                          input_names=['mel', 'face'], output_names=['pred'],
+                          dynamic_axes={'mel': batch, 'face': batch, 'pred': batch})
+    return path
+
+
+class OnnxBackend(object):
+    """Runs an exported generator (see export_onnx) with ONNX Runtime on the CPU.
+
+    The session applies all of ORT's graph optimisations and runs on
+    ``threads`` intra-op threads (0 lets ORT use every core). Inputs and
+    output are bound to host memory with IO binding, so the batch buffers are
+    read in place and the result is written straight into a numpy array.
+    """
+
+    def __init__(self, path, threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.output_channels = self.session.get_outputs()[0].shape[1]
+
+    def __call__(self, mel_batch, img_batch):
+        # Channels-last batches permute back to a contiguous view of the buffer
+        face = np.ascontiguousarray(img_batch.detach().cpu().permute(0, 2, 3, 1).numpy(), dtype=np.float32)
+        mel = np.ascontiguousarray(mel_batch.detach().cpu().numpy(), dtype=np.float32)
+        pred = np.empty((len(face), self.output_channels) + face.shape[1:3], dtype=np.float32)
+
+        binding = self.session.io_binding()
+        binding.bind_input('mel', 'cpu', 0, np.float32, mel.shape, mel.ctypes.data)
+        binding.bind_input('face', 'cpu', 0, np.float32, face.shape, face.ctypes.data)
+        binding.bind_output('pred', 'cpu', 0, np.float32, pred.shape, pred.ctypes.data)
+        self.session.run_with_iobinding(binding)
+        return torch.from_numpy(pred)
+
+
+def onnx_path_for(checkpoint_path):
+    """Where the ONNX export of a checkpoint is kept by default: next to it, as .onnx."""
+    return os.path.splitext(checkpoint_path)[0] + '.onnx'
+
+
+def load_backend(name, checkpoint_path, device, onnx_path=None, threads=0, img_size=96, mel_shape=(80, 16)):
+    """The named backend for a checkpoint.
+
+    ``onnx`` runs ``onnx_path`` (by default the checkpoint's path with an
+    .onnx suffix), exporting the checkpoint there first if it does not exist.
+    """
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend {}; expected one of {}'.format(name, ', '.join(BACKENDS)))
+
+    if name == 'onnx':
+        onnx_path = onnx_path or onnx_path_for(checkpoint_path)
+        if not os.path.exists(onnx_path):
+            print('Exporting {} to {}'.format(checkpoint_path, onnx_path))
+            export_onnx(load_wav2lip(checkpoint_path, 'cpu'), onnx_path, img_size, mel_shape)
+        return OnnxBackend(onnx_path, threads)
+
+    model = load_wav2lip(checkpoint_path, device)
+    if name == 'torchscript':
+        return TorchScriptBackend(model, device, img_size, mel_shape)
+    return EagerBackend(model, device)
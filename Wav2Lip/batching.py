@@ -0,0 +1,104 @@
+import queue
+
+import numpy as np
+import cv2
+import torch
+
+
+class BatchBuffers(object):
+    """Preallocated input arrays for one Wav2Lip batch, reused from batch to batch.
+
+    Face crops are resized straight into a uint8 slot, and the model inputs
+    are float32 tensors (pinned when ``pin_memory`` is set, for
+    asynchronous host-to-device copies) filled through numpy views of the
+    same memory, so no per-batch arrays are allocated and nothing is copied
+    on the way to torch.
+    """
+
+    def __init__(self, batch_size, img_size, mel_shape, pin_memory=False, pool=None):
+        self.faces = np.zeros((batch_size, img_size, img_size, 3), dtype=np.uint8)
+        # NCHW tensors stored channels-last, so the faces are written in their
+        # own HWC order and convolutions take the channels-last kernels
+        self.img = torch.zeros((batch_size, img_size, img_size, 6), dtype=torch.float32,
+                               pin_memory=pin_memory).permute(0, 3, 1, 2)
+        self.mel = torch.zeros((batch_size,) + tuple(mel_shape) + (1,), dtype=torch.float32,
+                               pin_memory=pin_memory).permute(0, 3, 1, 2)
+        self.size = 0
+        self._img = self.img.numpy()
+        self._mel = self.mel.numpy()
+        self._pool = pool
+
+    def add(self, face, mel):
+        """Resize ``face`` into the next slot; returns True once the batch is full."""
+        size = self.faces.shape[1]
+        cv2.resize(face, (size, size), dst=self.faces[self.size])
+        self._mel[self.size, 0] = mel
+        self.size += 1
+        return self.size == len(self.faces)
+
+    def tensors(self):
+        """Model inputs (img, mel) for the filled slots, sharing memory with the buffers.
+
+        Channels 3-5 of img are the faces scaled to [0, 1]; channels 0-2 are
+        the same faces with the lower half left at zero, which is never
+        written.
+        """
+        n, half = self.size, self.faces.shape[1] // 2
+        faces = self.faces[:n].transpose(0, 3, 1, 2)
+        scale = np.float32(255)
+        np.divide(faces, scale, out=self._img[:n, 3:])
+        # Written from the faces rather than copied across channels, which
+        # numpy would route through a temporary as both views share a buffer
+        np.divide(faces[:, :, :half], scale, out=self._img[:n, :3, :half])
+        return self.img[:n], self.mel[:n]
+
+    def release(self):
+        """Hand the buffers back to their pool once the model has consumed them."""
+        self.size = 0
+        if self._pool is not None:
+            self._pool.put(self)
+
+
+class BatchPool(object):
+    """A fixed set of BatchBuffers, so a batch is never overwritten while still queued.
+
+    ``acquire`` blocks until a batch is released; size the pool to cover every
+    batch that can be in flight between the batching and inference stages.
+    """
+
+    def __init__(self, count, batch_size, img_size, mel_shape, pin_memory=False):
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(BatchBuffers(batch_size, img_size, mel_shape, pin_memory, pool=self._free))
+
+    def acquire(self):
+        return self._free.get()
+
+
+def quantise(pred):
+    """Model output (N, 3, H, W) in [0, 1] to uint8 N x H x W x 3 on the host.
+
+    Scaled and truncated on the model's device, as ``astype(np.uint8)`` would,
+    so only a quarter of the bytes cross back to the host.
+    """
+    return (pred * 255.).to(torch.uint8).permute(0, 2, 3, 1).contiguous().cpu().numpy()
+
+
+def paste_faces(faces, frames, coords):
+    """Resize each face straight into its (y1, y2, x1, x2) box of the matching frame.
+
+    Frames whose coords are None are left untouched and consume no face.
+    """
+    k = 0
+    for frame, c in zip(frames, coords):
+        if c is None:
+            continue
+        y1, y2, x1, x2 = c
+        roi = frame[y1:y2, x1:x2]
+        if roi.shape[:2] == (y2 - y1, x2 - x1):
+            cv2.resize(faces[k], (x2 - x1, y2 - y1), dst=roi)
+        else:
+            # Box runs off the frame: let the assignment raise as usual
+            roi[:] = cv2.resize(faces[k], (x2 - x1, y2 - y1))
+        k += 1
+    return frames
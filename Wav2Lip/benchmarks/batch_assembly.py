@@ -0,0 +1,106 @@
+"""Compare Wav2Lip batch assembly and paste-back before and after the
+preallocated buffers of batching.py: time and host memory allocated per batch.
+
+	python benchmarks/batch_assembly.py --batch_size 32 --frame_size 1280 720
+"""
+from os import path
+import sys, argparse, time, tracemalloc
+import numpy as np
+import cv2
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from batching import BatchBuffers, paste_faces, quantise
+
+parser = argparse.ArgumentParser(description='Benchmark Wav2Lip batch assembly and paste-back')
+parser.add_argument('--batch_size', type=int, default=32)
+parser.add_argument('--img_size', type=int, default=96)
+parser.add_argument('--frame_size', nargs=2, type=int, default=[1280, 720], help='Frame width and height')
+parser.add_argument('--face_size', type=int, default=220, help='Typical side of a face box in the frame')
+parser.add_argument('--batches', type=int, default=50)
+args = parser.parse_args()
+
+def make_batch(rng):
+	w, h = args.frame_size
+	frames, faces, coords = [], [], []
+	for _ in range(args.batch_size):
+		frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+		s = args.face_size + int(rng.integers(-20, 20))
+		y1, x1 = int(rng.integers(0, h - s)), int(rng.integers(0, w - s))
+		frames.append(frame)
+		faces.append(frame[y1:y1 + s, x1:x1 + s])
+		coords.append((y1, y1 + s, x1, x1 + s))
+	mels = [rng.normal(size=(80, 16)) for _ in range(args.batch_size)]
+	pred = torch.rand(args.batch_size, 3, args.img_size, args.img_size)
+	return faces, mels, frames, coords, pred
+
+def baseline_inputs(faces, mels):
+	"""The list-based assembly datagen and predict used before."""
+	img_batch = np.asarray([cv2.resize(f, (args.img_size, args.img_size)) for f in faces])
+	mel_batch = np.asarray(mels)
+	img_masked = img_batch.copy()
+	img_masked[:, args.img_size//2:] = 0
+	img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
+	mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+	return torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))), torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2)))
+
+def baseline_paste(pred, frames, coords):
+	pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+	for p, f, c in zip(pred, frames, coords):
+		y1, y2, x1, x2 = c
+		f[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+
+def buffered_inputs(buffers, faces, mels):
+	buffers.size = 0
+	for face, mel in zip(faces, mels):
+		buffers.add(face, mel)
+	return buffers.tensors()
+
+def buffered_paste(pred, frames, coords):
+	paste_faces(quantise(pred), frames, coords)
+
+def measure(fn, batches, owned=()):
+	"""Mean milliseconds and mean peak host allocation (MB) per call.
+
+	numpy allocations are traced by tracemalloc; torch's are not, so the
+	storage of returned tensors is added unless it is one of the `owned`
+	preallocated buffers.
+	"""
+	times, peaks = [], []
+	for batch in batches:
+		tracemalloc.start()
+		start = time.perf_counter()
+		out = fn(*batch)
+		times.append(time.perf_counter() - start)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		for t in out or ():
+			if t.untyped_storage().data_ptr() not in owned:
+				peak += t.untyped_storage().nbytes()
+		peaks.append(peak)
+	return 1e3 * np.mean(times[1:]), np.mean(peaks[1:]) / 2**20
+
+def main():
+	rng = np.random.default_rng(0)
+	batches = [make_batch(rng) for _ in range(min(args.batches, 8))]
+	batches = [batches[i % len(batches)] for i in range(args.batches)]
+	buffers = BatchBuffers(args.batch_size, args.img_size, (80, 16))
+	owned = {buffers.img.untyped_storage().data_ptr(), buffers.mel.untyped_storage().data_ptr()}
+
+	reference = baseline_inputs(*batches[0][:2])
+	assert all(torch.equal(a, b) for a, b in zip(reference, buffered_inputs(buffers, *batches[0][:2])))
+
+	print('batch of {} faces, {}x{} frames'.format(args.batch_size, *args.frame_size))
+	print('{:>22} {:>12} {:>14}'.format('', 'ms/batch', 'alloc MB/batch'))
+	rows = [
+		('assemble (lists)', baseline_inputs, [b[:2] for b in batches]),
+		('assemble (buffers)', lambda f, m: buffered_inputs(buffers, f, m), [b[:2] for b in batches]),
+		('paste (per frame)', baseline_paste, [(b[4], b[2], b[3]) for b in batches]),
+		('paste (batched)', buffered_paste, [(b[4], b[2], b[3]) for b in batches]),
+	]
+	for name, fn, inputs in rows:
+		ms, mb = measure(fn, inputs, owned)
+		print('{:>22} {:>12.2f} {:>14.2f}'.format(name, ms, mb))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,71 @@
+"""Compare Wav2Lip and SyncNet_color with their BatchNorms folded into the
+convolutions (fuse_for_inference, applied by load_wav2lip) against the
+unfused eval-mode models: time per batch and largest output deviation.
+
+	python benchmarks/conv_bn_fusion.py --checkpoint_path checkpoints/wav2lip_gan.pth --batch_size 32
+
+BatchNorm running statistics are randomised when no checkpoint is given,
+so that folding them is not a no-op.
+"""
+from os import path
+import sys, argparse, copy, time
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from models import SyncNet_color, Wav2Lip
+
+parser = argparse.ArgumentParser(description='Benchmark Conv-BatchNorm fusion')
+parser.add_argument('--checkpoint_path', type=str, default=None, help='Wav2Lip checkpoint to load; random weights if omitted')
+parser.add_argument('--batch_size', type=int, default=32)
+parser.add_argument('--repeats', type=int, default=5)
+parser.add_argument('--device', type=str, default='cpu')
+args = parser.parse_args()
+
+def randomise_batchnorm(model):
+	for module in model.modules():
+		if isinstance(module, torch.nn.BatchNorm2d):
+			module.running_mean.uniform_(-0.5, 0.5)
+			module.running_var.uniform_(0.5, 2.)
+	return model
+
+def measure(model, inputs):
+	"""Best seconds per batch after a warm-up batch, and the output."""
+	with torch.no_grad():
+		model(*inputs)
+		best = float('inf')
+		for _ in range(args.repeats):
+			start = time.perf_counter()
+			output = model(*inputs)
+			if args.device.startswith('cuda'):
+				torch.cuda.synchronize()
+			best = min(best, time.perf_counter() - start)
+	return best, output
+
+def main():
+	torch.manual_seed(0)
+	wav2lip = Wav2Lip()
+	if args.checkpoint_path:
+		checkpoint = torch.load(args.checkpoint_path, map_location=lambda storage, loc: storage)
+		wav2lip.load_state_dict({k.replace('module.', ''): v for k, v in checkpoint['state_dict'].items()})
+	else:
+		randomise_batchnorm(wav2lip)
+	b = args.batch_size
+	models = [
+		('wav2lip', wav2lip, (torch.randn(b, 1, 80, 16), torch.rand(b, 6, 96, 96))),
+		('syncnet', randomise_batchnorm(SyncNet_color()), (torch.randn(b, 1, 80, 16), torch.rand(b, 15, 48, 96))),
+	]
+	print('batch of {}, {} threads'.format(b, torch.get_num_threads()))
+	print('{:>8} {:>14} {:>14} {:>10} {:>14}'.format('', 'bn ms/batch', 'fused ms/batch', 'speedup', 'max abs diff'))
+	for name, model, inputs in models:
+		model = model.to(args.device).eval()
+		inputs = [x.to(args.device) for x in inputs]
+		fused = copy.deepcopy(model).fuse_for_inference()
+		bn_s, expected = measure(model, inputs)
+		fused_s, got = measure(fused, inputs)
+		if not isinstance(expected, tuple):
+			expected, got = [expected], [got]
+		diff = max((e - g).abs().max().item() for e, g in zip(expected, got))
+		print('{:>8} {:>14.1f} {:>14.1f} {:>9.2f}x {:>14.3g}'.format(name, 1e3 * bn_s, 1e3 * fused_s, bn_s / fused_s, diff))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,75 @@
+"""Compare the face detectors of face_detection (S3FD, OpenCV Haar/LBP
+cascades, the small ONNX model): time per frame against recall, taking the
+first detector's boxes as the reference.
+
+	python benchmarks/face_detectors.py --video ../class3.mp4 --detectors sfd haar lbp onnx
+
+A frame counts as recalled when the detector's face overlaps the
+reference face with at least --iou. Detectors that cannot be loaded (a
+missing model file or OpenCV build) are reported and skipped.
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import cv2
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+import face_detection
+from engine import FACE_DETECTORS
+from face_tracking import box_iou
+
+parser = argparse.ArgumentParser(description='Benchmark face detectors: speed against recall')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--detectors', nargs='+', default=['sfd', 'haar', 'lbp', 'onnx'], choices=list(FACE_DETECTORS))
+parser.add_argument('--max_frames', type=int, default=100)
+parser.add_argument('--stride', type=int, default=5, help='Use every Nth frame of the video')
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--iou', type=float, default=0.5, help='Overlap with the reference face that counts as recalled')
+parser.add_argument('--device', type=str, default='cpu')
+args = parser.parse_args()
+
+def read_frames():
+	stream = cv2.VideoCapture(args.video)
+	frames, index = [], 0
+	while len(frames) < args.max_frames:
+		ok, frame = stream.read()
+		if not ok:
+			break
+		if index % args.stride == 0:
+			frames.append(frame)
+		index += 1
+	stream.release()
+	return frames
+
+def run(name, frames):
+	module, options = FACE_DETECTORS[name]
+	detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False,
+											device=args.device if module == 'sfd' else 'cpu',
+											face_detector=module, detector_options=options)
+	detector.get_detections_for_batch(np.array(frames[:1]))
+	boxes, start = [], time.perf_counter()
+	for i in range(0, len(frames), args.batch_size):
+		boxes.extend(detector.get_detections_for_batch(np.array(frames[i:i + args.batch_size])))
+	return (time.perf_counter() - start) / len(frames), boxes
+
+def main():
+	frames = read_frames()
+	print('{} frames of {}x{} from {}'.format(len(frames), frames[0].shape[1], frames[0].shape[0], args.video))
+	print('{:>6} {:>12} {:>10} {:>10} {:>10}'.format('', 'ms/frame', 'found', 'recall', 'mean IoU'))
+
+	reference = None
+	for name in args.detectors:
+		try:
+			seconds, boxes = run(name, frames)
+		except (ImportError, OSError, ValueError) as e:
+			print('{:>6} skipped: {}'.format(name, e))
+			continue
+		if reference is None:
+			reference = boxes
+		found = np.mean([b is not None for b in boxes])
+		ious = [box_iou(np.array(r), np.array(b)) if b is not None else 0. for r, b in zip(reference, boxes) if r is not None]
+		recall = np.mean(np.array(ious) >= args.iou) if ious else float('nan')
+		print('{:>6} {:>12.1f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name, 1e3 * seconds, found, recall, np.mean(ious) if ious else float('nan')))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,110 @@
+"""Compare the training datasets' face windows read from packed crops
+(dataset_store.load_faces, faces.npy memory-mapped) with globbing the
+per-frame JPEGs, decoding and resizing them, in samples per second.
+
+	python benchmarks/face_store.py --videos 50 --frames 150 --samples 2000
+
+A preprocessed dataset of --videos videos of --frames face crops (regions of
+the sample video's frames, 150 to 250 pixels square, every 20th frame
+without a face) is written to a temporary directory as JPEGs, then packed.
+Each sample does the image work of wav2lip_train.py's Dataset: pick a
+frame and a wrong one and read the five-frame window of each. The memcpy
+row copies the same ten crops out of an in-memory array.
+"""
+from os import path
+import os, sys, argparse, random, tempfile, time
+import numpy as np
+import cv2
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from dataset_store import load_faces, pack_faces
+from hparams import hparams
+
+parser = argparse.ArgumentParser(description='Benchmark packed face crops for training')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--videos', type=int, default=50)
+parser.add_argument('--frames', type=int, default=150)
+parser.add_argument('--samples', type=int, default=2000)
+args = parser.parse_args()
+
+syncnet_T = 5
+
+def jpeg_window(vidname, start_id):
+	window = []
+	for frame_id in range(start_id, start_id + syncnet_T):
+		fname = path.join(vidname, '{}.jpg'.format(frame_id))
+		if not path.isfile(fname):
+			return None
+		img = cv2.imread(fname)
+		window.append(cv2.resize(img, (hparams.img_size, hparams.img_size)))
+	return window
+
+def jpeg_sample(vidname):
+	"""The windows of a frame and a wrong frame as the Dataset read them from JPEGs, or None."""
+	img_names = os.listdir(vidname)  # glob(join(vidname, '*.jpg')) in the Dataset
+	img_name, wrong_img_name = random.sample(img_names, 2)
+	window = jpeg_window(vidname, int(img_name.split('.')[0]))
+	wrong_window = jpeg_window(vidname, int(wrong_img_name.split('.')[0]))
+	return None if window is None or wrong_window is None else (np.asarray(window), np.asarray(wrong_window))
+
+def packed_sample(vidname):
+	crops = load_faces(vidname, hparams.img_size)
+	row, wrong_row = random.sample(range(len(crops)), 2)
+	window, wrong_window = crops.window(row, syncnet_T), crops.window(wrong_row, syncnet_T)
+	return None if window is None or wrong_window is None else (np.array(window), np.array(wrong_window))
+
+def memcpy_sample(faces):
+	row, wrong_row = random.sample(range(len(faces) - syncnet_T), 2)
+	return np.array(faces[row:row + syncnet_T]), np.array(faces[wrong_row:wrong_row + syncnet_T])
+
+def samples_per_second(read):
+	random.seed(0)
+	done, start = 0, time.perf_counter()
+	while done < args.samples:
+		if read() is not None:
+			done += 1
+	return args.samples / (time.perf_counter() - start)
+
+def main():
+	stream = cv2.VideoCapture(args.video)
+	frames = [stream.read()[1] for _ in range(args.frames)]
+	stream.release()
+	rng = np.random.default_rng(0)
+	with tempfile.TemporaryDirectory() as tmp:
+		dirs = []
+		for v in range(args.videos):
+			dirs.append(path.join(tmp, 'main', str(v)))
+			os.makedirs(dirs[-1])
+			size = int(rng.integers(150, 250))
+			x, y = int(rng.integers(0, frames[0].shape[1] - size)), int(rng.integers(0, frames[0].shape[0] - size))
+			for i, frame in enumerate(frames):
+				if i % 20 != 19:
+					cv2.imwrite(path.join(dirs[-1], '{}.jpg'.format(i)), frame[y:y + size, x:x + size])
+		jpeg_mb = sum(path.getsize(path.join(d, f)) for d in dirs for f in os.listdir(d)) / 2 ** 20
+
+		start = time.perf_counter()
+		for d in dirs:
+			pack_faces(d, hparams.img_size)
+		pack_s = time.perf_counter() - start
+		packed_mb = sum(path.getsize(path.join(d, 'faces.npy')) for d in dirs) / 2 ** 20
+		for d in dirs:  # the JPEG loader lists every file
+			for f in os.listdir(d):
+				if not f.endswith('.jpg'):
+					os.rename(path.join(d, f), path.join(tmp, '{}_{}'.format(path.basename(d), f)))
+
+		jpeg_rate = samples_per_second(lambda: jpeg_sample(random.choice(dirs)))
+		for d in dirs:
+			for f in ['faces.npy', 'frame_ids.npy']:
+				os.rename(path.join(tmp, '{}_{}'.format(path.basename(d), f)), path.join(d, f))
+		packed_rate = samples_per_second(lambda: packed_sample(random.choice(dirs)))
+		faces = np.array(load_faces(dirs[0], hparams.img_size).faces)
+		memcpy_rate = samples_per_second(lambda: memcpy_sample(faces))
+
+		print('{} videos of {} frames, {} samples of two {}-frame windows'.format(args.videos, args.frames, args.samples, syncnet_T))
+		print('{:>8} {:>14} {:>10} {:>12}'.format('', 'samples/s', 'speedup', 'size MB'))
+		print('{:>8} {:>14.1f} {:>10} {:>12.1f}'.format('jpeg', jpeg_rate, '-', jpeg_mb))
+		print('{:>8} {:>14.1f} {:>9.1f}x {:>12.1f}   (packed in {:.1f} s)'.format('packed', packed_rate, packed_rate / jpeg_rate, packed_mb, pack_s))
+		print('{:>8} {:>14.1f} {:>9.1f}x {:>12}'.format('memcpy', memcpy_rate, memcpy_rate / jpeg_rate, '-'))
+
+if __name__ == '__main__':
+	main()
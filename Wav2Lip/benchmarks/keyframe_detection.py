@@ -0,0 +1,71 @@
+"""Compare keyframe face detection (face_tracking.keyframe_stream) against
+running S3FD on every frame: wall-clock time, detector calls and box accuracy.
+
+	python benchmarks/keyframe_detection.py --video ../class3.mp4 --every 2 5 10
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import cv2
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+import face_detection
+from face_tracking import box_iou, keyframe_stream
+
+parser = argparse.ArgumentParser(description='Benchmark keyframe face detection against full detection')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--every', nargs='+', type=int, default=[2, 5, 10], help='Keyframe intervals to try')
+parser.add_argument('--batch_size', type=int, default=4, help='Face detection batch size')
+parser.add_argument('--max_frames', type=int, default=300)
+parser.add_argument('--motion', type=float, default=10.)
+parser.add_argument('--iou', type=float, default=0.7)
+parser.add_argument('--device', type=str, default='cuda' if __import__('torch').cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+def read_frames(video, limit):
+	stream = cv2.VideoCapture(video)
+	frames = []
+	while len(frames) < limit:
+		ok, frame = stream.read()
+		if not ok:
+			break
+		frames.append(frame)
+	stream.release()
+	return frames
+
+def main():
+	frames = read_frames(args.video, args.max_frames)
+	print('{} frames of {}x{} from {}'.format(len(frames), frames[0].shape[1], frames[0].shape[0], args.video))
+
+	detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False, device=args.device)
+	calls = [0]
+	def detect(images):
+		calls[0] += len(images)
+		boxes = []
+		for i in range(0, len(images), args.batch_size):
+			boxes.extend(detector.get_detections_for_batch(np.asarray(images[i:i + args.batch_size])))
+		return boxes
+
+	start = time.perf_counter()
+	reference = detect(frames)
+	full_time = time.perf_counter() - start
+	print('{:>8} {:>9} {:>8} {:>8} {:>9} {:>10} {:>10}'.format(
+		'every', 'time(s)', 'speedup', 'calls', 'mean IoU', 'IoU>=0.5', 'presence'))
+	print('{:>8} {:>9.2f} {:>8.2f} {:>8} {:>9.3f} {:>10.1%} {:>10.1%}'.format('full', full_time, 1., len(frames), 1., 1., 1.))
+
+	for every in args.every:
+		calls[0] = 0
+		start = time.perf_counter()
+		boxes = [box for _, box in keyframe_stream(iter(frames), detect, every, window=every * args.batch_size,
+													motion_threshold=args.motion, iou_threshold=args.iou)]
+		elapsed = time.perf_counter() - start
+
+		both = [(a, b) for a, b in zip(boxes, reference) if a is not None and b is not None]
+		ious = box_iou(np.array([a for a, _ in both]), np.array([b for _, b in both])) if both else np.zeros(0)
+		presence = np.mean([(a is None) == (b is None) for a, b in zip(boxes, reference)])
+		print('{:>8} {:>9.2f} {:>8.2f} {:>8} {:>9.3f} {:>10.1%} {:>10.1%}'.format(
+			every, elapsed, full_time / elapsed, calls[0], ious.mean() if len(ious) else float('nan'),
+			(ious >= 0.5).mean() if len(ious) else float('nan'), presence))
+
+if __name__ == '__main__':
+	main()
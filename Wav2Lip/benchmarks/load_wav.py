@@ -0,0 +1,62 @@
+"""Compare audio.load_wav (soundfile, polyphase resampling only when the
+rate differs, ffmpeg only for non-WAV containers) with librosa.core.load on
+an hour of audio: load time, and the largest and mean mel difference.
+
+	python benchmarks/load_wav.py --minutes 60 --rates 16000 44100
+
+The hour is the sample video's soundtrack repeated, written as 16-bit mono
+WAV at each rate into a temporary directory, and as an AAC .m4a when
+--m4a is given. Mel parity is measured on the first --parity_seconds.
+"""
+from os import path
+import sys, argparse, tempfile, time, subprocess
+import numpy as np
+import soundfile
+from scipy import signal
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+import audio
+
+parser = argparse.ArgumentParser(description='Benchmark WAV loading and resampling')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--minutes', type=float, default=60.)
+parser.add_argument('--rates', nargs='+', type=int, default=[16000, 44100])
+parser.add_argument('--m4a', action='store_true', help='Also time an AAC .m4a at the last rate')
+parser.add_argument('--parity_seconds', type=float, default=60.)
+args = parser.parse_args()
+
+def timed(fn, *fn_args):
+	start = time.perf_counter()
+	result = fn(*fn_args)
+	return time.perf_counter() - start, result
+
+def main():
+	soundtrack = audio.load_wav(args.video, 44100)
+	with tempfile.TemporaryDirectory() as tmp:
+		files = []
+		for rate in args.rates:
+			track = soundtrack if rate == 44100 else signal.resample_poly(soundtrack, rate, 44100)
+			samples = int(args.minutes * 60 * rate)
+			wav = np.tile(track, samples // len(track) + 1)[:samples]
+			files.append(path.join(tmp, 'hour_{}.wav'.format(rate)))
+			soundfile.write(files[-1], wav, rate, subtype='PCM_16')
+			del wav
+		if args.m4a:
+			files.append(files[-1][:-4] + '.m4a')
+			subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-i', files[-2], '-c:a', 'aac', files[-1]])
+
+		parity = int(args.parity_seconds * 16000)
+		print('{:.0f} minutes of audio, loaded at 16 kHz'.format(args.minutes))
+		print('{:>16} {:>14} {:>14} {:>10} {:>14} {:>14}'.format(
+			'', 'librosa s', 'load_wav s', 'speedup', 'max mel diff', 'mean mel diff'))
+		for name in files:
+			new_s, new = timed(audio.load_wav, name, 16000)
+			new = new[:parity]
+			old_s, old = timed(audio.librosa_load_wav, name, 16000)
+			old = old[:parity]
+			diff = np.abs(audio.melspectrogram(new) - audio.melspectrogram(old))
+			print('{:>16} {:>14.2f} {:>14.2f} {:>9.1f}x {:>14.4f} {:>14.5f}'.format(
+				path.basename(name), old_s, new_s, old_s / new_s, diff.max(), diff.mean()))
+
+if __name__ == '__main__':
+	main()
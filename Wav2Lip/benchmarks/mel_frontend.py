@@ -0,0 +1,59 @@
+"""Compare the torch.stft mel frontend (audio.melspectrograms) with the
+librosa one (audio.librosa_melspectrogram): time for a whole file, time for
+a batch of training-sized clips, and the largest deviation between them.
+
+	python benchmarks/mel_frontend.py --audio audio.wav --clips 64 --threads 1 4
+
+The clips are cut from the file, 0.2 s apart, as the training datasets crop
+them; without --audio a minute of noise stands in for speech.
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+import audio
+
+parser = argparse.ArgumentParser(description='Benchmark the mel-spectrogram frontends')
+parser.add_argument('--audio', type=str, default=None, help='Audio file to load at 16 kHz')
+parser.add_argument('--clips', type=int, default=64, help='Clips in the batch')
+parser.add_argument('--clip_seconds', type=float, default=1.)
+parser.add_argument('--threads', nargs='+', type=int, default=[torch.get_num_threads()])
+parser.add_argument('--repeats', type=int, default=3)
+args = parser.parse_args()
+
+def best_of(fn):
+	fn()
+	best = float('inf')
+	for _ in range(args.repeats):
+		start = time.perf_counter()
+		fn()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+def main():
+	if args.audio:
+		wav = audio.load_wav(args.audio, 16000)
+	else:
+		wav = (0.1 * np.random.default_rng(0).normal(size=16000 * 60)).astype(np.float32)
+	clip = int(args.clip_seconds * 16000)
+	clips = [wav[i:i + clip] for i in range(0, len(wav) - clip, 3200)][:args.clips]
+
+	diff = max(np.abs(audio.melspectrograms([w])[0] - audio.librosa_melspectrogram(w)).max() for w in [wav] + clips[:8])
+	print('{:.1f} s of audio, {} clips of {:.2f} s, max abs diff {:.3g}'.format(
+		len(wav) / 16000, len(clips), args.clip_seconds, diff))
+	print('{:>8} {:>16} {:>16} {:>10} {:>16} {:>16} {:>10}'.format(
+		'threads', 'librosa file ms', 'torch file ms', 'speedup', 'librosa clips ms', 'torch clips ms', 'speedup'))
+	for threads in args.threads:
+		torch.set_num_threads(threads)
+		lib_file = best_of(lambda: audio.librosa_melspectrogram(wav))
+		torch_file = best_of(lambda: audio.melspectrograms([wav]))
+		lib_clips = best_of(lambda: [audio.librosa_melspectrogram(w) for w in clips])
+		torch_clips = best_of(lambda: audio.melspectrograms(clips))
+		print('{:>8} {:>16.1f} {:>16.1f} {:>9.2f}x {:>16.1f} {:>16.1f} {:>9.2f}x'.format(
+			threads, 1e3 * lib_file, 1e3 * torch_file, lib_file / torch_file,
+			1e3 * lib_clips, 1e3 * torch_clips, lib_clips / torch_clips))
+
+if __name__ == '__main__':
+	main()
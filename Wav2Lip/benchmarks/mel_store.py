@@ -0,0 +1,76 @@
+"""Compare the training datasets' audio features read from the mel store
+(dataset_store.load_mel memory-mapping mel.npy) with decoding audio.wav and
+computing the mel spectrogram on every sample, in samples per second.
+
+	python benchmarks/mel_store.py --videos 200 --samples 2000
+
+A preprocessed dataset of --videos clips of 3 to 8 s (the sample video's
+soundtrack at 16 kHz) is written to a temporary directory. Each sample does
+the audio work of wav2lip_train.py's Dataset: load the utterance's mel,
+crop the 16-frame window at a random frame and the five windows around it.
+"""
+from os import path
+import os, sys, argparse, random, tempfile, time
+import numpy as np
+import soundfile
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+import audio
+from dataset_store import load_mel, save_mel
+from hparams import hparams
+
+parser = argparse.ArgumentParser(description='Benchmark the training mel store')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--videos', type=int, default=200)
+parser.add_argument('--samples', type=int, default=2000)
+args = parser.parse_args()
+
+syncnet_T, syncnet_mel_step_size = 5, 16
+
+def crop_audio_window(spec, start_frame_num):
+	start_idx = int(80. * (start_frame_num / float(hparams.fps)))
+	return np.array(spec[start_idx: start_idx + syncnet_mel_step_size, :], dtype=np.float32)
+
+def sample(video_dir, read_mel):
+	orig_mel = read_mel(video_dir)
+	frame = random.randrange(2, int(len(orig_mel) / 80. * hparams.fps) - syncnet_T - 2)
+	mel = crop_audio_window(orig_mel, frame)
+	indiv_mels = np.asarray([crop_audio_window(orig_mel, i - 1).T for i in range(frame, frame + syncnet_T)])
+	return mel, indiv_mels
+
+def from_audio(video_dir):
+	return audio.melspectrogram(audio.load_wav(path.join(video_dir, 'audio.wav'), hparams.sample_rate)).T
+
+def samples_per_second(dirs, read_mel):
+	random.seed(0)
+	start = time.perf_counter()
+	for _ in range(args.samples):
+		sample(random.choice(dirs), read_mel)
+	return args.samples / (time.perf_counter() - start)
+
+def main():
+	soundtrack = audio.load_wav(args.video, 16000)
+	rng = np.random.default_rng(0)
+	with tempfile.TemporaryDirectory() as tmp:
+		dirs = []
+		for i in range(args.videos):
+			dirs.append(path.join(tmp, 'main', str(i)))
+			os.makedirs(dirs[-1])
+			length, offset = int(rng.uniform(3, 8) * 16000), int(rng.integers(0, len(soundtrack) - 8 * 16000))
+			soundfile.write(path.join(dirs[-1], 'audio.wav'), soundtrack[offset:offset + length], 16000, subtype='PCM_16')
+
+		print('{} utterances, {} samples'.format(args.videos, args.samples))
+		print('{:>16} {:>14} {:>10} {:>14} {:>14}'.format('', 'samples/s', 'speedup', 'store MB', 'store s'))
+		baseline = samples_per_second(dirs, from_audio)
+		print('{:>16} {:>14.1f} {:>10} {:>14} {:>14}'.format('audio.wav', baseline, '-', '-', '-'))
+		for dtype in ['float32', 'float16']:
+			start = time.perf_counter()
+			for d in dirs:
+				save_mel(d, dtype)
+			store_s = time.perf_counter() - start
+			size = sum(path.getsize(path.join(d, 'mel.npy')) for d in dirs) / 2 ** 20
+			rate = samples_per_second(dirs, load_mel)
+			print('{:>16} {:>14.1f} {:>9.1f}x {:>14.1f} {:>14.1f}'.format('mel.npy ' + dtype, rate, rate / baseline, size, store_s))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,63 @@
+"""Compare the Wav2Lip generator backends of backends.py: throughput and
+largest deviation from eager PyTorch on the same batches.
+
+	python benchmarks/model_backends.py --checkpoint_path checkpoints/wav2lip_gan.pth --batch_size 32
+"""
+from os import path
+import sys, argparse, tempfile, time
+import numpy as np
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from backends import EagerBackend, OnnxBackend, TorchScriptBackend, export_onnx, load_wav2lip
+from batching import BatchBuffers
+from models import Wav2Lip
+
+parser = argparse.ArgumentParser(description='Benchmark the Wav2Lip generator backends')
+parser.add_argument('--checkpoint_path', type=str, default=None, help='Checkpoint to load; randomly initialised weights if omitted')
+parser.add_argument('--batch_size', type=int, default=32)
+parser.add_argument('--batches', type=int, default=5)
+parser.add_argument('--ort_threads', type=int, default=0)
+parser.add_argument('--device', type=str, default='cpu')
+args = parser.parse_args()
+
+def make_batches(rng):
+	batches = []
+	for _ in range(args.batches):
+		buffers = BatchBuffers(args.batch_size, 96, (80, 16))
+		for _ in range(args.batch_size):
+			buffers.add(rng.integers(0, 256, (int(rng.integers(80, 200)), 120, 3), dtype=np.uint8), rng.normal(size=(80, 16)))
+		batches.append(buffers.tensors())
+	return batches
+
+def measure(backend, batches):
+	"""Mean seconds per batch after a warm-up batch, and the outputs."""
+	backend(batches[0][1], batches[0][0])
+	outputs, start = [], time.perf_counter()
+	for img, mel in batches:
+		outputs.append(backend(mel, img).cpu().clone())
+	return (time.perf_counter() - start) / len(batches), outputs
+
+def main():
+	torch.manual_seed(0)
+	model = load_wav2lip(args.checkpoint_path, args.device) if args.checkpoint_path else Wav2Lip().to(args.device).fuse_for_inference()
+	batches = make_batches(np.random.default_rng(0))
+
+	with tempfile.TemporaryDirectory() as tmp:
+		backends = [
+			('eager', EagerBackend(model, args.device)),
+			('torchscript', TorchScriptBackend(model, args.device)),
+			('onnx', OnnxBackend(export_onnx(model, path.join(tmp, 'wav2lip.onnx')), args.ort_threads)),
+		]
+		print('batch of {}, {} threads'.format(args.batch_size, torch.get_num_threads()))
+		print('{:>12} {:>12} {:>12} {:>14}'.format('', 'ms/batch', 'faces/s', 'max abs diff'))
+		reference = None
+		for name, backend in backends:
+			seconds, outputs = measure(backend, batches)
+			if reference is None:
+				reference = outputs
+			diff = max((a - b).abs().max().item() for a, b in zip(outputs, reference))
+			print('{:>12} {:>12.1f} {:>12.1f} {:>14.3g}'.format(name, 1e3 * seconds, args.batch_size / seconds, diff))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,67 @@
+"""Compare face detection on full-resolution frames against detection on
+a proxy downscaled from the face size (--detect_face_size), with the boxes
+scaled back to full resolution.
+
+	python benchmarks/proxy_detection.py --video ../class3.mp4 --heights 1080 2160 --face_detector sfd
+
+Frames are upscaled to each height to stand in for high-resolution footage.
+Detectors that run out of memory at full resolution are reported as such;
+the proxy boxes are then compared with nothing.
+"""
+from os import path
+from dataclasses import replace
+import sys, argparse, time
+import numpy as np
+import cv2
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from engine import FACE_DETECTORS, Wav2LipEngine, _Job
+from face_tracking import box_iou
+
+parser = argparse.ArgumentParser(description='Benchmark proxy-resolution face detection')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--heights', nargs='+', type=int, default=[1080, 2160], help='Frame heights to test (16:9)')
+parser.add_argument('--num_frames', type=int, default=4)
+parser.add_argument('--face_det_batch_size', type=int, default=1)
+parser.add_argument('--detect_face_size', type=int, default=100)
+parser.add_argument('--face_detector', type=str, default='sfd', choices=list(FACE_DETECTORS))
+parser.add_argument('--device', type=str, default='cpu')
+args = parser.parse_args()
+
+def timed_detect(engine, frames, **options):
+	job = _Job(engine, replace(engine.config, pads=(0, 0, 0, 0), **options), args.video, None, None)
+	with job._leases:
+		job.detector
+		start = time.perf_counter()
+		boxes = job.face_detect(frames)
+		return time.perf_counter() - start, boxes, job.detect_scale
+
+def main():
+	stream = cv2.VideoCapture(args.video)
+	frames = [stream.read()[1] for _ in range(args.num_frames)]
+	stream.release()
+
+	engine = Wav2LipEngine(device=args.device, face_detector=args.face_detector,
+						   face_det_batch_size=args.face_det_batch_size)
+	with engine.lease_detector():
+		pass  # loads the detector into the pool
+	print('{} frames from {}, {} detector'.format(len(frames), args.video, args.face_detector))
+	print('{:>8} {:>14} {:>14} {:>10} {:>10} {:>10}'.format('', 'full ms/frame', 'proxy ms/frame', 'scale', 'speedup', 'mean IoU'))
+	for height in args.heights:
+		size = (int(round(height * 16 / 9)), height)
+		scaled = [cv2.resize(f, size, interpolation=cv2.INTER_CUBIC) for f in frames]
+		proxy_s, proxy_boxes, scale = timed_detect(engine, scaled, detect_face_size=args.detect_face_size)
+		try:
+			full_s, full_boxes, _ = timed_detect(engine, scaled)
+		except (RuntimeError, MemoryError) as e:
+			print('{:>8} {:>14} {:>14.1f} {:>10.3f} {:>10} {:>10}'.format(
+				'%dp' % height, 'failed', 1e3 * proxy_s / len(frames), scale, '-', '-'))
+			print('         full resolution: {}'.format(str(e).splitlines()[0][:100]))
+			continue
+		ious = [box_iou(f, p) if f is not None and p is not None else float(f is None and p is None)
+				for f, p in zip(full_boxes, proxy_boxes)]
+		print('{:>8} {:>14.1f} {:>14.1f} {:>10.3f} {:>9.1f}x {:>10.3f}'.format(
+			'%dp' % height, 1e3 * full_s / len(frames), 1e3 * proxy_s / len(frames), scale, full_s / proxy_s, np.mean(ious)))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,73 @@
+"""Compare face detection on whole frames against detection restricted to
+a region around the last face found (--roi_detection), on the engine's
+face_detect.
+
+	python benchmarks/roi_detection.py --video ../class3.mp4 --height 1080 --face_detector sfd
+
+Frames are upscaled to --height to stand in for high-resolution footage.
+Reports time per frame, the detector's input pixels per frame, how many
+frames fell back to a full-frame scan and IoU against whole-frame boxes.
+"""
+from os import path
+from dataclasses import replace
+import sys, argparse, time
+import numpy as np
+import cv2
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from engine import FACE_DETECTORS, Wav2LipEngine, _Job
+from face_tracking import box_iou
+
+parser = argparse.ArgumentParser(description='Benchmark ROI-restricted face detection')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--height', type=int, default=1080, help='Frame height to test (16:9)')
+parser.add_argument('--num_frames', type=int, default=16)
+parser.add_argument('--face_det_batch_size', type=int, default=4)
+parser.add_argument('--roi_margin', type=float, default=0.5)
+parser.add_argument('--roi_min_score', type=float, default=0.8)
+parser.add_argument('--face_detector', type=str, default='sfd', choices=list(FACE_DETECTORS))
+parser.add_argument('--device', type=str, default='cpu')
+args = parser.parse_args()
+
+class CountingDetector(object):
+	"""Passes batches on to a detector, counting the pixels it is given."""
+	def __init__(self, detector):
+		self.detector = detector
+		self.pixels = 0
+
+	def get_detections_for_batch(self, images, scores=False):
+		self.pixels += images.shape[0] * images.shape[1] * images.shape[2]
+		return self.detector.get_detections_for_batch(images, scores=scores)
+
+def timed_detect(engine, frames, **options):
+	job = _Job(engine, replace(engine.config, pads=(0, 0, 0, 0), **options), args.video, None, None)
+	with job._leases:
+		detector = job._detector = CountingDetector(job.detector)
+		start = time.perf_counter()
+		boxes = job.face_detect(frames)
+		return time.perf_counter() - start, boxes, detector.pixels / len(frames), job
+
+def main():
+	stream = cv2.VideoCapture(args.video)
+	size = (int(round(args.height * 16 / 9)), args.height)
+	frames = [cv2.resize(stream.read()[1], size, interpolation=cv2.INTER_CUBIC) for _ in range(args.num_frames)]
+	stream.release()
+
+	engine = Wav2LipEngine(device=args.device, face_detector=args.face_detector,
+						   face_det_batch_size=args.face_det_batch_size)
+	with engine.lease_detector():
+		pass  # loads the detector into the pool
+	full_s, full_boxes, full_px, _ = timed_detect(engine, frames)
+	roi_s, roi_boxes, roi_px, job = timed_detect(engine, frames, roi_detection=True, roi_margin=args.roi_margin,
+												 roi_min_score=args.roi_min_score)
+	ious = [box_iou(f, r) if f is not None and r is not None else float(f is None and r is None)
+			for f, r in zip(full_boxes, roi_boxes)]
+
+	print('{} {}x{} frames from {}, {} detector'.format(len(frames), size[0], size[1], args.video, args.face_detector))
+	print('{:>6} {:>12} {:>14} {:>12}'.format('', 'ms/frame', 'Mpixels/frame', 'full scans'))
+	print('{:>6} {:>12.1f} {:>14.2f} {:>12}'.format('full', 1e3 * full_s / len(frames), full_px / 1e6, len(frames)))
+	print('{:>6} {:>12.1f} {:>14.2f} {:>12}'.format('roi', 1e3 * roi_s / len(frames), roi_px / 1e6, job.full_detections))
+	print('speedup {:.1f}x, {:.1f}x fewer input pixels, mean IoU {:.3f}'.format(full_s / roi_s, full_px / roi_px, np.mean(ious)))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,83 @@
+"""Compare S3FD anchor decoding before and after vectorising it
+(face_detection/detection/sfd/detect.py): time per batch and identical output.
+
+	python benchmarks/s3fd_decode.py --video ../class3.mp4 --batch_size 4
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import cv2
+import torch
+import torch.nn.functional as F
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from face_detection.detection.sfd.bbox import batch_decode
+from face_detection.detection.sfd.detect import decode_batch
+from face_detection.detection.sfd.net_s3fd import s3fd
+
+parser = argparse.ArgumentParser(description='Benchmark S3FD anchor decoding')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--heights', nargs='+', type=int, default=[480, 720, 1080], help='Frame heights to test (16:9)')
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+def loop_decode(olist):
+	"""The per-anchor loop batch_detect used before."""
+	BB = olist[0].size(0)
+	bboxlist = []
+	for i in range(len(olist) // 2):
+		ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+		stride = 2**(i + 2)
+		poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
+		for Iindex, hindex, windex in poss:
+			axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
+			score = ocls[:, 1, hindex, windex]
+			loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
+			priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
+			box = batch_decode(loc, priors, [0.1, 0.2])
+			box = box[:, 0] * 1.0
+			bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).cpu().numpy())
+	bboxlist = np.array(bboxlist)
+	if 0 == len(bboxlist):
+		bboxlist = np.zeros((1, BB, 5))
+	return bboxlist
+
+def head_outputs(net, frames):
+	imgs = torch.from_numpy((frames - np.array([104, 117, 123])).transpose(0, 3, 1, 2)).float().to(args.device)
+	with torch.no_grad():
+		olist = net(imgs)
+	for i in range(len(olist) // 2):
+		olist[i * 2] = F.softmax(olist[i * 2], dim=1)
+	return [o.cpu() for o in olist]
+
+def timed(fn, olist):
+	times = []
+	for _ in range(args.repeats):
+		start = time.perf_counter()
+		out = fn(olist)
+		times.append(time.perf_counter() - start)
+	return min(times), out
+
+def main():
+	stream = cv2.VideoCapture(args.video)
+	frames = [stream.read()[1] for _ in range(args.batch_size)]
+	stream.release()
+
+	net = s3fd()
+	net.load_state_dict(torch.load(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'face_detection/detection/sfd/s3fd.pth')))
+	net.to(args.device).eval()
+
+	print('batch of {} frames from {}'.format(args.batch_size, args.video))
+	print('{:>8} {:>12} {:>12} {:>12} {:>9}'.format('', 'candidates', 'loop ms', 'vector ms', 'speedup'))
+	for height in args.heights:
+		size = (int(round(height * 16 / 9)), height)
+		olist = head_outputs(net, np.array([cv2.resize(f, size) for f in frames]))
+		loop_s, expected = timed(loop_decode, olist)
+		vector_s, got = timed(decode_batch, olist)
+		assert got.dtype == expected.dtype and np.array_equal(got, expected)
+		print('{:>8} {:>12} {:>12.1f} {:>12.1f} {:>8.1f}x'.format('%dp' % height, len(got), 1e3 * loop_s, 1e3 * vector_s, loop_s / vector_s))
+
+if __name__ == '__main__':
+	main()
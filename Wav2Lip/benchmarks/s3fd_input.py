@@ -0,0 +1,66 @@
+"""Compare S3FD input preparation before and after the uint8 input path
+(s3fd.normalize): time and host memory allocated per batch of frames.
+
+	python benchmarks/s3fd_input.py --batch_sizes 4 8 16 32 --frame_size 1920 1080
+
+Only the preparation of the network input is measured; both paths produce
+the same float32 tensor.
+"""
+from os import path
+import sys, argparse, time, tracemalloc
+import numpy as np
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from face_detection.detection.sfd.net_s3fd import s3fd
+
+parser = argparse.ArgumentParser(description='Benchmark S3FD input preparation')
+parser.add_argument('--batch_sizes', nargs='+', type=int, default=[4, 8, 16, 32])
+parser.add_argument('--frame_size', nargs=2, type=int, default=[1920, 1080], help='Frame width and height')
+parser.add_argument('--repeats', type=int, default=3)
+args = parser.parse_args()
+
+def copy_input(net, frames):
+	"""What get_detections_for_batch and batch_detect did before: flip to RGB,
+	subtract the mean in float64, transpose and convert to float32."""
+	imgs = frames[..., ::-1].copy()
+	imgs = imgs - np.array([104, 117, 123])
+	imgs = imgs.transpose(0, 3, 1, 2)
+	return torch.from_numpy(imgs).float()
+
+def uint8_input(net, frames):
+	return net.normalize(torch.from_numpy(frames), bgr=True)
+
+def measure(fn, net, frames):
+	"""Best milliseconds and peak host allocation (MB) of a call.
+
+	numpy allocations are traced by tracemalloc; torch's are not, so the
+	storage of the returned tensor is added.
+	"""
+	times, peaks = [], []
+	for _ in range(args.repeats):
+		tracemalloc.start()
+		start = time.perf_counter()
+		out = fn(net, frames)
+		times.append(time.perf_counter() - start)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		peaks.append(peak + out.untyped_storage().nbytes())
+		del out
+	return 1e3 * min(times), max(peaks) / 2**20
+
+def main():
+	net = s3fd()
+	w, h = args.frame_size
+	rng = np.random.default_rng(0)
+	print('{}x{} BGR uint8 frames, {} threads'.format(w, h, torch.get_num_threads()))
+	print('{:>6} {:>14} {:>14} {:>14} {:>14}'.format('batch', 'copy ms', 'uint8 ms', 'copy MB', 'uint8 MB'))
+	for batch_size in args.batch_sizes:
+		frames = rng.integers(0, 256, (batch_size, h, w, 3), dtype=np.uint8)
+		assert torch.equal(copy_input(net, frames[:1]), uint8_input(net, frames[:1]))
+		copy_ms, copy_mb = measure(copy_input, net, frames)
+		uint8_ms, uint8_mb = measure(uint8_input, net, frames)
+		print('{:>6} {:>14.1f} {:>14.1f} {:>14.1f} {:>14.1f}'.format(batch_size, copy_ms, uint8_ms, copy_mb, uint8_mb))
+
+if __name__ == '__main__':
+	main()
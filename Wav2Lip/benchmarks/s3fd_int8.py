@@ -0,0 +1,102 @@
+"""Compare int8 S3FD (face_detection/detection/sfd/quantized.py) with the
+float32 network on the CPU: a parity report of recall and IoU of the int8
+faces against the float32 ones, and time per frame.
+
+	python benchmarks/s3fd_int8.py --video ../class3.mp4 --num_frames 32 --heights 360 720
+
+The int8 weights are read from the cache next to s3fd.pth, or calibrated
+on the sample video and cached first. Parity is measured on frames offset
+from the ones calibrated on. A float32 face counts as recalled when an int8
+face overlaps it with at least --iou.
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import cv2
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from face_detection.detection.sfd.bbox import batch_nms
+from face_detection.detection.sfd.detect import decode_batch, head_outputs
+from face_detection.detection.sfd.net_s3fd import s3fd
+from face_detection.detection.sfd.quantized import cached_quantized, default_backend
+from face_tracking import box_iou
+
+parser = argparse.ArgumentParser(description='Benchmark int8 S3FD against float32')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--num_frames', type=int, default=32, help='Frames of the parity report')
+parser.add_argument('--heights', nargs='+', type=int, default=[360], help='Frame heights to time (16:9)')
+parser.add_argument('--batch_size', type=int, default=1)
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--iou', type=float, default=0.5)
+parser.add_argument('--backend', type=str, default=default_backend(), choices=['fbgemm', 'x86', 'qnnpack'])
+args = parser.parse_args()
+
+def read_frames():
+	stream = cv2.VideoCapture(args.video)
+	total = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+	frames = []
+	for index in np.linspace(0, total - 1, args.num_frames).astype(int) + 7:
+		stream.set(cv2.CAP_PROP_POS_FRAMES, min(index, total - 1))
+		ok, frame = stream.read()
+		if ok:
+			frames.append(frame)
+	stream.release()
+	return frames
+
+def faces(net, frame):
+	"""The faces of a frame after NMS, and the head outputs they came from."""
+	olist = head_outputs(net, frame[None], 'cpu', bgr=True)
+	return batch_nms(decode_batch(olist), 0.3)[0], olist
+
+def parity(net, qnet, frames):
+	matched, total, ious, extra, score_diff = 0, 0, [], 0, 0.
+	for frame in frames:
+		expected, olist = faces(net, frame)
+		got, qolist = faces(qnet, frame)
+		score_diff = max(score_diff, max(float((a[:, 1] - b[:, 1]).abs().max()) for a, b in zip(olist[::2], qolist[::2])))
+		used = set()
+		for face in expected:
+			overlaps = [box_iou(face[:4], g[:4]) if j not in used else 0. for j, g in enumerate(got)]
+			total += 1
+			if overlaps and max(overlaps) >= args.iou:
+				used.add(int(np.argmax(overlaps)))
+				matched += 1
+				ious.append(max(overlaps))
+		extra += len(got) - len(used)
+	return matched, total, ious, extra, score_diff
+
+def timed(net, frames):
+	with torch.no_grad():
+		head_outputs(net, frames, 'cpu', bgr=True)
+		best = float('inf')
+		for _ in range(args.repeats):
+			start = time.perf_counter()
+			decode_batch(head_outputs(net, frames, 'cpu', bgr=True))
+			best = min(best, time.perf_counter() - start)
+	return best / len(frames)
+
+def main():
+	weights = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'face_detection/detection/sfd/s3fd.pth')
+	net = s3fd()
+	net.load_state_dict(torch.load(weights))
+	net.eval()
+	start = time.perf_counter()
+	qnet = cached_quantized(net, weights, args.backend)
+	print('int8 S3FD ({}) ready in {:.1f} s, {} threads'.format(args.backend, time.perf_counter() - start, torch.get_num_threads()))
+
+	frames = read_frames()
+	matched, total, ious, extra, score_diff = parity(net, qnet, frames)
+	print('parity on {} frames of {}: recall {}/{} = {:.3f}, mean IoU {:.3f}, {} extra int8 faces, '
+		  'max face score difference {:.4f}'.format(len(frames), args.video, matched, total, matched / max(total, 1),
+												   np.mean(ious) if ious else float('nan'), extra, score_diff))
+
+	print('{:>8} {:>14} {:>14} {:>10}'.format('', 'fp32 ms/frame', 'int8 ms/frame', 'speedup'))
+	for height in args.heights:
+		size = (int(round(height * 16 / 9)), height)
+		batch = np.array([cv2.resize(f, size) for f in frames[:args.batch_size]])
+		fp32_s, int8_s = timed(net, batch), timed(qnet, batch)
+		print('{:>8} {:>14.1f} {:>14.1f} {:>9.2f}x'.format('%dp' % height, 1e3 * fp32_s, 1e3 * int8_s, fp32_s / int8_s))
+
+if __name__ == '__main__':
+	main()
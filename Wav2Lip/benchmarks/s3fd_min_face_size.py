@@ -0,0 +1,66 @@
+"""Compare S3FD with and without a minimum face size (min_face_size of
+batch_detect and SFDDetector): network and decoding time per batch when the
+finest detection heads are skipped.
+
+	python benchmarks/s3fd_min_face_size.py --video ../class3.mp4 --min_face_sizes 0 32 64 128
+
+The network time drops by the skipped heads' L2 normalisation and
+classifier/regressor convolutions, decoding by their candidates. "same best"
+checks the best face per frame is the one found with every head.
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import cv2
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from face_detection.detection.sfd.bbox import best_detection
+from face_detection.detection.sfd.detect import decode_batch, head_outputs
+from face_detection.detection.sfd.net_s3fd import s3fd
+
+parser = argparse.ArgumentParser(description='Benchmark S3FD with a minimum face size')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--min_face_sizes', nargs='+', type=int, default=[0, 32, 64, 128])
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+def timed(fn, *fn_args, **fn_kwargs):
+	"""Best seconds of --repeats calls and the last result."""
+	best = float('inf')
+	for _ in range(args.repeats):
+		start = time.perf_counter()
+		out = fn(*fn_args, **fn_kwargs)
+		best = min(best, time.perf_counter() - start)
+	return best, out
+
+def main():
+	stream = cv2.VideoCapture(args.video)
+	frames = np.array([stream.read()[1] for _ in range(args.batch_size)])
+	stream.release()
+
+	net = s3fd()
+	net.load_state_dict(torch.load(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'face_detection/detection/sfd/s3fd.pth')))
+	net.to(args.device).eval()
+	head_outputs(net, frames, args.device, bgr=True)
+
+	print('batch of {} {}x{} frames from {}, {} threads'.format(
+		args.batch_size, frames.shape[2], frames.shape[1], args.video, torch.get_num_threads()))
+	print('{:>10} {:>12} {:>12} {:>12} {:>10} {:>10}'.format('min size', 'network ms', 'decode ms', 'candidates', 'speedup', 'same best'))
+	reference = None
+	for min_face_size in args.min_face_sizes:
+		net_s, olist = timed(head_outputs, net, frames, args.device, bgr=True, min_face_size=min_face_size)
+		decode_s, dets = timed(decode_batch, olist)
+		total = net_s + decode_s
+		best = best_detection(dets)
+		if reference is None:
+			reference = (total, best)
+		same = all((b is None and r is None) or (b is not None and r is not None and np.array_equal(b, r))
+				for b, r in zip(best, reference[1]))
+		print('{:>10} {:>12.1f} {:>12.1f} {:>12} {:>9.2f}x {:>10}'.format(
+			min_face_size, 1e3 * net_s, 1e3 * decode_s, len(dets), reference[0] / total, str(same)))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,65 @@
+"""Compare S3FD non-maximum suppression before and after batching it
+(face_detection/detection/sfd/bbox.py): the per-image NumPy loop with a
+score filter afterwards, batch_nms, and the single best face fast path.
+
+	python benchmarks/s3fd_nms.py --video ../class3.mp4 --heights 480 720
+
+The NumPy loop visits every candidate, so it takes minutes per batch at
+720p and above on cluttered frames.
+"""
+from os import path
+import sys, argparse, time
+import numpy as np
+import cv2
+import torch
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from face_detection.detection.sfd.bbox import batch_nms, best_detection, nms
+from face_detection.detection.sfd.detect import batch_detect
+from face_detection.detection.sfd.net_s3fd import s3fd
+
+parser = argparse.ArgumentParser(description='Benchmark S3FD non-maximum suppression')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--heights', nargs='+', type=int, default=[480], help='Frame heights to test (16:9)')
+parser.add_argument('--top_k', type=int, default=750)
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+def loop_nms(dets):
+	"""What detect_from_batch did before: NMS per image, then the score filter."""
+	results = []
+	for i in range(dets.shape[1]):
+		kept = dets[nms(dets[:, i, :], 0.3), i, :]
+		results.append([x for x in kept if x[-1] > 0.5])
+	return results
+
+def timed(fn, *fn_args):
+	start = time.perf_counter()
+	out = fn(*fn_args)
+	return time.perf_counter() - start, out
+
+def main():
+	stream = cv2.VideoCapture(args.video)
+	frames = [stream.read()[1] for _ in range(args.batch_size)]
+	stream.release()
+
+	net = s3fd()
+	net.load_state_dict(torch.load(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'face_detection/detection/sfd/s3fd.pth')))
+	net.to(args.device).eval()
+
+	print('batch of {} frames from {}'.format(args.batch_size, args.video))
+	print('{:>8} {:>12} {:>12} {:>14} {:>12} {:>10}'.format('', 'candidates', 'loop ms', 'batch_nms ms', 'best ms', 'same best'))
+	for height in args.heights:
+		size = (int(round(height * 16 / 9)), height)
+		dets = batch_detect(net, np.array([cv2.resize(f, size) for f in frames]), args.device)
+		loop_s, expected = timed(loop_nms, dets)
+		batch_s, kept = timed(batch_nms, dets, 0.3, 0.5, args.top_k)
+		best_s, best = timed(best_detection, dets)
+		same = all((len(e) == 0 and b is None) or (len(e) > 0 and np.array_equal(e[0], b)) for e, b in zip(expected, best))
+		same = same and all(len(e) == len(k) == 0 or np.array_equal(e[0], k[0]) for e, k in zip(expected, kept))
+		print('{:>8} {:>12} {:>12.1f} {:>14.1f} {:>12.2f} {:>10}'.format(
+			'%dp' % height, len(dets), 1e3 * loop_s, 1e3 * batch_s, 1e3 * best_s, str(same)))
+
+if __name__ == '__main__':
+	main()
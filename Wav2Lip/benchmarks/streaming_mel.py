@@ -0,0 +1,69 @@
+"""Compare streaming mel chunks (audio.wav_blocks and stream_mel_chunks, as
+the engine reads its audio) with loading the whole file and chunking its
+mel spectrogram: time to the first chunk, total time and peak memory.
+
+	python benchmarks/streaming_mel.py --minutes 120 --block_size 160000
+
+The audio is the sample video's soundtrack repeated, written as a 16 kHz
+WAV into a temporary directory. Each way runs in its own process so its
+peak resident memory can be read.
+"""
+from os import path
+import sys, argparse, resource, subprocess, tempfile, time
+import numpy as np
+import soundfile
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+import audio
+
+parser = argparse.ArgumentParser(description='Benchmark streaming mel chunks')
+parser.add_argument('--video', type=str, default=path.normpath(path.join(path.dirname(path.abspath(__file__)), '../../class3.mp4')))
+parser.add_argument('--minutes', type=float, default=120.)
+parser.add_argument('--block_size', type=int, default=16000 * 10)
+parser.add_argument('--fps', type=float, default=25.)
+parser.add_argument('--run', type=str, default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+def chunks(mode, wav_path):
+	if mode == 'whole':
+		mel = audio.melspectrogram(audio.load_wav(wav_path, 16000))
+		return audio.MelChunks(mel, args.fps, 16)
+	_, blocks = audio.wav_blocks(wav_path, 16000, args.block_size)
+	return audio.stream_mel_chunks(blocks, args.fps, 16)
+
+def run(mode, wav_path):
+	"""Consume every chunk, checksumming them, and print the timings and peak memory."""
+	start = time.perf_counter()
+	first, count, total = None, 0, 0.
+	for chunk in chunks(mode, wav_path):
+		if first is None:
+			first = time.perf_counter() - start
+		count += 1
+		total += float(chunk[:, 0].sum())
+	seconds = time.perf_counter() - start
+	print(first, seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., count, total)
+
+def main():
+	if args.run:
+		mode, wav_path = args.run.split(':', 1)
+		return run(mode, wav_path)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		wav_path = path.join(tmp, 'long.wav')
+		soundtrack = audio.load_wav(args.video, 16000)
+		samples = int(args.minutes * 60 * 16000)
+		soundfile.write(wav_path, np.tile(soundtrack, samples // len(soundtrack) + 1)[:samples], 16000, subtype='PCM_16')
+		print('{:.0f} minutes of 16 kHz audio, {} fps, blocks of {} samples'.format(args.minutes, args.fps, args.block_size))
+		print('{:>8} {:>16} {:>12} {:>14} {:>10}'.format('', 'first chunk s', 'total s', 'peak RSS MB', 'chunks'))
+		results = {}
+		for mode in ['whole', 'stream']:
+			command = [sys.executable, path.abspath(__file__), '--run', mode + ':' + wav_path, '--fps', str(args.fps),
+					   '--block_size', str(args.block_size)]
+			first, seconds, rss, count, total = subprocess.check_output(command).decode().split()[-5:]
+			results[mode] = (int(count), float(total))
+			print('{:>8} {:>16.3f} {:>12.2f} {:>14.0f} {:>10}'.format(mode, float(first), float(seconds), float(rss), count))
+		(count_a, total_a), (count_b, total_b) = results['whole'], results['stream']
+		print('same chunks: {}, checksum difference {:.3g}'.format(count_a == count_b, abs(total_a - total_b)))
+
+if __name__ == '__main__':
+	main()
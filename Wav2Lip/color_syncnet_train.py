@@ -2,7 +2,7 @@ from os.path import dirname, join, basename, isfile
 from tqdm import tqdm
 
 from models import SyncNet_color as SyncNet
-import audio
+from dataset_store import load_faces, load_mel
 
 import torch
 from torch import nn
@@ -39,6 +39,8 @@ class Dataset(object):
         self.all_videos = get_image_list(args.data_root, split)
 
     def get_frame_id(self, frame):
+        if type(frame) == int:
+            return frame
         return int(basename(frame).split('.')[0])
 
     def get_window(self, start_frame):
@@ -60,62 +62,86 @@ class Dataset(object):
 
         end_idx = start_idx + syncnet_mel_step_size
 
-        return spec[start_idx : end_idx, :]
+        return np.array(spec[start_idx : end_idx, :], dtype=np.float32)
 
+    def sample_window(self, vidname):
+        """A random frame of the video, and either its window with label 1 or another frame's with label 0, or None.
 
-    def __len__(self):
-        return len(self.all_videos)
-
-    def __getitem__(self, idx):
-        while 1:
-            idx = random.randint(0, len(self.all_videos) - 1)
-            vidname = self.all_videos[idx]
-
-            img_names = list(glob(join(vidname, '*.jpg')))
-            if len(img_names) <= 3 * syncnet_T:
-                continue
-            img_name = random.choice(img_names)
-            wrong_img_name = random.choice(img_names)
-            while wrong_img_name == img_name:
-                wrong_img_name = random.choice(img_names)
+        Windows are read from the packed face crops when the video has them,
+        else from its JPEGs. The frame is its number when packed, else its path.
+        """
+        crops = load_faces(vidname, hparams.img_size)
+        if crops is not None:
+            if len(crops) <= 3 * syncnet_T:
+                return None
+            row = random.randrange(len(crops))
+            wrong_row = random.randrange(len(crops))
+            while wrong_row == row:
+                wrong_row = random.randrange(len(crops))
 
             if random.choice([True, False]):
                 y = torch.ones(1).float()
-                chosen = img_name
+                chosen = row
             else:
                 y = torch.zeros(1).float()
-                chosen = wrong_img_name
+                chosen = wrong_row
 
-            window_fnames = self.get_window(chosen)
-            if window_fnames is None:
-                continue
+            window = crops.window(chosen, syncnet_T)
+            if window is None:
+                return None
+            return int(crops.frame_ids[row]), window, y
+
+        img_names = list(glob(join(vidname, '*.jpg')))
+        if len(img_names) <= 3 * syncnet_T:
+            return None
+        img_name = random.choice(img_names)
+        wrong_img_name = random.choice(img_names)
+        while wrong_img_name == img_name:
+            wrong_img_name = random.choice(img_names)
 
-            window = []
-            all_read = True
-            for fname in window_fnames:
-                img = cv2.imread(fname)
-                if img is None:
-                    all_read = False
-                    break
-                try:
-                    img = cv2.resize(img, (hparams.img_size, hparams.img_size))
-                except Exception as e:
-                    all_read = False
-                    break
+        if random.choice([True, False]):
+            y = torch.ones(1).float()
+            chosen = img_name
+        else:
+            y = torch.zeros(1).float()
+            chosen = wrong_img_name
+
+        window_fnames = self.get_window(chosen)
+        if window_fnames is None:
+            return None
+
+        window = []
+        for fname in window_fnames:
+            img = cv2.imread(fname)
+            if img is None:
+                return None
+            try:
+                img = cv2.resize(img, (hparams.img_size, hparams.img_size))
+            except Exception as e:
+                return None
 
-                window.append(img)
+            window.append(img)
+        return img_name, window, y
 
-            if not all_read: continue
+    def __len__(self):
+        return len(self.all_videos)
 
-            try:
-                wavpath = join(vidname, "audio.wav")
-                wav = audio.load_wav(wavpath, hparams.sample_rate)
+    def __getitem__(self, idx):
+        while 1:
+            idx = random.randint(0, len(self.all_videos) - 1)
+            vidname = self.all_videos[idx]
 
-                orig_mel = audio.melspectrogram(wav).T
+            sample = self.sample_window(vidname)
+            if sample is None:
+                continue
+            img_name, window, y = sample
+
+            try:
+                orig_mel = load_mel(vidname)
             except Exception as e:
                 continue
 
-            mel = self.crop_audio_window(orig_mel.copy(), img_name)
+            mel = self.crop_audio_window(orig_mel, img_name)
 
             if (mel.shape[0] != syncnet_mel_step_size):
                 continue
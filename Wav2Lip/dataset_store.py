@@ -0,0 +1,136 @@
+"""Precomputed features of the preprocessed training videos.
+
+preprocess.py writes, in each video's folder next to audio.wav:
+
+- mel.npy, the mel spectrogram of the audio: (frames, num_mels), time-major
+  so a window of frames is one contiguous slice, in float32 or float16.
+- faces.npy, the detected face crops resized to img_size: (crops, img_size,
+  img_size, 3) uint8 BGR, in frame order, and frame_ids.npy, the video
+  frame each crop comes from (frames without a face have no crop).
+
+The training datasets memory-map them instead of decoding the audio and
+running the STFT, or reading and resizing JPEGs, on every sample.
+"""
+import os
+from collections import OrderedDict
+from glob import glob
+
+import cv2
+import numpy as np
+
+import audio
+from hparams import hparams as hp
+
+MEL_FILE = 'mel.npy'
+MEL_DTYPES = ('float32', 'float16')
+FACES_FILE = 'faces.npy'
+FRAME_IDS_FILE = 'frame_ids.npy'
+
+_open_faces = OrderedDict()
+
+
+def save_mel(video_dir, dtype='float32'):
+    """Compute the mel spectrogram of ``video_dir``/audio.wav and store it as ``video_dir``/mel.npy."""
+    if dtype not in MEL_DTYPES:
+        raise ValueError('Unsupported mel dtype {}; use one of {}'.format(dtype, ', '.join(MEL_DTYPES)))
+    wav = audio.load_wav(os.path.join(video_dir, 'audio.wav'), hp.sample_rate)
+    mel = np.ascontiguousarray(audio.melspectrogram(wav).T, dtype=dtype)
+    _save(video_dir, MEL_FILE, mel)
+    return mel
+
+
+def load_mel(video_dir):
+    """The (frames, num_mels) mel spectrogram of ``video_dir``'s audio.
+
+    A read-only memory map of the stored mel.npy when it is there and not
+    older than audio.wav, else computed from the audio as before.
+    """
+    mel_path = os.path.join(video_dir, MEL_FILE)
+    wav_path = os.path.join(video_dir, 'audio.wav')
+    try:
+        stale = os.path.getmtime(wav_path) > os.path.getmtime(mel_path)
+    except OSError:  # no audio.wav, or no store
+        stale = not os.path.isfile(mel_path)
+    if not stale:
+        return np.load(mel_path, mmap_mode='r')
+    return audio.melspectrogram(audio.load_wav(wav_path, hp.sample_rate)).T
+
+
+class FaceCrops(object):
+    """The packed face crops of one video, memory-mapped read-only."""
+
+    def __init__(self, faces, frame_ids):
+        self.faces = faces
+        self.frame_ids = frame_ids
+
+    def __len__(self):
+        return len(self.faces)
+
+    def window(self, row, length):
+        """Crops ``row`` to ``row + length`` as one slice, or None unless they are consecutive frames."""
+        if row + length > len(self.faces) or self.frame_ids[row + length - 1] - self.frame_ids[row] != length - 1:
+            return None
+        return self.faces[row:row + length]
+
+
+def save_faces(video_dir, frame_ids, faces):
+    """Store the uint8 face crops ``faces`` of frames ``frame_ids``, all of one size, as ``video_dir``/faces.npy."""
+    frame_ids = np.asarray(frame_ids, dtype=np.int32)
+    if len(frame_ids) > 1 and np.any(np.diff(frame_ids) <= 0):
+        raise ValueError('Face crops must be in increasing frame order')
+    faces = np.asarray(faces, dtype=np.uint8).reshape(len(frame_ids), *np.shape(faces)[1:])
+    # faces.npy is written last; load_faces only reads a video once it exists
+    _save(video_dir, FRAME_IDS_FILE, frame_ids)
+    _save(video_dir, FACES_FILE, faces)
+
+
+def pack_faces(video_dir, img_size):
+    """Pack the {frame}.jpg crops of a video preprocessed before into faces.npy, resized as the datasets do."""
+    frame_ids = sorted(int(os.path.basename(f).split('.')[0]) for f in glob(os.path.join(video_dir, '*.jpg')))
+    faces = np.empty((len(frame_ids), img_size, img_size, 3), np.uint8)
+    for face, frame_id in zip(faces, frame_ids):
+        img = cv2.imread(os.path.join(video_dir, '{}.jpg'.format(frame_id)))
+        if img is None:
+            raise IOError('Cannot read {}.jpg in {}'.format(frame_id, video_dir))
+        face[:] = cv2.resize(img, (img_size, img_size))
+    save_faces(video_dir, frame_ids, faces)
+
+
+def load_faces(video_dir, img_size):
+    """The FaceCrops of ``video_dir``, or None when it has no packed crops of ``img_size``.
+
+    The hp.open_videos most recently used are kept mapped, so drawing
+    samples from them does not reopen the files, until their faces.npy is
+    rewritten. Each map keeps a file open in every data loader worker, so
+    hp.open_videos has to stay well below ``ulimit -n``.
+    """
+    faces_path = os.path.join(video_dir, FACES_FILE)
+    try:
+        mtime = os.stat(faces_path).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    key = (video_dir, img_size)
+    if key in _open_faces:
+        stored, crops = _open_faces.pop(key)
+        if stored == mtime:
+            _open_faces[key] = stored, crops
+            return crops
+
+    if mtime is None:
+        return None
+    faces = np.load(faces_path, mmap_mode='r')
+    if faces.shape[1:] != (img_size, img_size, 3):
+        return None
+    crops = FaceCrops(faces, np.load(os.path.join(video_dir, FRAME_IDS_FILE)))
+    _open_faces[key] = mtime, crops
+    while len(_open_faces) > hp.open_videos:
+        _open_faces.popitem(last=False)
+    return crops
+
+
+def _save(video_dir, name, array):
+    # Written under another name and renamed, so readers never see a partial file
+    tmp_path = os.path.join(video_dir, name + '.tmp.npy')
+    np.save(tmp_path, array)
+    os.replace(tmp_path, os.path.join(video_dir, name))
@@ -0,0 +1,842 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import ExitStack
+from dataclasses import dataclass, replace
+
+import numpy as np
+import cv2
+import torch
+from tqdm import tqdm
+
+import audio
+from hparams import hparams as hp
+from face_detection import detector_pool
+from backends import load_backend
+from pipeline import PipelineStats, Stage, map_stage
+from track_cache import FaceTrackCache
+from face_tracking import inside_roi, keyframe_stream, proxy_scale, roi_around, scale_box, smooth_stream
+from video_io import ENCODER_CODECS, FFmpegWriter, concat_segments, copy_segment, keyframe_times, probe_video
+from segments import plan_segments, speech_mask
+from batching import BatchPool, paste_faces, quantise
+
+mel_step_size = 16
+
+# Default face track cache, inside the package whatever the working directory
+FACE_TRACK_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'face_tracks')
+
+# Devices the S3FD face detector accepts (see face_detection.detection.core)
+DETECTOR_DEVICES = ('cpu', 'cuda')
+
+# Face detectors by config name: the face_detection.detection module and its options.
+# All but S3FD are small CPU-only detectors for frontal talking heads; sfd_int8
+# is S3FD quantized to int8 for the CPU.
+FACE_DETECTORS = {
+    'sfd': ('sfd', {}),
+    'sfd_int8': ('sfd', {'quantize': True}),
+    'haar': ('cascade', {'cascade': 'haar'}),
+    'lbp': ('cascade', {'cascade': 'lbp'}),
+    'onnx': ('onnx', {}),
+}
+
+
+def is_image_file(path):
+    return path.split('.')[-1].lower() in ['jpg', 'png', 'jpeg']
+
+
+def count_frames(path):
+    """Number of frames of the video at `path` that decode, or 0 if it cannot be opened.
+
+    CAP_PROP_FRAME_COUNT comes from the container and can count frames that
+    never decode (918 for 917 on some MP4s), so only the last few frames
+    from it are decoded to find the real end.
+    """
+    video_stream = cv2.VideoCapture(path)
+    try:
+        start = max(0, int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT)) - 32)
+        if start > 0:
+            video_stream.set(cv2.CAP_PROP_POS_FRAMES, start)
+            if not video_stream.grab():  # estimate past the end: count from the start
+                video_stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                start = 0
+            else:
+                start += 1
+        while video_stream.grab():
+            start += 1
+        return start
+    finally:
+        video_stream.release()
+
+
+def get_device_with_fallback():
+    """智能選擇設備，自動處理不支援的設備類型"""
+    # 優先順序: CUDA > CPU。MPS 可用時仍使用 CPU，因為 face_detection 模組只支援 cpu/cuda
+    if torch.cuda.is_available():
+        return 'cuda'
+    if torch.backends.mps.is_available():
+        print("⚠️  MPS 可用但 face_detection 模組不支援，自動降級使用 CPU")
+    return 'cpu'
+
+
+@dataclass
+class Wav2LipConfig:
+    """Options of a Wav2LipEngine. Each field matches the inference.py flag of the same name."""
+    checkpoint_path: str = 'app/Wav2Lip/checkpoints/wav2lip.pth'
+    device: str = None  # None picks get_device_with_fallback()
+    backend: str = 'eager'  # eager, torchscript or onnx (see backends.py)
+    onnx_path: str = None  # None keeps the export next to the checkpoint
+    ort_threads: int = 0
+    face_detector: str = 'sfd'  # a key of FACE_DETECTORS
+    face_detector_path: str = None  # None uses the detector's default model file
+    min_face_size: int = 0  # S3FD: smallest face in pixels of the detector input, skipping finer heads
+    detector_idle_timeout: float = 300.  # seconds an unused pooled detector stays loaded; None keeps it
+
+    static: bool = False
+    fps: float = 25.
+    pads: tuple = (0, 10, 0, 0)
+    face_det_batch_size: int = 4
+    wav2lip_batch_size: int = 32
+    resize_factor: int = 2
+    crop: tuple = (0, -1, 0, -1)
+    box: tuple = (-1, -1, -1, -1)
+    rotate: bool = False
+    nosmooth: bool = False
+    smooth_method: str = 'mean'  # mean, one_euro or kalman (see face_tracking.smooth_track)
+    smooth_max_gap: int = 0  # runs of up to this many frames without a face are interpolated
+    smooth_outlier_threshold: float = 0.  # >0 drops boxes this far (times the face size) from their neighbours
+    img_size: int = 96
+
+    detect_face_size: int = 0  # >0 detects on a downscaled proxy where faces are about this many pixels
+    detect_min_side: int = 240  # shorter side of the smallest detection proxy
+    roi_detection: bool = False  # detect around the last face found, scanning whole frames only to find it again
+    roi_margin: float = 0.5  # the region grows the last face's box by this times its size on every side
+    roi_min_score: float = 0.8  # faces in the region scoring lower are looked for in the whole frame
+    detect_every: int = 1
+    keyframe_motion: float = 10.
+    keyframe_iou: float = 0.7
+    face_track_cache: str = FACE_TRACK_CACHE
+    face_track_cache_size: int = 256
+
+    vcodec: str = 'libx264'
+    crf: int = 18
+    preset: str = 'medium'
+    encode_threads: int = 0
+
+    passthrough: bool = False
+    vad_threshold: float = -40.
+    min_silence: float = 0.5
+    speech_pad: float = 0.2
+    min_copy: float = 2.
+
+    pipeline_queue_size: int = 8
+    paste_workers: int = 2
+    audio_block_size: int = 16000 * 10  # samples of audio read and turned into mel chunks at a time
+
+
+class Wav2LipEngine(object):
+    """Lip-syncs videos to audio with a resident Wav2Lip model and a pooled face detector.
+
+        engine = Wav2LipEngine(Wav2LipConfig(checkpoint_path='checkpoints/wav2lip_gan.pth'))
+        for face, speech, out in jobs:
+            engine.run(face, speech, out, resize_factor=1)
+
+    Creating an engine reads no command line and builds no model. The
+    Wav2Lip model is loaded on first use and stays on the device until
+    close(); face detectors come from face_detection.detector_pool, shared
+    with every other engine in the process and dropped after
+    detector_idle_timeout seconds unused. Keyword options passed to run()
+    override the config for that call only; the checkpoint, device and
+    backend are fixed for the engine's lifetime.
+    """
+
+    FIXED_OPTIONS = ('checkpoint_path', 'device', 'backend', 'onnx_path', 'ort_threads')
+
+    def __init__(self, config=None, **options):
+        self.config = replace(config or Wav2LipConfig(), **options)
+        self.device = self.config.device or get_device_with_fallback()
+        print(f"🖥️  Wav2Lip 推理設備: {self.device.upper()}")
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The Wav2Lip generator behind the configured backend, called as model(mel_batch, img_batch)."""
+        with self._lock:
+            if self._model is None:
+                config = self.config
+                self._model = load_backend(config.backend, config.checkpoint_path, self.device,
+                                           onnx_path=config.onnx_path, threads=config.ort_threads,
+                                           img_size=config.img_size, mel_shape=(hp.num_mels, mel_step_size))
+                print("Model loaded")
+            return self._model
+
+    def lease_detector(self, config=None):
+        """A context manager holding the pooled FaceAlignment of ``config`` (the engine's by default)."""
+        config = config or self.config
+        if config.face_detector not in FACE_DETECTORS:
+            raise ValueError('Unknown face detector {}; expected one of {}'.format(
+                config.face_detector, ', '.join(FACE_DETECTORS)))
+        module, options = FACE_DETECTORS[config.face_detector]
+        device = self.device
+        if module != 'sfd' or options.get('quantize'):
+            device = 'cpu'
+        elif device not in DETECTOR_DEVICES:
+            raise ValueError('Face detection runs on {}, not {}'.format(' or '.join(DETECTOR_DEVICES), device))
+        if config.face_detector_path:
+            options = dict(options, path_to_detector=config.face_detector_path)
+        if module == 'sfd' and config.min_face_size:
+            options = dict(options, min_face_size=config.min_face_size)
+        return detector_pool.lease(device, module, idle_timeout=config.detector_idle_timeout, **options)
+
+    def close(self):
+        """Release the model and every pooled face detector not in use; they are loaded again when needed."""
+        with self._lock:
+            self._model = None
+        detector_pool.release_idle()
+        if self.device == 'cuda':
+            torch.cuda.empty_cache()
+
+    def run(self, face_path, audio_path, output_path, stats=None, **options):
+        """Lip-sync the video or image at ``face_path`` to ``audio_path`` and write ``output_path``.
+
+        ``options`` are Wav2LipConfig fields overriding the engine's config for
+        this call, and ``stats`` an optional PipelineStats collecting queue
+        statistics. Returns ``output_path``.
+        """
+        for name in self.FIXED_OPTIONS:
+            if name in options and options[name] != getattr(self.config, name):
+                raise ValueError('{} is fixed when the engine is created'.format(name))
+        config = replace(self.config, **options)
+        return _Job(self, config, face_path, audio_path, output_path, stats).run()
+
+
+class _Job(object):
+    """One run of the pipeline: decode, detect, batch, Wav2Lip, paste-back, encode."""
+
+    def __init__(self, engine, config, face, audio_path, outfile, stats=None):
+        self.engine = engine
+        self.config = config
+        self.device = engine.device
+        self.face = face
+        self.audio = audio_path
+        self.outfile = outfile
+        self.static = config.static or is_image_file(face)
+        self.stats = stats if stats is not None else PipelineStats()
+        self.face_det_batch_size = config.face_det_batch_size
+        self.detect_scale = None if config.detect_face_size > 0 else 1.
+        self.last_box = None
+        self._detector = None
+        self._leases = ExitStack()
+        self.full_detections = 0
+        self.roi_detections = 0
+
+    def preprocess_frame(self, frame):
+        config = self.config
+        if config.resize_factor > 1:
+            frame = cv2.resize(frame, (frame.shape[1]//config.resize_factor, frame.shape[0]//config.resize_factor))
+
+        if config.rotate:
+            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+
+        y1, y2, x1, x2 = config.crop
+        if x2 == -1: x2 = frame.shape[1]
+        if y2 == -1: y2 = frame.shape[0]
+
+        return frame[y1:y2, x1:x2]
+
+    def read_frames(self, limit, keep=None):
+        """Decode and preprocess at most `limit` frames of the face video, one at a time.
+
+        With a boolean `keep` mask, only the frames where it is True are yielded;
+        the others are grabbed but never converted or preprocessed.
+        """
+        if is_image_file(self.face):
+            yield cv2.imread(self.face)
+            return
+
+        video_stream = cv2.VideoCapture(self.face)
+        try:
+            for i in range(limit):
+                if keep is not None and not keep[i]:
+                    if not video_stream.grab():
+                        break
+                    continue
+                still_reading, frame = video_stream.read()
+                if not still_reading:
+                    break
+                yield self.preprocess_frame(frame)
+        finally:
+            video_stream.release()
+
+    @property
+    def detector(self):
+        """The pooled face detector, leased on first use until the job ends."""
+        if self._detector is None:
+            self._detector = self._leases.enter_context(self.engine.lease_detector(self.config))
+        return self._detector
+
+    @staticmethod
+    def proxy(image, scale):
+        if scale >= 1:
+            return image
+        size = (max(1, int(round(image.shape[1] * scale))), max(1, int(round(image.shape[0] * scale))))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    def choose_detect_scale(self, image):
+        """Scale of the detection proxy for this video, from the size of the face in its first detected frame.
+
+        The face is first looked for on the smallest proxy, then on ones twice
+        as large up to the full frame. Without any face the frames are
+        detected on at full resolution.
+        """
+        config = self.config
+        scale = min(1., config.detect_min_side / min(image.shape[:2]))
+        while True:
+            proxy = self.proxy(image, scale)
+            rect = self.detector.get_detections_for_batch(proxy[None])[0]
+            if rect is not None:
+                x1, y1, x2, y2 = scale_box(rect, image.shape[1] / proxy.shape[1], image.shape[0] / proxy.shape[0])
+                return proxy_scale(max(x2 - x1, y2 - y1), image.shape, config.detect_face_size, config.detect_min_side)
+            if scale >= 1:
+                return 1.
+            scale = min(1., 2 * scale)
+
+    def detect_full(self, detector, images):
+        """(x1, y1, x2, y2, score) of the face in each of `images`, or None, detected on proxies if detect_scale < 1."""
+        batch = [self.proxy(image, self.detect_scale) for image in images]
+        rects = detector.get_detections_for_batch(np.array(batch), scores=True)
+        if self.detect_scale < 1:
+            sx, sy = images[0].shape[1] / batch[0].shape[1], images[0].shape[0] / batch[0].shape[0]
+            rects = [None if rect is None else scale_box(rect, sx, sy) for rect in rects]
+        return rects
+
+    def detect_batch(self, detector, images):
+        """The unpadded (x1, y1, x2, y2) box of each frame of a batch, or None.
+
+        With roi_detection, once a face has been found every frame of the next
+        batch is cropped to the same region around it (see
+        face_tracking.roi_around), so the crops still batch together. Frames
+        whose face is missing from the region, scores below roi_min_score or
+        touches the region's edge are then scanned in full.
+        """
+        config = self.config
+        if not config.roi_detection or self.last_box is None:
+            rects = self.detect_full(detector, images)
+            self.full_detections += len(images)
+        else:
+            x1, y1, x2, y2 = roi = roi_around(self.last_box, images[0].shape, config.roi_margin)
+            rects = [None if r is None else (r[0] + x1, r[1] + y1, r[2] + x1, r[3] + y1, r[4])
+                     for r in self.detect_full(detector, [image[y1:y2, x1:x2] for image in images])]
+            self.roi_detections += len(images)
+            missed = [i for i, r in enumerate(rects)
+                      if r is None or r[4] < config.roi_min_score or not inside_roi(r, roi, images[i].shape)]
+            if missed:
+                for i, rect in zip(missed, self.detect_full(detector, [images[i] for i in missed])):
+                    rects[i] = rect
+                self.full_detections += len(missed)
+        self.last_box = rects[-1]
+        return [None if r is None else r[:4] for r in rects]
+
+    def face_detect(self, images):
+        """Run the detector over `images` and return a padded (x1, y1, x2, y2) box per image, or None.
+
+        With detect_face_size set, detection runs on downscaled proxies of the
+        frames and the boxes are scaled back to the frames' resolution; with
+        roi_detection, on regions around the last face (see detect_batch).
+        """
+        detector = self.detector
+        batch_size = self.face_det_batch_size
+        if self.detect_scale is None and len(images) > 0:
+            self.detect_scale = self.choose_detect_scale(images[0])
+            print('Detecting faces at {:.0%} of the frame size'.format(self.detect_scale))
+
+        while 1:
+            predictions = []
+            try:
+                for i in range(0, len(images), batch_size):
+                    predictions.extend(self.detect_batch(detector, images[i:i + batch_size]))
+            except RuntimeError:
+                if batch_size == 1:
+                    raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
+                batch_size //= 2
+                self.face_det_batch_size = batch_size
+                print('Recovering from OOM error; New batch size: {}'.format(batch_size))
+                continue
+            break
+
+        results = []
+        pady1, pady2, padx1, padx2 = self.config.pads
+        for rect, image in zip(predictions, images):
+            if rect is None:
+                # 返回 None 表示這一幀沒有人臉，而不是拋出錯誤
+                results.append(None)
+                continue
+
+            y1 = max(0, rect[1] - pady1)
+            y2 = min(image.shape[0], rect[3] + pady2)
+            x1 = max(0, rect[0] - padx1)
+            x2 = min(image.shape[1], rect[2] + padx2)
+
+            results.append([x1, y1, x2, y2])
+
+        return results
+
+    def detect_stream(self, frames):
+        """Yield (frame, box) pairs, running face detection one batch of frames at a time.
+
+        With detect_every > 1 the detector only sees keyframes and the boxes in
+        between are interpolated (see face_tracking.keyframe_stream).
+        """
+        config = self.config
+        if config.detect_every > 1:
+            yield from keyframe_stream(frames, self.face_detect, config.detect_every,
+                                       window=config.detect_every * self.face_det_batch_size,
+                                       motion_threshold=config.keyframe_motion, iou_threshold=config.keyframe_iou)
+            return
+
+        batch = []
+        for frame in frames:
+            batch.append(frame)
+            if len(batch) >= self.face_det_batch_size:
+                yield from zip(batch, self.face_detect(batch))
+                batch = []
+
+        if len(batch) > 0:
+            yield from zip(batch, self.face_detect(batch))
+
+    def smooth(self, track):
+        """The (frame, box) pairs of `track` with their boxes smoothed as configured."""
+        config = self.config
+        if config.nosmooth:
+            return track
+        return smooth_stream(track, T=5, method=config.smooth_method, max_gap=config.smooth_max_gap,
+                             outlier_threshold=config.smooth_outlier_threshold or None)
+
+    def track_cache(self):
+        """The face track cache and the key of the face video under the current options, or (None, None)."""
+        config = self.config
+        if not config.face_track_cache:
+            return None, None
+        cache = FaceTrackCache(config.face_track_cache, config.face_track_cache_size << 20)
+        key = cache.key(self.face, pads=config.pads, resize_factor=config.resize_factor,
+                        crop=config.crop, rotate=config.rotate, nosmooth=config.nosmooth,
+                        smooth_method=config.smooth_method, smooth_max_gap=config.smooth_max_gap,
+                        smooth_outlier_threshold=config.smooth_outlier_threshold,
+                        face_detector=config.face_detector, face_detector_path=config.face_detector_path,
+                        min_face_size=config.min_face_size, detect_face_size=config.detect_face_size,
+                        detect_min_side=config.detect_min_side, roi_detection=config.roi_detection,
+                        roi_margin=config.roi_margin, roi_min_score=config.roi_min_score,
+                        detect_every=config.detect_every, keyframe_motion=config.keyframe_motion,
+                        keyframe_iou=config.keyframe_iou)
+        return cache, key
+
+    def face_stream(self, num_frames, reader=None):
+        """Yield a (face, coords, frame) triple for each of `num_frames` mel chunks.
+
+        Frames are decoded, detected and smoothed in fixed-size windows, so only a
+        few batches are ever resident. Frames without a face are skipped. When the
+        audio outlasts the usable frames, the video is decoded again from the start
+        and the per-frame coords recorded on the first pass are reused instead of
+        running detection again. Tracks are also kept in the on-disk face-track
+        cache, so later runs on the same video skip detection entirely.
+        `reader(limit)` supplies the decoded frames.
+
+        Raises ValueError when at most half of the frames have a face. With
+        detection running, that is raised as soon as it is certain, so the
+        frames with a face found before then have already been yielded.
+        """
+        config = self.config
+        reader = reader or self.read_frames
+        if self.static:
+            frame = next(iter(reader(1)))
+            if config.box[0] == -1:
+                ((_, box),) = list(self.detect_stream([frame]))
+                if box is None:
+                    raise ValueError('No faces detected in any frames! Cannot proceed with lip sync.')
+                x1, y1, x2, y2 = box
+            else:
+                y1, y2, x1, x2 = config.box
+            for _ in range(num_frames):
+                f = frame.copy()
+                yield f[y1: y2, x1:x2], (y1, y2, x1, x2), f
+            return
+
+        if config.box[0] != -1:
+            print('Using the specified bounding box instead of face detection...')
+            y1, y2, x1, x2 = config.box
+            emitted = 0
+            while emitted < num_frames:
+                count = emitted
+                for frame in reader(num_frames - emitted):
+                    yield frame[y1: y2, x1:x2], (y1, y2, x1, x2), frame
+                    emitted += 1
+                if emitted == count:
+                    raise ValueError('No frames could be read from {}'.format(self.face))
+            return
+
+        coords_per_frame = None
+        cache, cache_key = self.track_cache()
+        if cache is not None:
+            entry = cache.load(cache_key, num_frames)
+            if entry is not None:
+                print('Using cached face track, skipping face detection...')
+                coords_per_frame = [(y1, y2, x1, x2) if v else None for (x1, y1, x2, y2), v in zip(*entry)]
+
+        emitted = 0
+        if coords_per_frame is None:
+            track = self.smooth(self.detect_stream(reader(num_frames)))
+
+            # Frames the first pass covers: a clip is rejected as soon as more
+            # than half of them have no face, before rendering the rest
+            first_pass = min(num_frames, count_frames(self.face) or num_frames)
+            coords_per_frame, missed = [], 0
+            for frame, box in track:
+                if box is None:
+                    coords_per_frame.append(None)
+                    missed += 1
+                    if missed > first_pass / 2:
+                        raise ValueError(f'Too few faces detected ({missed}/{first_pass} frames without a face)! '
+                                         'Cannot ensure quality lip sync.')
+                    continue
+                x1, y1, x2, y2 = box
+                coords = (y1, y2, x1, x2)
+                coords_per_frame.append(coords)
+                yield frame[y1: y2, x1:x2], coords, frame
+                emitted += 1
+
+            if cache is not None:
+                boxes = [(0, 0, 0, 0) if c is None else (c[2], c[0], c[3], c[1]) for c in coords_per_frame]
+                valid = [c is not None for c in coords_per_frame]
+                cache.save(cache_key, boxes, valid, complete=len(coords_per_frame) < num_frames)
+
+        # 計算人臉幀比例
+        num_valid = sum(c is not None for c in coords_per_frame)
+        if num_valid == 0:
+            raise ValueError('No faces detected in any frames! Cannot proceed with lip sync.')
+        face_ratio = num_valid / len(coords_per_frame)
+        print(f"  人臉檢測: {num_valid}/{len(coords_per_frame)} 幀 ({face_ratio*100:.1f}%)")
+
+        if face_ratio < 0.5:
+            raise ValueError(f'Too few faces detected ({face_ratio*100:.1f}% < 50%)! Cannot ensure quality lip sync.')
+
+        while emitted < num_frames:
+            count = emitted
+            for frame, coords in zip(reader(len(coords_per_frame)), coords_per_frame):
+                if coords is None:
+                    continue
+                y1, y2, x1, x2 = coords
+                yield frame[y1: y2, x1:x2], coords, frame
+                emitted += 1
+                if emitted == num_frames:
+                    break
+            if emitted == count:
+                raise ValueError('No frames with a face could be read again from {}'.format(self.face))
+
+    def passthrough_track(self, num_frames, needed):
+        """Face coords (y1, y2, x1, x2), or None, for each of the first `num_frames` frames.
+
+        Detection only runs on the frames where `needed` is True, unless a track
+        of the whole video is already in the face track cache.
+        """
+        config = self.config
+        if config.box[0] != -1:
+            y1, y2, x1, x2 = config.box
+            return [(y1, y2, x1, x2)] * num_frames
+
+        cache, cache_key = self.track_cache()
+        if cache is not None:
+            entry = cache.load(cache_key, num_frames)
+            if entry is not None:
+                print('Using cached face track, skipping face detection...')
+                coords = [(y1, y2, x1, x2) if v else None for (x1, y1, x2, y2), v in zip(*entry)]
+                return coords + [None] * (num_frames - len(coords))
+
+        track = self.smooth(self.detect_stream(self.read_frames(num_frames, needed)))
+
+        coords, count = [None] * num_frames, 0
+        for i, (_, box) in zip(np.flatnonzero(needed), track):
+            count += 1
+            if box is not None:
+                x1, y1, x2, y2 = box
+                coords[i] = (y1, y2, x1, x2)
+
+        if cache is not None and np.all(needed):
+            boxes = [(0, 0, 0, 0) if c is None else (c[2], c[0], c[3], c[1]) for c in coords[:count]]
+            cache.save(cache_key, boxes, [c is not None for c in coords[:count]], complete=count < num_frames)
+        return coords
+
+    def datagen(self, faces, mels, pool):
+        """Batch (face, coords, frame) triples with their mel chunks for the model.
+
+        Yields (batch, frames, coords), where batch is a BatchBuffers from `pool`.
+        A None face marks a passthrough frame: it is kept in order in the frame
+        batch, with None coords, but gets no model input; a batch made only of
+        such frames comes with a None batch.
+        """
+        batch_size = self.config.wav2lip_batch_size
+        batch, frame_batch, coords_batch = None, [], []
+
+        for i, (m, (face, coords, frame)) in enumerate(zip(mels, faces)):
+            frame_batch.append(frame)
+            coords_batch.append(coords)
+            if face is None:
+                if len(frame_batch) >= 4 * batch_size:
+                    yield batch, frame_batch, coords_batch
+                    batch, frame_batch, coords_batch = None, [], []
+                continue
+
+            # 驗證 face 數據
+            if not isinstance(face, np.ndarray):
+                raise ValueError(f"Face data is None or invalid at index {i}")
+            if face.size == 0 or face.shape[0] == 0 or face.shape[1] == 0:
+                raise ValueError(f"Face region is empty at index {i}. Shape: {face.shape}")
+
+            if batch is None:
+                batch = pool.acquire()
+            # 安全地 resize
+            try:
+                full = batch.add(face, m)
+            except cv2.error as e:
+                print(f"❌ Resize 失敗 at frame {i}: face shape={face.shape}, error={e}")
+                raise
+
+            if full:
+                yield batch, frame_batch, coords_batch
+                batch, frame_batch, coords_batch = None, [], []
+
+        if len(frame_batch) > 0:
+            yield batch, frame_batch, coords_batch
+
+    def stage(self, name, source):
+        if self.config.pipeline_queue_size <= 0:
+            return source
+        return Stage(name, source, self.config.pipeline_queue_size, self.stats)
+
+    def predict(self, batches):
+        for batch, frames, coords in batches:
+            if batch is None:
+                yield None, frames, coords
+                continue
+
+            model = self.engine.model
+            img_batch, mel_batch = batch.tensors()
+            pred = model(mel_batch, img_batch)
+
+            # The copy back to the host synchronises, so the input buffers are
+            # free again after it
+            pred = quantise(pred)
+            batch.release()
+            yield pred, frames, coords
+
+    @staticmethod
+    def paste(batch):
+        pred, frames, coords = batch
+        return paste_faces(pred, frames, coords)
+
+    def render(self, faces, mels):
+        """Batch, lip-sync and paste back (face, coords, frame) triples, yielding lists of finished frames."""
+        config = self.config
+        # Enough buffers for every batch that can be queued or in flight between
+        # the batching and inference stages
+        pool = BatchPool(max(config.pipeline_queue_size, 0) + 3, config.wav2lip_batch_size, config.img_size,
+                         (hp.num_mels, mel_step_size), pin_memory=self.device == 'cuda')
+        batches = self.stage('infer', self.predict(self.stage('batch', self.datagen(faces, mels, pool))))
+        if config.pipeline_queue_size <= 0:
+            return map(self.paste, batches)
+        return map_stage('paste', self.paste, batches, config.paste_workers, config.pipeline_queue_size, self.stats)
+
+    def copy_options(self):
+        """Encoder options matching the face video if its stream can be spliced into the output as is, else None."""
+        config = self.config
+        if config.resize_factor > 1 or config.rotate or list(config.crop) != [0, -1, 0, -1]:
+            return None
+        source = probe_video(self.face)
+        if source is None or ENCODER_CODECS.get(config.vcodec) != source['codec']:
+            return None
+        options = {'pix_fmt': source['pix_fmt']}
+        if config.vcodec == 'libx264' and source['profile'] in ('baseline', 'constrained baseline', 'main', 'high'):
+            options['profile'] = source['profile'].split()[-1]
+        return options
+
+    def run_passthrough(self, fps, wav, mel_chunks):
+        """Lip-sync only the frames with both speech and a face, taking the rest from the source.
+
+        Frame i of the output is frame i of the face video, paired with mel
+        chunk i. Passthrough stretches are stream-copied from the source
+        between keyframes when its codec and geometry match the output; only
+        the rendered frames and the frames up to the nearest keyframes are
+        encoded. The output ends with the shorter of video and audio; audio
+        past the last source frame is cut.
+        """
+        config = self.config
+        num_frames = min(len(mel_chunks), count_frames(self.face))
+
+        speech = speech_mask(wav, 16000, fps, num_frames, threshold_db=config.vad_threshold,
+                             min_silence=config.min_silence, pad=config.speech_pad)
+        coords = self.passthrough_track(num_frames, speech)
+        rendered = speech & np.array([c is not None for c in coords], dtype=bool)
+        print('Lip-syncing {}/{} frames ({:.1f}%)'.format(rendered.sum(), num_frames, 100. * rendered.mean()))
+
+        segments, key_times = [('encode', 0, num_frames)], {}
+        options = self.copy_options()
+        if options is not None:
+            times = keyframe_times(self.face)
+            key_times = {int(round((t - times[0]) * fps)): t for t in times}
+            segments = plan_segments(rendered, key_times, int(round(config.min_copy * fps)))
+        encoded = [(s, e) for kind, s, e in segments if kind == 'encode']
+        keep = np.zeros(num_frames, dtype=bool)
+        for s, e in encoded:
+            keep[s:e] = True
+        print('Re-encoding {}/{} frames in {} segment(s)'.format(keep.sum(), num_frames, len(encoded)))
+
+        def triples(frames):
+            for i, frame in zip(np.flatnonzero(keep), frames):
+                if not rendered[i]:
+                    yield None, None, frame
+                    continue
+                y1, y2, x1, x2 = coords[i]
+                yield frame[y1: y2, x1:x2], coords[i], frame
+
+        pasted = []
+        if keep.any():
+            faces = self.stage('decode', triples(self.read_frames(num_frames, keep)))
+            pasted = self.render(faces, (mel_chunks[i] for i in np.flatnonzero(keep)))
+
+        workdir = None
+        if len(segments) == 1 and segments[0][0] == 'encode':
+            outputs, audio_path, options = [self.outfile], self.audio, options or {}
+        else:
+            workdir = tempfile.mkdtemp(prefix='passthrough_')
+            outputs = [os.path.join(workdir, 'segment_{:04d}.mp4'.format(i)) for i in range(len(segments))]
+            audio_path = None
+        encode_paths = [path for path, (kind, _, _) in zip(outputs, segments) if kind == 'encode']
+
+        # The output ends with the last source frame; audio beyond it is cut
+        duration = num_frames / fps
+        out, index, written = None, 0, 0
+        try:
+            for path, (kind, s, e) in zip(outputs, segments):
+                if kind == 'copy':
+                    copy_segment(self.face, key_times[s], e - s, path)
+
+            for frames in tqdm(pasted):
+                for f in frames:
+                    if out is None:
+                        frame_h, frame_w = f.shape[:-1]
+                        out = FFmpegWriter(encode_paths[index], fps, (frame_w, frame_h), audio_path=audio_path,
+                                           codec=config.vcodec, crf=config.crf, preset=config.preset,
+                                           threads=config.encode_threads, audio_duration=duration, **options)
+                    out.write(f)
+                    written += 1
+                    if written == encoded[index][1] - encoded[index][0]:
+                        out, done = None, out
+                        done.release()
+                        index, written = index + 1, 0
+            if out is not None:
+                out, done = None, out
+                done.release()
+
+            if workdir is not None:
+                concat_segments([p for p in outputs if os.path.exists(p)], self.outfile, audio_path=self.audio,
+                                audio_duration=duration)
+        finally:
+            if out is not None:
+                out.release()
+            if workdir is not None:
+                shutil.rmtree(workdir, ignore_errors=True)
+            print('Pipeline queues:\n' + self.stats.summary())
+
+    def run(self):
+        config = self.config
+        if not os.path.isfile(self.face):
+            raise ValueError('--face argument must be a valid path to video/image file')
+
+        elif is_image_file(self.face):
+            fps = config.fps
+
+        else:
+            video_stream = cv2.VideoCapture(self.face)
+            fps = video_stream.get(cv2.CAP_PROP_FPS)
+            print ("Number of frames available for inference: "+str(int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT))))
+            video_stream.release()
+
+        extracted = None
+        if not self.audio.endswith('.wav'):
+            print('Extracting raw audio...')
+            fd, extracted = tempfile.mkstemp(suffix='.wav')
+            os.close(fd)
+            subprocess.call(['ffmpeg', '-y', '-loglevel', 'error', '-i', self.audio, '-strict', '-2', extracted])
+            self.audio = extracted
+
+        # Encoded under another name and renamed once complete, so a job that
+        # fails partway, such as a clip rejected for too few faces, leaves no
+        # partial output behind
+        outfile = self.outfile
+        root, ext = os.path.splitext(os.path.abspath(outfile))
+        fd, self.outfile = tempfile.mkstemp(dir=os.path.dirname(root), prefix=os.path.basename(root) + '.',
+                                            suffix='.tmp' + ext)
+        os.close(fd)
+        os.chmod(self.outfile, 0o644)
+        try:
+            self._run(fps)
+            os.replace(self.outfile, outfile)
+        finally:
+            if os.path.exists(self.outfile):
+                os.remove(self.outfile)
+            self.outfile = outfile
+            self._leases.close()
+            if extracted is not None:
+                os.remove(extracted)
+        return self.outfile
+
+    @staticmethod
+    def check_mel(mel):
+        if np.isnan(mel.reshape(-1)).sum() > 0:
+            raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+        return mel
+
+    def _run(self, fps):
+        config = self.config
+        if config.passthrough and not self.static:
+            # Speech detection needs the whole waveform up front
+            wav = audio.load_wav(self.audio, 16000)
+            mel = audio.melspectrogram(wav)
+            print(mel.shape)
+            self.check_mel(mel)
+            mel_chunks = audio.MelChunks(mel, fps, mel_step_size)
+            print("Length of mel chunks: {}".format(len(mel_chunks)))
+            self.run_passthrough(fps, wav, mel_chunks)
+            return
+
+        # The audio is read and turned into mel chunks block by block as the
+        # frames are rendered, so only a few blocks are ever resident
+        num_samples, blocks = audio.wav_blocks(self.audio, 16000, config.audio_block_size)
+        num_chunks = audio.num_mel_chunks(num_samples, fps, mel_step_size)
+        print("Length of mel chunks: {}".format(num_chunks))
+        mel_chunks = (self.check_mel(m) for m in audio.stream_mel_chunks(blocks, fps, mel_step_size))
+
+        # Frames are decoded lazily and never past num_chunks, so memory
+        # stays bounded by the batch sizes rather than the video length. Each
+        # stage runs on its own thread with a bounded queue to the next one.
+        batch_size = config.wav2lip_batch_size
+        reader = lambda limit: self.stage('decode', self.read_frames(limit))
+        faces = self.stage('detect', self.face_stream(num_chunks, reader=reader))
+        pasted = self.render(faces, mel_chunks)
+
+        out = None
+        try:
+            for frames in tqdm(pasted, total=int(np.ceil(float(num_chunks)/batch_size))):
+                if out is None:
+                    frame_h, frame_w = frames[0].shape[:-1]
+                    out = FFmpegWriter(self.outfile, fps, (frame_w, frame_h), audio_path=self.audio,
+                                       codec=config.vcodec, crf=config.crf, preset=config.preset,
+                                       threads=config.encode_threads)
+
+                for f in frames:
+                    out.write(f)
+        finally:
+            if out is not None:
+                out.release()
+            print('Pipeline queues:\n' + self.stats.summary())
@@ -10,6 +10,7 @@ sys.path.append('../')
 import audio
 import face_detection
 from models import Wav2Lip
+from face_tracking import smooth_track
 
 parser = argparse.ArgumentParser(description='Code to generate results for test filelists')
 
@@ -23,6 +24,8 @@ parser.add_argument('--checkpoint_path', type=str,
 
 parser.add_argument('--pads', nargs='+', type=int, default=[0, 0, 0, 0], 
 					help='Padding (top, bottom, left, right)')
+parser.add_argument('--smooth_method', type=str, default='mean', choices=['mean', 'one_euro', 'kalman'],
+					help='Temporal filter applied to the detected face boxes')
 parser.add_argument('--face_det_batch_size', type=int, 
 					help='Single GPU batch size for face detection', default=64)
 parser.add_argument('--wav2lip_batch_size', type=int, help='Batch size for Wav2Lip', default=128)
@@ -32,15 +35,6 @@ parser.add_argument('--wav2lip_batch_size', type=int, help='Batch size for Wav2L
 args = parser.parse_args()
 args.img_size = 96
 
-def get_smoothened_boxes(boxes, T):
-	for i in range(len(boxes)):
-		if i + T > len(boxes):
-			window = boxes[len(boxes) - T:]
-		else:
-			window = boxes[i : i + T]
-		boxes[i] = np.mean(window, axis=0)
-	return boxes
-
 def face_detect(images):
 	batch_size = args.face_det_batch_size
 	
@@ -71,7 +65,7 @@ def face_detect(images):
 		
 		results.append([x1, y1, x2, y2])
 
-	boxes = get_smoothened_boxes(np.array(results), T=5)
+	boxes, _ = smooth_track(np.array(results), T=5, method=args.smooth_method)
 	results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2), True] for image, (x1, y1, x2, y2) in zip(images, boxes)]
 
 	return results 
@@ -145,7 +139,7 @@ def load_model(path):
 	model.load_state_dict(new_s)
 
 	model = model.to(device)
-	return model.eval()
+	return model.eval().fuse_for_inference()
 
 model = load_model(args.checkpoint_path)
 
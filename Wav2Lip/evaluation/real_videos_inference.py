@@ -10,6 +10,7 @@ sys.path.append('../')
 import audio
 import face_detection
 from models import Wav2Lip
+from face_tracking import smooth_track
 
 parser = argparse.ArgumentParser(description='Code to generate results on ReSyncED evaluation set')
 
@@ -26,6 +27,8 @@ parser.add_argument('--checkpoint_path', type=str,
 					help='Name of saved checkpoint to load weights from', required=True)
 parser.add_argument('--pads', nargs='+', type=int, default=[0, 10, 0, 0], 
 					help='Padding (top, bottom, left, right)')
+parser.add_argument('--smooth_method', type=str, default='mean', choices=['mean', 'one_euro', 'kalman'],
+					help='Temporal filter applied to the detected face boxes')
 
 parser.add_argument('--face_det_batch_size', type=int, 
 					help='Single GPU batch size for face detection', default=16)
@@ -39,15 +42,6 @@ parser.add_argument('--max_frame_res', help='Downsample to at least this frame r
 args = parser.parse_args()
 args.img_size = 96
 
-def get_smoothened_boxes(boxes, T):
-	for i in range(len(boxes)):
-		if i + T > len(boxes):
-			window = boxes[len(boxes) - T:]
-		else:
-			window = boxes[i : i + T]
-		boxes[i] = np.mean(window, axis=0)
-	return boxes
-
 def rescale_frames(images):
 	rect = detector.get_detections_for_batch(np.array([images[0]]))[0]
 	if rect is None:
@@ -100,7 +94,7 @@ def face_detect(images):
 		
 		results.append([x1, y1, x2, y2])
 
-	boxes = get_smoothened_boxes(np.array(results), T=5)
+	boxes, _ = smooth_track(np.array(results), T=5, method=args.smooth_method)
 	results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2), True] for image, (x1, y1, x2, y2) in zip(images, boxes)]
 
 	return results, images 
@@ -192,7 +186,7 @@ def load_model(path):
 	model.load_state_dict(new_s)
 
 	model = model.to(device)
-	return model.eval()
+	return model.eval().fuse_for_inference()
 
 model = load_model(args.checkpoint_path)
 
@@ -0,0 +1,38 @@
+"""Export a Wav2Lip checkpoint to ONNX for `inference.py --backend onnx`.
+
+	python export_onnx.py --checkpoint_path checkpoints/wav2lip_gan.pth
+
+The graph has a dynamic batch size and takes the faces channels-last
+(N x 96 x 96 x 6), as the inference batch buffers hold them.
+"""
+import argparse
+import numpy as np
+import torch
+from backends import OnnxBackend, export_onnx, load_wav2lip, onnx_path_for
+from hparams import hparams as hp
+
+parser = argparse.ArgumentParser(description='Export a Wav2Lip checkpoint to ONNX')
+parser.add_argument('--checkpoint_path', type=str, required=True, help='Wav2Lip checkpoint, e.g. checkpoints/wav2lip_gan.pth')
+parser.add_argument('--outfile', type=str, default=None, help='ONNX file to write. Defaults to the checkpoint path with an .onnx suffix')
+parser.add_argument('--opset', type=int, default=17)
+parser.add_argument('--img_size', type=int, default=96)
+parser.add_argument('--check_batch_size', type=int, default=4,
+					help='Compare ONNX Runtime with PyTorch on a random batch of this size after exporting (0 skips it)')
+
+def main():
+	args = parser.parse_args()
+	outfile = args.outfile or onnx_path_for(args.checkpoint_path)
+	model = load_wav2lip(args.checkpoint_path, 'cpu')
+	export_onnx(model, outfile, args.img_size, (hp.num_mels, 16), args.opset)
+	print('Saved {}'.format(outfile))
+
+	if args.check_batch_size > 0:
+		mel = torch.randn(args.check_batch_size, 1, hp.num_mels, 16)
+		img = torch.rand(args.check_batch_size, 6, args.img_size, args.img_size)
+		with torch.no_grad():
+			expected = model(mel, img).numpy()
+		pred = OnnxBackend(outfile)(mel, img).numpy()
+		print('Max abs difference to PyTorch: {:.3g}'.format(np.abs(pred - expected).max()))
+
+if __name__ == '__main__':
+	main()
@@ -45,7 +45,7 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 
 class FaceAlignment:
     def __init__(self, landmarks_type, network_size=NetworkSize.LARGE,
-                 device='cuda', flip_input=False, face_detector='sfd', verbose=False):
+                 device='cuda', flip_input=False, face_detector='sfd', verbose=False, detector_options=None):
         self.device = device
         self.flip_input = flip_input
         self.landmarks_type = landmarks_type
@@ -56,14 +56,17 @@ class FaceAlignment:
         if 'cuda' in device:
             torch.backends.cudnn.benchmark = True
 
-        # Get the face detector
+        # Get the face detector: sfd (S3FD), cascade (OpenCV Haar/LBP) or onnx (a small ONNX model),
+        # with detector_options passed on to its constructor
         face_detector_module = __import__('face_detection.detection.' + face_detector,
                                           globals(), locals(), [face_detector], 0)
-        self.face_detector = face_detector_module.FaceDetector(device=device, verbose=verbose)
+        self.face_detector = face_detector_module.FaceDetector(device=device, verbose=verbose,
+                                                               **(detector_options or {}))
 
-    def get_detections_for_batch(self, images):
-        images = images[..., ::-1]
-        detected_faces = self.face_detector.detect_from_batch(images.copy())
+    def get_detections_for_batch(self, images, scores=False):
+        # BGR frames go to the detector as they are; it swaps channels itself.
+        # With scores, each face is (x1, y1, x2, y2, score)
+        detected_faces = self.face_detector.detect_from_batch(images, best_only=True, bgr=True)
         results = []
 
         for i, d in enumerate(detected_faces):
@@ -74,6 +77,6 @@ class FaceAlignment:
             d = np.clip(d, 0, None)
             
             x1, y1, x2, y2 = map(int, d[:-1])
-            results.append((x1, y1, x2, y2))
+            results.append((x1, y1, x2, y2, float(d[-1])) if scores else (x1, y1, x2, y2))
 
         return results
\ No newline at end of file
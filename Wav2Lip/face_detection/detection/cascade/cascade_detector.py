@@ -0,0 +1,93 @@
+import os
+import cv2
+import numpy as np
+
+from ..core import FaceDetector
+
+cascade_files = {
+    'haar': 'haarcascade_frontalface_default.xml',
+    'lbp': 'lbpcascade_frontalface_improved.xml',
+}
+
+# The opencv-python wheels only ship the Haar cascades (cv2.data.haarcascades);
+# LBP ones come with system OpenCV packages or from the OpenCV repository
+system_folders = ['/usr/share/opencv4', '/usr/local/share/opencv4', '/usr/share/opencv']
+cascades_url = 'https://github.com/opencv/opencv/tree/4.x/data'
+
+
+def find_cascade(name):
+    """Path of an OpenCV cascade file: next to this module, in the cv2 package or in a system OpenCV install."""
+    kind = name.split('_')[0] + 's'  # haarcascades or lbpcascades
+    folders = [os.path.dirname(os.path.abspath(__file__))]
+    data = getattr(cv2, 'data', None)
+    if data is not None and getattr(data, 'haarcascades', None):
+        folders.append(data.haarcascades)
+    folders += [os.path.join(folder, kind) for folder in system_folders]
+    for folder in folders:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError('{} not found in {}; download it from {}/{} and pass it with --face_detector_path, '
+                            'or put it next to {}'.format(name, ', '.join(folders), cascades_url, kind,
+                                                         os.path.basename(__file__)))
+
+
+class CascadeDetector(FaceDetector):
+    """OpenCV's Haar or LBP frontal face cascade, on the CPU.
+
+    An order of magnitude cheaper than S3FD and good enough for a single
+    frontal talking head, but it misses profiles and small faces. Faces
+    smaller than ``min_face_size`` times the shorter image side are not
+    searched for, which bounds the number of scales scanned.
+    """
+
+    def __init__(self, device, cascade='haar', path_to_detector=None, scale_factor=1.1, min_neighbors=5,
+                 min_face_size=0.1, verbose=False):
+        super(CascadeDetector, self).__init__(device, verbose)
+        if cascade not in cascade_files:
+            raise ValueError('Unknown cascade {}; expected one of {}'.format(cascade, ', '.join(cascade_files)))
+
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise ImportError('OpenCV {} has no cascade classifier; install opencv-python 4.x'.format(cv2.__version__))
+        path = path_to_detector or find_cascade(cascade_files[cascade])
+        self.face_detector = cv2.CascadeClassifier(path)
+        if self.face_detector.empty():
+            raise ValueError('Could not load the cascade {}'.format(path))
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_face_size = min_face_size
+
+    def detect_gray(self, gray):
+        """(k, 5) detections of a greyscale image, best first; the score is the cascade's level weight."""
+        size = int(self.min_face_size * min(gray.shape))
+        boxes, _, weights = self.face_detector.detectMultiScale3(
+            cv2.equalizeHist(gray), scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+            minSize=(size, size), outputRejectLevels=True)
+        if len(boxes) == 0:
+            return np.zeros((0, 5), dtype=np.float32)
+        dets = np.empty((len(boxes), 5), dtype=np.float32)
+        dets[:, :2] = boxes[:, :2]
+        dets[:, 2:4] = boxes[:, :2] + boxes[:, 2:]
+        dets[:, 4] = np.ravel(weights)
+        return dets[np.argsort(-dets[:, 4], kind='stable')]
+
+    def detect_from_image(self, tensor_or_path):
+        image = self.tensor_or_path_to_ndarray(tensor_or_path)
+        return list(self.detect_gray(cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_RGB2GRAY)))
+
+    def detect_from_batch(self, images, best_only=False, bgr=False):
+        code = cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY
+        results = [self.detect_gray(cv2.cvtColor(image, code)) for image in images]
+        return [dets[:1] for dets in results] if best_only else results
+
+    @property
+    def reference_scale(self):
+        return 195
+
+    @property
+    def reference_x_shift(self):
+        return 0
+
+    @property
+    def reference_y_shift(self):
+        return 0
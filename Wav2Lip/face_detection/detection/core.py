@@ -51,6 +51,26 @@ class FaceDetector(object):
         """
         raise NotImplementedError
 
+    def detect_from_batch(self, images, best_only=False, bgr=False):
+        """Detects faces in every image of an N x H x W x 3 batch.
+
+        Arguments:
+            images {numpy.ndarray} -- the images, RGB unless ``bgr`` is set
+
+        Keyword Arguments:
+            best_only {bool} -- return at most the highest-scoring face per image (default: {False})
+            bgr {bool} -- the images are BGR, as OpenCV decodes them (default: {False})
+
+        Returns a (k, 5) array of (x1, y1, x2, y2, score) rows per image, best
+        first. This default runs ``detect_from_image`` on each image in turn.
+        """
+        results = []
+        for image in images:
+            dets = self.detect_from_image(image[..., ::-1].copy() if bgr else image)
+            dets = np.asarray(dets, dtype=np.float32).reshape(-1, 5)
+            results.append(dets[:1] if best_only else dets)
+        return results
+
     def detect_from_directory(self, path, extensions=['.jpg', '.png'], recursive=False, show_progress_bar=True):
         """Detects faces from all the images present in a given directory.
 
@@ -0,0 +1 @@
+from .onnx_detector import OnnxDetector as FaceDetector
\ No newline at end of file
@@ -0,0 +1,95 @@
+import os
+import cv2
+import numpy as np
+
+from ..core import FaceDetector
+from ..sfd.bbox import batch_nms, best_detection
+
+# Where to download the models from; they are not fetched at run time, as
+# nothing pins their content
+models_urls = {
+    'version-RFB-320.onnx': 'https://github.com/Linzaer/Ultra-Light-Fast-Generic-Face-Detector-1MB/raw/master/models/onnx/version-RFB-320.onnx',
+    'version-RFB-640.onnx': 'https://github.com/Linzaer/Ultra-Light-Fast-Generic-Face-Detector-1MB/raw/master/models/onnx/version-RFB-640.onnx',
+}
+
+
+class OnnxDetector(FaceDetector):
+    """A small ONNX face detector run by ONNX Runtime on the CPU.
+
+    Expects the interface of the Ultra-Light-Fast-Generic-Face-Detector-1MB
+    exports: an N x 3 x H x W RGB input scaled by (x - 127) / 128 and two
+    outputs, per-anchor class probabilities (N, anchors, 2) and corner boxes
+    (N, anchors, 4) relative to the image size. The default is the RFB-320
+    model (about 1 MB) next to this module, which has to be downloaded first.
+    """
+
+    def __init__(self, device, path_to_detector=None, score_threshold=0.7, nms_threshold=0.3, threads=0,
+                 verbose=False):
+        super(OnnxDetector, self).__init__(device, verbose)
+        import onnxruntime as ort
+
+        if path_to_detector is None:
+            path_to_detector = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'version-RFB-320.onnx')
+        if not os.path.isfile(path_to_detector):
+            name = os.path.basename(path_to_detector)
+            hint = ' (download it from {})'.format(models_urls[name]) if name in models_urls else ''
+            raise FileNotFoundError('ONNX face detector {} not found{}; pass another model with '
+                                    '--face_detector_path'.format(path_to_detector, hint))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.face_detector = ort.InferenceSession(path_to_detector, options, providers=['CPUExecutionProvider'])
+        batch, _, height, width = self.face_detector.get_inputs()[0].shape
+        self.input_name = self.face_detector.get_inputs()[0].name
+        self.input_size = (width, height)
+        self.fixed_batch = batch if isinstance(batch, int) else None
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+
+    def detections(self, images, bgr):
+        """Candidates of a batch as an (anchors, N, 5) array in image coordinates, as sfd's batch_detect."""
+        width, height = self.input_size
+        inputs = np.empty((len(images), 3, height, width), dtype=np.float32)
+        for i, image in enumerate(images):
+            resized = cv2.resize(image, (width, height))
+            for c in range(3):
+                np.subtract(resized[..., 2 - c if bgr else c], np.float32(127), out=inputs[i, c])
+        inputs /= 128
+
+        step = self.fixed_batch or len(images)
+        scores, boxes = [], []
+        for i in range(0, len(images), step):
+            s, b = self.face_detector.run(None, {self.input_name: inputs[i:i + step]})
+            scores.append(s[:, :, 1])
+            boxes.append(b)
+        scores, boxes = np.concatenate(scores), np.concatenate(boxes)
+
+        h, w = images.shape[1:3]
+        dets = np.empty(boxes.shape[:2] + (5,), dtype=np.float32)
+        dets[..., :4] = boxes * np.array([w, h, w, h], dtype=np.float32)
+        dets[..., 4] = scores
+        return dets.transpose(1, 0, 2)
+
+    def detect_from_image(self, tensor_or_path):
+        image = self.tensor_or_path_to_ndarray(tensor_or_path)
+        return list(self.detect_from_batch(np.ascontiguousarray(image)[None])[0])
+
+    def detect_from_batch(self, images, best_only=False, bgr=False):
+        dets = self.detections(np.asarray(images), bgr)
+        if best_only:
+            return [np.zeros((0, 5), dtype=np.float32) if d is None else d[None]
+                    for d in best_detection(dets, self.score_threshold)]
+        return batch_nms(dets, self.nms_threshold, self.score_threshold)
+
+    @property
+    def reference_scale(self):
+        return 195
+
+    @property
+    def reference_x_shift(self):
+        return 0
+
+    @property
+    def reference_y_shift(self):
+        return 0
@@ -64,6 +64,53 @@ def nms(dets, thresh):
     return keep
 
 
+def batch_nms(dets, thresh, score_threshold=0.5, top_k=750):
+    """Greedy NMS of every image of a batch at once, with tensor ops.
+
+    ``dets`` holds (x1, y1, x2, y2, score) candidates as an (N, batch, 5)
+    array or tensor, as batch_detect returns them. Candidates scoring at most
+    ``score_threshold`` are dropped before suppression, which leaves the
+    result of ``nms`` followed by the same score cut unchanged, since a box
+    only ever suppresses lower-scoring ones. Only the ``top_k`` best of the
+    rest take part. Returns, per image, the kept rows as a (k, 5) array in
+    descending score order.
+    """
+    dets = torch.as_tensor(dets)
+    scores = dets[:, :, 4].t()
+    k = min(top_k, scores.size(1))
+    if k == 0:
+        return [np.zeros((0, 5), dtype=np.float32) for _ in range(scores.size(0))]
+    scores, order = scores.topk(k, dim=1)
+    valid = scores > score_threshold
+    k = int(valid.sum(1).max())
+    order, valid = order[:, :k], valid[:, :k]
+    boxes = dets.transpose(0, 1).gather(1, order.unsqueeze(2).expand(-1, -1, 5))
+
+    x1, y1, x2, y2 = boxes[:, :, 0], boxes[:, :, 1], boxes[:, :, 2], boxes[:, :, 3]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    w = (torch.min(x2[:, :, None], x2[:, None]) - torch.max(x1[:, :, None], x1[:, None]) + 1).clamp(min=0)
+    h = (torch.min(y2[:, :, None], y2[:, None]) - torch.max(y1[:, :, None], y1[:, None]) + 1).clamp(min=0)
+    inter = w * h
+    # suppress[b, i, j]: box i overlaps the lower-scoring box j too much
+    suppress = (inter / (areas[:, :, None] + areas[:, None] - inter) > thresh).triu(1)
+
+    keep = valid.clone()
+    for i in range(k):
+        keep &= ~(suppress[:, i] & keep[:, i:i + 1])
+    return [b[m].numpy() for b, m in zip(boxes, keep)]
+
+
+def best_detection(dets, score_threshold=0.5):
+    """The highest-scoring candidate of each image of an (N, batch, 5) batch, or None.
+
+    This is the first box ``batch_nms`` would keep, found without suppression.
+    """
+    dets = torch.as_tensor(dets)
+    scores, index = dets[:, :, 4].max(0)
+    return [dets[i, b].numpy() if s > score_threshold else None
+            for b, (s, i) in enumerate(zip(scores.tolist(), index.tolist()))]
+
+
 def encode(matched, priors, variances):
     """Encode the variances from the priorbox layers into the ground truth boxes
     we have matched (based on jaccard overlap) with the prior boxes.
@@ -3,6 +3,7 @@ import torch.nn.functional as F
 
 import os
 import sys
+import functools
 import cv2
 import random
 import datetime
@@ -16,82 +17,102 @@ from .net_s3fd import s3fd
 from .bbox import *
 
 
-def detect(net, img, device):
-    img = img - np.array([104, 117, 123])
-    img = img.transpose(2, 0, 1)
-    img = img.reshape((1,) + img.shape)
+# Variances the S3FD regression outputs were encoded with
+VARIANCES = [0.1, 0.2]
 
-    if 'cuda' in device:
-        torch.backends.cudnn.benchmark = True
+# At most the three highest-resolution heads (strides 4 to 16) are skipped,
+# so the coarse heads still find faces much larger than expected
+SKIPPABLE_HEADS = 3
 
-    img = torch.from_numpy(img).float().to(device)
-    BB, CC, HH, WW = img.size()
-    with torch.no_grad():
-        olist = net(img)
 
-    bboxlist = []
-    for i in range(len(olist) // 2):
-        olist[i * 2] = F.softmax(olist[i * 2], dim=1)
-    olist = [oelem.data.cpu() for oelem in olist]
+def first_head(min_face_size):
+    """Index of the first S3FD head needed to find faces at least ``min_face_size`` pixels wide.
+
+    Head i has stride 2**(i + 2) and anchors four times that (16 to 512
+    pixels). Faces are matched to anchors of about their own size, so a head
+    whose anchors are at most half the smallest face is skipped.
+    """
+    head = 0
+    while head < SKIPPABLE_HEADS and 2 * 4 * 2**(head + 2) <= min_face_size:
+        head += 1
+    return head
+
+
+@functools.lru_cache(maxsize=64)
+def prior_grid(height, width, stride):
+    """Anchor boxes (cx, cy, w, h) of every cell of a height x width feature map, row-major.
+
+    Cached per feature map size, so each input resolution builds its grid once.
+    """
+    ys, xs = torch.meshgrid(torch.arange(height, dtype=torch.float32), torch.arange(width, dtype=torch.float32),
+                            indexing='ij')
+    priors = torch.empty((height * width, 4))
+    priors[:, 0] = stride / 2 + xs.reshape(-1) * stride
+    priors[:, 1] = stride / 2 + ys.reshape(-1) * stride
+    priors[:, 2:] = stride * 4
+    return priors
+
+
+def decode_batch(olist, threshold=0.05):
+    """Decode the (softmaxed) S3FD head outputs of a batch into candidate boxes.
+
+    Every anchor whose face score is above ``threshold`` in any image gives
+    one row, once per image it passes in, holding the (x1, y1, x2, y2, score)
+    of that anchor in each image of the batch. Rows are ordered by head, then
+    image, then anchor, so the result is a (rows, batch, 5) array. Heads
+    whose outputs are None were skipped and give no rows.
+    """
+    batch_size = olist[-1].size(0)
+    rows = []
     for i in range(len(olist) // 2):
         ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+        if ocls is None:
+            continue
         FB, FC, FH, FW = ocls.size()  # feature map size
         stride = 2**(i + 2)    # 4,8,16,32,64,128
-        anchor = stride * 4
-        poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
-        for Iindex, hindex, windex in poss:
-            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
-            score = ocls[0, 1, hindex, windex]
-            loc = oreg[0, :, hindex, windex].contiguous().view(1, 4)
-            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]])
-            variances = [0.1, 0.2]
-            box = decode(loc, priors, variances)
-            x1, y1, x2, y2 = box[0] * 1.0
-            # cv2.rectangle(imgshow,(int(x1),int(y1)),(int(x2),int(y2)),(0,0,255),1)
-            bboxlist.append([x1, y1, x2, y2, score])
-    bboxlist = np.array(bboxlist)
-    if 0 == len(bboxlist):
-        bboxlist = np.zeros((1, 5))
-
-    return bboxlist
-
-def batch_detect(net, imgs, device):
-    imgs = imgs - np.array([104, 117, 123])
-    imgs = imgs.transpose(0, 3, 1, 2)
-
+        _, hindex, windex = torch.nonzero(ocls[:, 1, :, :] > threshold, as_tuple=True)
+        if len(hindex) == 0:
+            continue
+        priors = prior_grid(FH, FW, stride)[hindex * FW + windex].unsqueeze(1)
+        loc = oreg[:, :, hindex, windex].permute(2, 0, 1)
+        boxes = batch_decode(loc, priors, VARIANCES)
+        scores = ocls[:, 1, hindex, windex].t().unsqueeze(2)
+        rows.append(torch.cat([boxes, scores], 2))
+    if len(rows) == 0:
+        return np.zeros((1, batch_size, 5))
+    return torch.cat(rows).numpy()
+
+
+def head_outputs(net, imgs, device, bgr=False, min_face_size=0):
+    """Run S3FD on an N x H x W x 3 batch, returning its head outputs on the CPU with class scores softmaxed.
+
+    uint8 images are copied to the device as they are and normalised by the
+    network; other dtypes are normalised here first. The heads only needed
+    for faces smaller than ``min_face_size`` pixels are skipped (None).
+    """
     if 'cuda' in device:
         torch.backends.cudnn.benchmark = True
 
-    imgs = torch.from_numpy(imgs).float().to(device)
-    BB, CC, HH, WW = imgs.size()
+    if imgs.dtype == np.uint8:
+        imgs = torch.from_numpy(np.ascontiguousarray(imgs)).to(device)
+    else:
+        if bgr:
+            imgs = imgs[..., ::-1]
+        imgs = imgs - np.array([104, 117, 123])
+        imgs = torch.from_numpy(imgs.transpose(0, 3, 1, 2)).float().to(device)
     with torch.no_grad():
-        olist = net(imgs)
+        olist = net(imgs, bgr=bgr, first_head=first_head(min_face_size))
 
-    bboxlist = []
-    for i in range(len(olist) // 2):
-        olist[i * 2] = F.softmax(olist[i * 2], dim=1)
-    olist = [oelem.data.cpu() for oelem in olist]
     for i in range(len(olist) // 2):
-        ocls, oreg = olist[i * 2], olist[i * 2 + 1]
-        FB, FC, FH, FW = ocls.size()  # feature map size
-        stride = 2**(i + 2)    # 4,8,16,32,64,128
-        anchor = stride * 4
-        poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
-        for Iindex, hindex, windex in poss:
-            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
-            score = ocls[:, 1, hindex, windex]
-            loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
-            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
-            variances = [0.1, 0.2]
-            box = batch_decode(loc, priors, variances)
-            box = box[:, 0] * 1.0
-            # cv2.rectangle(imgshow,(int(x1),int(y1)),(int(x2),int(y2)),(0,0,255),1)
-            bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).cpu().numpy())
-    bboxlist = np.array(bboxlist)
-    if 0 == len(bboxlist):
-        bboxlist = np.zeros((1, BB, 5))
+        if olist[i * 2] is not None:
+            olist[i * 2] = F.softmax(olist[i * 2], dim=1)
+    return [None if oelem is None else oelem.data.cpu() for oelem in olist]
 
-    return bboxlist
+def detect(net, img, device, bgr=False, min_face_size=0):
+    return decode_batch(head_outputs(net, img[None], device, bgr, min_face_size))[:, 0]
+
+def batch_detect(net, imgs, device, bgr=False, min_face_size=0):
+    return decode_batch(head_outputs(net, imgs, device, bgr, min_face_size))
 
 def flip_detect(net, img, device):
     img = cv2.flip(img, 1)
@@ -10,8 +10,7 @@ class L2Norm(nn.Module):
         self.scale = scale
         self.eps = 1e-10
         self.weight = nn.Parameter(torch.Tensor(self.n_channels))
-        self.weight.data *= 0.0
-        self.weight.data += self.scale
+        self.weight.data.fill_(self.scale)
 
     def forward(self, x):
         norm = x.pow(2).sum(dim=1, keepdim=True).sqrt() + self.eps
@@ -20,6 +19,9 @@ class L2Norm(nn.Module):
 
 
 class s3fd(nn.Module):
+    # Per-channel mean of the RGB training images
+    mean = (104., 117., 123.)
+
     def __init__(self):
         super(s3fd, self).__init__()
         self.conv1_1 = nn.Conv2d(3, 64, kernel_size=3, stride=1, padding=1)
@@ -67,7 +69,32 @@ class s3fd(nn.Module):
         self.conv7_2_mbox_conf = nn.Conv2d(256, 2, kernel_size=3, stride=1, padding=1)
         self.conv7_2_mbox_loc = nn.Conv2d(256, 4, kernel_size=3, stride=1, padding=1)
 
-    def forward(self, x):
+    def normalize(self, x, bgr=False):
+        """uint8 N x H x W x 3 images to the mean-subtracted float32 NCHW input of the network.
+
+        The channel swap (for ``bgr`` images), mean subtraction and conversion
+        happen in one pass per channel into a single float32 buffer, stored
+        channels-last so the result is a permuted view of it.
+        """
+        out = torch.empty(x.shape, dtype=torch.float32, device=x.device)
+        for c, mean in enumerate(self.mean):
+            torch.sub(x[..., 2 - c if bgr else c], mean, out=out[..., c])
+        return out.permute(0, 3, 1, 2)
+
+    def forward(self, x, bgr=False, first_head=0):
+        """Class scores and box regressions of the six detection heads.
+
+        ``x`` is either the normalised float NCHW input or a uint8 NHWC batch
+        of RGB images (BGR with ``bgr``), which is normalised here. The
+        classifier and regressor of the heads before ``first_head`` (and
+        their L2 normalisation) are not run; their outputs are None.
+        """
+        if x.dtype == torch.uint8:
+            x = self.normalize(x, bgr)
+        return self.heads(*self.features(x), first_head=first_head)
+
+    def features(self, x):
+        """The VGG trunk: the six feature maps the detection heads read, finest first."""
         h = F.relu(self.conv1_1(x))
         h = F.relu(self.conv1_2(h))
         h = F.max_pool2d(h, 2, 2)
@@ -103,17 +130,28 @@ class s3fd(nn.Module):
         h = F.relu(self.conv7_1(h))
         h = F.relu(self.conv7_2(h))
         f7_2 = h
-
-        f3_3 = self.conv3_3_norm(f3_3)
-        f4_3 = self.conv4_3_norm(f4_3)
-        f5_3 = self.conv5_3_norm(f5_3)
-
-        cls1 = self.conv3_3_norm_mbox_conf(f3_3)
-        reg1 = self.conv3_3_norm_mbox_loc(f3_3)
-        cls2 = self.conv4_3_norm_mbox_conf(f4_3)
-        reg2 = self.conv4_3_norm_mbox_loc(f4_3)
-        cls3 = self.conv5_3_norm_mbox_conf(f5_3)
-        reg3 = self.conv5_3_norm_mbox_loc(f5_3)
+        return f3_3, f4_3, f5_3, ffc7, f6_2, f7_2
+
+    def heads(self, f3_3, f4_3, f5_3, ffc7, f6_2, f7_2, first_head=0):
+        """Class scores and box regressions of the detection heads from the trunk's feature maps."""
+        cls1 = reg1 = cls2 = reg2 = cls3 = reg3 = None
+        if first_head <= 0:
+            f3_3 = self.conv3_3_norm(f3_3)
+            cls1 = self.conv3_3_norm_mbox_conf(f3_3)
+            reg1 = self.conv3_3_norm_mbox_loc(f3_3)
+
+            # max-out background label
+            chunk = torch.chunk(cls1, 4, 1)
+            bmax = torch.max(torch.max(chunk[0], chunk[1]), chunk[2])
+            cls1 = torch.cat([bmax, chunk[3]], dim=1)
+        if first_head <= 1:
+            f4_3 = self.conv4_3_norm(f4_3)
+            cls2 = self.conv4_3_norm_mbox_conf(f4_3)
+            reg2 = self.conv4_3_norm_mbox_loc(f4_3)
+        if first_head <= 2:
+            f5_3 = self.conv5_3_norm(f5_3)
+            cls3 = self.conv5_3_norm_mbox_conf(f5_3)
+            reg3 = self.conv5_3_norm_mbox_loc(f5_3)
         cls4 = self.fc7_mbox_conf(ffc7)
         reg4 = self.fc7_mbox_loc(ffc7)
         cls5 = self.conv6_2_mbox_conf(f6_2)
@@ -121,9 +159,4 @@ class s3fd(nn.Module):
         cls6 = self.conv7_2_mbox_conf(f7_2)
         reg6 = self.conv7_2_mbox_loc(f7_2)
 
-        # max-out background label
-        chunk = torch.chunk(cls1, 4, 1)
-        bmax = torch.max(torch.max(chunk[0], chunk[1]), chunk[2])
-        cls1 = torch.cat([bmax, chunk[3]], dim=1)
-
         return [cls1, reg1, cls2, reg2, cls3, reg3, cls4, reg4, cls5, reg5, cls6, reg6]
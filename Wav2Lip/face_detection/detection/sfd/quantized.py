@@ -0,0 +1,153 @@
+import copy
+import os
+import platform
+import tempfile
+import warnings
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao import quantization as tq
+
+from .net_s3fd import s3fd
+
+# The repository's sample talking-head video, calibrated on when no frames are given
+CALIBRATION_VIDEOS = [os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    os.pardir, os.pardir, os.pardir, os.pardir, 'class3.mp4'))]
+
+# The VGG trunk of s3fd.features in stages, each ending at a feature map a
+# detection head reads; 'pool' is a 2x2 max pooling
+STAGES = [
+    ['conv1_1', 'conv1_2', 'pool', 'conv2_1', 'conv2_2', 'pool', 'conv3_1', 'conv3_2', 'conv3_3'],
+    ['pool', 'conv4_1', 'conv4_2', 'conv4_3'],
+    ['pool', 'conv5_1', 'conv5_2', 'conv5_3'],
+    ['pool', 'fc6', 'fc7'],
+    ['conv6_1', 'conv6_2'],
+    ['conv7_1', 'conv7_2'],
+]
+
+
+def default_backend():
+    """fbgemm on x86 CPUs, qnnpack on ARM ones."""
+    return 'qnnpack' if platform.machine().lower() in ('arm64', 'aarch64') else 'fbgemm'
+
+
+class QuantizedS3FD(nn.Module):
+    """S3FD with its VGG trunk in int8, for post-training static quantization.
+
+    The trunk, which does nearly all of the work, is rebuilt from the
+    network's convolutions as Conv+ReLU stages that fuse and quantize; its
+    feature maps are dequantized for the L2 normalisations and detection
+    heads, which stay in float. Called like s3fd, with the same outputs.
+    """
+
+    def __init__(self, net):
+        super(QuantizedS3FD, self).__init__()
+        net = copy.deepcopy(net)
+        self.quant = tq.QuantStub()
+        self.dequant = tq.DeQuantStub()
+        self.stages = nn.ModuleList()
+        for names in STAGES:
+            layers = []
+            for name in names:
+                if name == 'pool':
+                    layers.append(nn.MaxPool2d(2, 2))
+                else:
+                    layers += [getattr(net, name), nn.ReLU(inplace=True)]
+                    delattr(net, name)
+            self.stages.append(nn.Sequential(*layers))
+        # What is left of the network: the input normalisation and the heads
+        self.net = net
+
+    def fuse(self):
+        for stage in self.stages:
+            pairs = [[str(i), str(i + 1)] for i, layer in enumerate(stage) if isinstance(layer, nn.Conv2d)]
+            tq.fuse_modules(stage, pairs, inplace=True)
+        return self
+
+    def forward(self, x, bgr=False, first_head=0):
+        if x.dtype == torch.uint8:
+            x = self.net.normalize(x, bgr)
+        h = self.quant(x)
+        features = []
+        for stage in self.stages:
+            h = stage(h)
+            features.append(self.dequant(h))
+        return self.net.heads(*features, first_head=first_head)
+
+
+def prepare(net, backend):
+    """A fused QuantizedS3FD of ``net`` with observers on the trunk, ready for calibration."""
+    torch.backends.quantized.engine = backend
+    model = QuantizedS3FD(net).eval().fuse()
+    qconfig = tq.get_default_qconfig(backend)
+    model.quant.qconfig = qconfig
+    model.stages.qconfig = qconfig
+    model.dequant.qconfig = qconfig
+    return tq.prepare(model)
+
+
+def calibration_frames(videos=None, count=16):
+    """``count`` BGR frames spread evenly over each of ``videos`` (CALIBRATION_VIDEOS by default)."""
+    frames = []
+    for video in videos or CALIBRATION_VIDEOS:
+        if not os.path.isfile(video):
+            raise FileNotFoundError('Calibration video {} not found'.format(video))
+        stream = cv2.VideoCapture(video)
+        total = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in np.linspace(0, max(total - 1, 0), count).astype(int):
+            stream.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ok, frame = stream.read()
+            if ok:
+                frames.append(frame)
+        stream.release()
+    return frames
+
+
+def quantize(net, frames, backend=None, batch_size=1):
+    """Post-training static int8 quantization of ``net``, calibrated on BGR uint8 ``frames`` of one size."""
+    model = prepare(net, backend or default_backend())
+    with torch.no_grad():
+        for i in range(0, len(frames), batch_size):
+            model(torch.from_numpy(np.ascontiguousarray(frames[i:i + batch_size])), bgr=True)
+    return tq.convert(model)
+
+
+def load_quantized(path, backend=None):
+    """A quantized S3FD saved from the state_dict of quantize()'s result."""
+    with warnings.catch_warnings():
+        # The observers are never run; the saved scales and zero points replace their defaults
+        warnings.simplefilter('ignore', UserWarning)
+        model = tq.convert(prepare(s3fd(), backend or default_backend()))
+    model.load_state_dict(torch.load(path))
+    return model
+
+
+def cached_quantized(net, weights_path, backend=None, videos=None):
+    """The quantized ``net``, read from the int8 file next to ``weights_path`` or calibrated and saved there.
+
+    The cache is rebuilt when the float weights are newer than it.
+    """
+    backend = backend or default_backend()
+    path = os.path.splitext(weights_path)[0] + '.int8-{}.pth'.format(backend)
+    if os.path.isfile(path) and not (os.path.isfile(weights_path) and
+                                     os.path.getmtime(weights_path) > os.path.getmtime(path)):
+        return load_quantized(path, backend)
+
+    frames = calibration_frames(videos)
+    size = (frames[0].shape[1], frames[0].shape[0])
+    model = quantize(net, np.array([cv2.resize(f, size) for f in frames]), backend)
+    # Saved under another name and renamed, so another process leasing the
+    # detector never loads a partly written cache
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(model.state_dict(), f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return model
@@ -5,6 +5,7 @@ from torch.utils.model_zoo import load_url
 from ..core import FaceDetector
 
 from .net_s3fd import s3fd
+from .quantized import cached_quantized
 from .bbox import *
 from .detect import *
 
@@ -14,8 +15,22 @@ models_urls = {
 
 
 class SFDDetector(FaceDetector):
-    def __init__(self, device, path_to_detector=os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.pth'), verbose=False):
+    """S3FD. With ``min_face_size`` (in pixels of the images passed in) the
+    detection heads only needed for smaller faces are neither run nor decoded.
+
+    ``quantize`` runs it in int8 on the CPU (see quantized.py): True picks
+    the quantization backend for this CPU, or name one (fbgemm, x86,
+    qnnpack). The int8 weights are calibrated on the frames of
+    ``calibration_videos`` (the sample video by default) the first time and
+    cached next to the float ones.
+    """
+
+    def __init__(self, device, path_to_detector=os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.pth'),
+                 min_face_size=0, quantize=False, calibration_videos=None, verbose=False):
         super(SFDDetector, self).__init__(device, verbose)
+        self.min_face_size = min_face_size
+        if quantize and device != 'cpu':
+            raise ValueError('Quantized S3FD only runs on the CPU, not {}'.format(device))
 
         # Initialise the face detector
         if not os.path.isfile(path_to_detector):
@@ -25,26 +40,32 @@ class SFDDetector(FaceDetector):
 
         self.face_detector = s3fd()
         self.face_detector.load_state_dict(model_weights)
+        if quantize:
+            self.face_detector = cached_quantized(self.face_detector.eval(), path_to_detector,
+                                                  None if quantize is True else quantize, calibration_videos)
         self.face_detector.to(device)
         self.face_detector.eval()
 
     def detect_from_image(self, tensor_or_path):
         image = self.tensor_or_path_to_ndarray(tensor_or_path)
 
-        bboxlist = detect(self.face_detector, image, device=self.device)
-        keep = nms(bboxlist, 0.3)
-        bboxlist = bboxlist[keep, :]
-        bboxlist = [x for x in bboxlist if x[-1] > 0.5]
-
-        return bboxlist
+        bboxlist = detect(self.face_detector, image, device=self.device, min_face_size=self.min_face_size)
+        return list(batch_nms(bboxlist[:, None], 0.3)[0])
 
-    def detect_from_batch(self, images):
-        bboxlists = batch_detect(self.face_detector, images, device=self.device)
-        keeps = [nms(bboxlists[:, i, :], 0.3) for i in range(bboxlists.shape[1])]
-        bboxlists = [bboxlists[keep, i, :] for i, keep in enumerate(keeps)]
-        bboxlists = [[x for x in bboxlist if x[-1] > 0.5] for bboxlist in bboxlists]
+    def detect_from_batch(self, images, best_only=False, bgr=False):
+        """Faces of each image as (k, 5) arrays of (x1, y1, x2, y2, score), best first.
 
-        return bboxlists
+        ``images`` is an N x H x W x 3 batch, RGB unless ``bgr`` is set;
+        uint8 batches go to the network without any host-side conversion.
+        With ``best_only`` only the highest-scoring face of each image is
+        returned (an empty array when there is none), skipping NMS.
+        """
+        bboxlists = batch_detect(self.face_detector, images, device=self.device, bgr=bgr,
+                                 min_face_size=self.min_face_size)
+        if best_only:
+            return [np.zeros((0, 5), dtype=np.float32) if d is None else d[None]
+                    for d in best_detection(bboxlists)]
+        return batch_nms(bboxlists, 0.3)
 
     @property
     def reference_scale(self):
@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import torch
+
+from .api import FaceAlignment, LandmarksType
+
+
+class _Entry(object):
+    def __init__(self, idle_timeout):
+        self.detector = None
+        self.users = 0
+        self.last_used = time.monotonic()
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+
+
+class DetectorPool(object):
+    """Process-wide FaceAlignment instances, shared by everything that detects faces.
+
+        with detector_pool.lease('cuda:0', 'sfd') as detector:
+            boxes = detector.get_detections_for_batch(frames)
+
+    There is one detector per device, detector module and set of detector
+    options, built the first time it is leased, so the weights are read from
+    disk once however many clips or threads use it. Detectors nobody has
+    leased for ``idle_timeout`` seconds are dropped by a background timer and
+    loaded again on their next lease; None keeps them until release_idle().
+    """
+
+    def __init__(self, idle_timeout=300.):
+        self.idle_timeout = idle_timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._due = None
+
+    @staticmethod
+    def key(device, face_detector='sfd', **options):
+        return device, face_detector, tuple(sorted(options.items()))
+
+    @contextmanager
+    def lease(self, device, face_detector='sfd', idle_timeout=None, **options):
+        """The shared FaceAlignment for ``device``, ``face_detector`` and detector ``options``.
+
+        ``idle_timeout`` overrides the pool's for this detector. Leases of the
+        same detector from several threads share one instance.
+        """
+        key = self.key(device, face_detector, **options)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(self.idle_timeout)
+            if idle_timeout is not None:
+                entry.idle_timeout = idle_timeout
+            entry.users += 1
+
+        try:
+            with entry.lock:
+                if entry.detector is None:
+                    entry.detector = FaceAlignment(LandmarksType._2D, flip_input=False, device=device,
+                                                   face_detector=face_detector, detector_options=options)
+            yield entry.detector
+        finally:
+            with self._lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+                if entry.detector is None and entry.users == 0:
+                    self._entries.pop(key, None)
+                self._schedule()
+
+    def loaded(self):
+        """Keys of the detectors currently in memory."""
+        with self._lock:
+            return [key for key, entry in self._entries.items() if entry.detector is not None]
+
+    def release_idle(self, older_than=0.):
+        """Drop the detectors nobody has leased for ``older_than`` seconds; returns how many."""
+        with self._lock:
+            return self._evict(lambda entry, idle: idle >= older_than)
+
+    def _evict(self, expired):
+        """Remove the unleased entries ``expired(entry, idle_seconds)`` selects. Called with the lock held."""
+        now = time.monotonic()
+        keys = [key for key, entry in self._entries.items()
+                if entry.users == 0 and expired(entry, now - entry.last_used)]
+        for key in keys:
+            del self._entries[key]
+        if any(key[0].startswith('cuda') for key in keys):
+            torch.cuda.empty_cache()
+        return len(keys)
+
+    def _schedule(self):
+        """Time the next idle detector to expire, unless a timer is due before it. Called with the lock held."""
+        due = [entry.last_used + entry.idle_timeout
+               for entry in self._entries.values() if entry.users == 0 and entry.idle_timeout is not None]
+        if not due or (self._timer is not None and self._due <= min(due)):
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._due = min(due)
+        self._timer = threading.Timer(max(0., self._due - time.monotonic()), self._expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+            self._due = None
+            self._evict(lambda entry, idle: entry.idle_timeout is not None and idle >= entry.idle_timeout)
+            self._schedule()
+
+
+detector_pool = DetectorPool()
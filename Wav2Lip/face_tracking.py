@@ -0,0 +1,370 @@
+from collections import deque
+
+import numpy as np
+import cv2
+from scipy import signal
+
+
+def box_iou(a, b):
+    """IoU between two (x1, y1, x2, y2) boxes, or between matching rows of two N x 4 arrays."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    union = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1]) + (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1]) - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def proxy_scale(face_size, frame_shape, face_res, min_side):
+    """Scale (at most 1) of the low-resolution proxy to detect faces of ``face_size`` pixels on.
+
+    Faces come out at about ``face_res`` pixels, but the proxy's shorter side
+    is never smaller than ``min_side`` pixels.
+    """
+    scale = max(face_res / max(face_size, 1), min_side / min(frame_shape[:2]))
+    return min(1., scale)
+
+
+def scale_box(box, sx, sy):
+    """An (x1, y1, x2, y2, ...) box detected on a proxy, in frame pixels; ``sx`` and ``sy`` are frame / proxy sizes.
+
+    Anything after the corners, such as a score, is kept as it is.
+    """
+    x1, y1, x2, y2 = box[:4]
+    return (int(round(x1 * sx)), int(round(y1 * sy)), int(round(x2 * sx)), int(round(y2 * sy))) + tuple(box[4:])
+
+
+def roi_around(box, frame_shape, margin, bucket=32):
+    """(x1, y1, x2, y2) region of a frame to look for the face of ``box`` in on the next frames.
+
+    The box is grown by ``margin`` times its larger side on every side, and
+    the region's sides are rounded up to multiples of ``bucket`` pixels (or
+    the frame size), so faces of similar size give crops of the same size.
+    """
+    height, width = frame_shape[:2]
+    x1, y1, x2, y2 = box[:4]
+    side = max(x2 - x1, y2 - y1) * (1 + 2 * margin)
+    w = min(width, int(np.ceil(max(side, x2 - x1) / bucket)) * bucket)
+    h = min(height, int(np.ceil(max(side, y2 - y1) / bucket)) * bucket)
+    left = int(np.clip(round((x1 + x2 - w) / 2), 0, width - w))
+    top = int(np.clip(round((y1 + y2 - h) / 2), 0, height - h))
+    return left, top, left + w, top + h
+
+
+def inside_roi(box, roi, frame_shape, border=2):
+    """Whether ``box`` lies inside ``roi``, away from its edges other than the frame's.
+
+    A box touching an inner edge of the region is likely cut off by it.
+    """
+    height, width = frame_shape[:2]
+    x1, y1, x2, y2 = box[:4]
+    rx1, ry1, rx2, ry2 = roi
+    return ((rx1 == 0 or x1 > rx1 + border) and (ry1 == 0 or y1 > ry1 + border) and
+            (rx2 == width or x2 < rx2 - border) and (ry2 == height or y2 < ry2 - border))
+
+
+def _thumbnail(frame, size=32):
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def select_keyframes(thumbs, every, motion_threshold, first=0):
+    """Indices to run the detector on: every ``every`` frames, whenever the mean
+    absolute difference to the previous keyframe's thumbnail exceeds
+    ``motion_threshold``, and always the first and last frame."""
+    keys = [first]
+    for i in range(first + 1, len(thumbs)):
+        if i - keys[-1] >= every or np.abs(thumbs[i] - thumbs[keys[-1]]).mean() > motion_threshold:
+            keys.append(i)
+    if keys[-1] != len(thumbs) - 1:
+        keys.append(len(thumbs) - 1)
+    return keys
+
+
+def _needs_split(a, b, iou_threshold):
+    if (a is None) != (b is None):
+        return True
+    return a is not None and box_iou(a, b) < iou_threshold
+
+
+def _interpolate(a, b, n):
+    if a is None or b is None:
+        return [None] * n
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return [tuple(int(v) for v in np.rint(a + (b - a) * t)) for t in np.arange(1, n + 1) / float(n + 1)]
+
+
+def track_window(frames, detect, every, motion_threshold=10., iou_threshold=0.7, known=None):
+    """Boxes for every frame of ``frames`` from detections on keyframes only.
+
+    ``detect(images)`` returns one (x1, y1, x2, y2) box or None per image.
+    Keyframes are picked by :func:`select_keyframes`; the gap between two
+    keyframes is bisected with further detections while their boxes drift
+    apart (IoU below ``iou_threshold``) or a face appears or disappears, and
+    the remaining frames are linearly interpolated. ``known`` maps frame
+    indices to boxes that are already detected.
+    """
+    boxes = dict(known or {})
+    thumbs = [_thumbnail(f) for f in frames]
+    pending = [i for i in select_keyframes(thumbs, every, motion_threshold) if i not in boxes]
+
+    while pending:
+        for i, box in zip(pending, detect([frames[i] for i in pending])):
+            boxes[i] = box
+        keys = sorted(boxes)
+        pending = [(a + b) // 2 for a, b in zip(keys, keys[1:])
+                   if b - a > 1 and _needs_split(boxes[a], boxes[b], iou_threshold)]
+
+    keys = sorted(boxes)
+    results = [boxes[keys[0]]]
+    for a, b in zip(keys, keys[1:]):
+        results.extend(_interpolate(boxes[a], boxes[b], b - a - 1))
+        results.append(boxes[b])
+    return results
+
+
+def keyframe_stream(frames, detect, every, window, motion_threshold=10., iou_threshold=0.7):
+    """Yield (frame, box) pairs, detecting on keyframes chosen over windows of ``window`` frames.
+
+    The last keyframe of each window is carried over as the first frame of the
+    next one, so interpolation is continuous across window boundaries.
+    """
+    buf, known = [], {}
+    for frame in frames:
+        buf.append(frame)
+        if len(buf) > window:
+            boxes = track_window(buf, detect, every, motion_threshold, iou_threshold, known)
+            for pair in zip(buf[:-1], boxes[:-1]):
+                yield pair
+            buf, known = buf[-1:], {0: boxes[-1]}
+
+    if len(buf) > len(known):
+        boxes = track_window(buf, detect, every, motion_threshold, iou_threshold, known)
+        for pair in zip(buf, boxes):
+            yield pair
+    elif buf:
+        yield buf[0], known[0]
+
+
+def _forward_means(boxes, T, count):
+    """Mean of boxes[j:j + T] for j < count; windows running past the end are shortened."""
+    csum = np.concatenate([np.zeros((1,) + boxes.shape[1:]), np.cumsum(boxes, axis=0, dtype=np.float64)])
+    j = np.arange(count)
+    end = np.minimum(j + T, len(boxes))
+    return (csum[end] - csum[j]) / (end - j)[:, None]
+
+
+def get_smoothened_boxes(boxes, T):
+    """Replace each box by the mean of itself and the next T - 1 boxes, in place.
+
+    Vectorised with a cumulative sum, so it is O(N) regardless of T. The last
+    T - 1 boxes share the final window and are averaged sequentially, exactly
+    as the original per-frame loop did (including truncation for int arrays).
+    """
+    n = len(boxes)
+    body = max(0, n - T + 1)
+    if body > 0:
+        boxes[:body] = _forward_means(boxes, T, body)
+    for i in range(body, n):
+        boxes[i] = np.mean(boxes[n - T:], axis=0)
+    return boxes
+
+
+def one_euro_filter(boxes, rate=25., min_cutoff=1., beta=0.007, d_cutoff=1.):
+    """One-Euro filter (Casiez et al., 2012): little smoothing while the box
+    moves fast, strong smoothing while it is still. Causal, O(N)."""
+    x = np.asarray(boxes, dtype=np.float64)
+    out = np.empty_like(x)
+    if len(x) == 0:
+        return out
+
+    k = rate / (2 * np.pi)
+    alpha_d = 1. / (1. + k / d_cutoff)
+    for c in range(x.shape[1]):
+        col = x[:, c].tolist()
+        res = [col[0]]
+        prev, dprev = col[0], 0.
+        for v in col[1:]:
+            dprev += alpha_d * ((v - prev) * rate - dprev)
+            prev += (v - prev) / (1. + k / (min_cutoff + beta * abs(dprev)))
+            res.append(prev)
+        out[:, c] = res
+    return out
+
+
+def kalman_smooth(boxes, process_noise=1., measurement_noise=4.):
+    """Constant-velocity Kalman smoother run forwards and backwards.
+
+    Uses the steady-state gains of the filter (an alpha-beta filter, Kalata
+    1984), which turn it into a fixed IIR filter that scipy applies to all
+    coordinates at once.
+    """
+    x = np.asarray(boxes, dtype=np.float64)
+    if len(x) < 10:
+        return x.copy()
+
+    lam = process_noise / float(measurement_noise)
+    r = (4 + lam - np.sqrt(8 * lam + lam ** 2)) / 4
+    alpha = 1 - r ** 2
+    beta = 2 * (2 - alpha) - 4 * np.sqrt(1 - alpha)
+    return signal.filtfilt([alpha, beta - alpha], [1., alpha + beta - 2, 1 - alpha], x, axis=0)
+
+
+def reject_outliers(boxes, valid, T=5, threshold=0.5):
+    """Mark boxes invalid whose coordinates stray from the median of their T
+    neighbouring valid boxes by more than ``threshold`` times the face size."""
+    valid = np.array(valid, dtype=bool)
+    idx = np.flatnonzero(valid)
+    if len(idx) < T:
+        return valid
+
+    b = np.asarray(boxes, dtype=np.float64)[idx]
+    padded = np.pad(b, ((T // 2, T - 1 - T // 2), (0, 0)), mode='edge')
+    median = np.median(np.lib.stride_tricks.sliding_window_view(padded, T, axis=0), axis=-1)
+    size = np.maximum(median[:, 2] - median[:, 0], median[:, 3] - median[:, 1])
+    valid[idx[np.abs(b - median).max(axis=1) > threshold * size]] = False
+    return valid
+
+
+def fill_gaps(boxes, valid, max_gap):
+    """Linearly interpolate boxes across runs of at most ``max_gap`` invalid frames."""
+    boxes = np.array(boxes, dtype=np.float64)
+    valid = np.array(valid, dtype=bool)
+    n = len(valid)
+    if max_gap <= 0 or valid.all() or not valid.any():
+        return boxes, valid
+
+    idx = np.arange(n)
+    prev_valid = np.maximum.accumulate(np.where(valid, idx, -1))
+    next_valid = np.minimum.accumulate(np.where(valid, idx, n)[::-1])[::-1]
+    fill = ~valid & (prev_valid >= 0) & (next_valid < n) & (next_valid - prev_valid - 1 <= max_gap)
+
+    known = np.flatnonzero(valid)
+    for c in range(boxes.shape[1]):
+        boxes[fill, c] = np.interp(idx[fill], known, boxes[known, c])
+    return boxes, valid | fill
+
+
+def smooth_track(boxes, valid=None, T=5, method='mean', max_gap=0, outlier_threshold=None, **params):
+    """Post-process a face track of N x 4 boxes with an optional validity mask.
+
+    Outliers are rejected first (``outlier_threshold``), then gaps of up to
+    ``max_gap`` frames are interpolated, then the valid boxes are smoothed as
+    one contiguous sequence with ``method``: 'mean' (get_smoothened_boxes over
+    T frames), 'one_euro' or 'kalman' (``params`` are passed to the filter).
+    Returns (boxes, valid); boxes keep the input dtype.
+    """
+    boxes = np.array(boxes)
+    valid = np.ones(len(boxes), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+    dtype = boxes.dtype
+
+    if outlier_threshold is not None:
+        valid = reject_outliers(boxes, valid, T, outlier_threshold)
+    if max_gap > 0:
+        filled, valid = fill_gaps(boxes, valid, max_gap)
+        boxes = filled if np.issubdtype(dtype, np.floating) else np.rint(filled).astype(dtype)
+
+    track = boxes[valid]
+    if method == 'mean':
+        track = get_smoothened_boxes(track, T)
+    elif method == 'one_euro':
+        track = one_euro_filter(track, **params)
+    elif method == 'kalman':
+        track = kalman_smooth(track, **params)
+    else:
+        raise ValueError('Unknown smoothing method: {}'.format(method))
+
+    if method != 'mean' and not np.issubdtype(dtype, np.floating):
+        track = np.rint(track)
+    boxes[valid] = track
+    return boxes, valid
+
+
+def smoothen_stream(items, T, window=32):
+    """Streaming get_smoothened_boxes over (frame, box) pairs.
+
+    Valid boxes are averaged with the next T - 1 valid boxes in chunks of
+    ``window``, so a bounded number of frames is held back waiting for
+    look-ahead. Frames without a face pass through in order with a None box;
+    if more than ``window`` of them pile up behind a valid box, it is emitted
+    early with a shortened window.
+    """
+    pending = deque()
+    ahead = []
+    smoothed = deque(maxlen=T)
+
+    def emit(count):
+        means = _forward_means(np.asarray(ahead, dtype=np.float64), T, count).astype(int)
+        k = 0
+        while k < count:
+            frame, box = pending.popleft()
+            if box is None:
+                yield frame, None
+                continue
+            smoothed.append(means[k])
+            yield frame, means[k]
+            k += 1
+        del ahead[:count]
+
+    for frame, box in items:
+        pending.append((frame, box))
+        if box is not None:
+            ahead.append(np.asarray(box))
+
+        if len(ahead) >= window + T - 1:
+            yield from emit(window)
+        elif len(pending) - len(ahead) > window:
+            yield from emit(len(ahead))
+
+        while pending and pending[0][1] is None:
+            yield pending.popleft()
+
+    if len(ahead) >= T:
+        yield from emit(len(ahead) - T + 1)
+
+    # The last boxes share the final window, which get_smoothened_boxes has
+    # already partly overwritten with smoothed values.
+    state = list(smoothed) + ahead
+    k = len(smoothed)
+    for frame, box in pending:
+        if box is None:
+            yield frame, None
+            continue
+        state[k] = np.mean(state[len(state) - T:], axis=0).astype(int)
+        yield frame, state[k]
+        k += 1
+
+
+def smooth_stream(items, T=5, method='mean', max_gap=0, outlier_threshold=None, window=32, **params):
+    """Streaming smooth_track over (frame, box) pairs, with a None box for frames without a face.
+
+    The plain mean is smoothen_stream. Otherwise the track is smoothed
+    ``window`` frames at a time, together with the boxes of the frames just
+    before and after them, so outlier rejection, gap filling and the filters
+    see past the ends of each chunk. Frames whose box is rejected come out
+    with None, and frames in a filled gap with the interpolated box.
+    """
+    if method == 'mean' and max_gap <= 0 and outlier_threshold is None:
+        yield from smoothen_stream(items, T, window)
+        return
+
+    context = max(16, T, max_gap + 1)
+    past_boxes, past_valid, pending = [], [], []
+
+    def emit(count):
+        boxes = past_boxes + [(0, 0, 0, 0) if box is None else tuple(box[:4]) for _, box in pending]
+        valid = past_valid + [box is not None for _, box in pending]
+        smoothed, kept = smooth_track(np.array(boxes, dtype=int), valid, T, method, max_gap, outlier_threshold,
+                                      **params)
+        start = len(past_boxes)
+        for k in range(count):
+            yield pending[k][0], smoothed[start + k] if kept[start + k] else None
+        past_boxes[:] = boxes[:start + count][-context:]
+        past_valid[:] = valid[:start + count][-context:]
+        del pending[:count]
+
+    for frame, box in items:
+        pending.append((frame, box))
+        if len(pending) >= window + context:
+            yield from emit(window)
+    if pending:
+        yield from emit(len(pending))
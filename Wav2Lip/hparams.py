@@ -71,6 +71,7 @@ hparams = HParams(
 	# Set this to 55 if your speaker is male! if female, 95 should help taking off noise. (To 
 	# test depending on dataset. Pitch info: male~[65, 260], female~[100, 525])
 	fmax=7600,  # To be increased/reduced depending on data.
+	mel_frontend='torch',  # 'torch' (batched torch.stft, audio.melspectrograms) or 'librosa'
 
 	###################### Our training parameters #################################
 	img_size=96,
@@ -80,6 +81,7 @@ hparams = HParams(
 	initial_learning_rate=1e-4,
 	nepochs=200000000000000000,  ### ctrl + c, stop whenever eval loss is consistently greater than train loss for ~10 epochs
 	num_workers=16,
+	open_videos=64,  # packed face crops each data loader worker keeps memory-mapped (one open file each)
 	checkpoint_interval=3000,
 	eval_interval=3000,
     save_optimizer_state=True,
@@ -1,14 +1,6 @@
-from os import listdir, path
-import numpy as np
-import scipy, cv2, os, sys, argparse
-import audio
-import json, subprocess, random, string
-from tqdm import tqdm
-from glob import glob
-import torch
-from face_detection import FaceAlignment, LandmarksType
-from models import Wav2Lip
-import platform
+import argparse
+from dataclasses import fields
+from engine import FACE_DETECTORS, FACE_TRACK_CACHE, Wav2LipConfig, Wav2LipEngine
 
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
 
@@ -16,7 +8,8 @@ parser.add_argument('--checkpoint_path', type=str,
 					help='Name of saved checkpoint to load weights from', default='app/Wav2Lip/checkpoints/wav2lip.pth')
 
 parser.add_argument('--face', type=str, 
-					help='Filepath of video/image that contains faces to use', default='app/Wav2Lip/exc/111.mp4')
+					help='Filepath of video/image that contains faces to use. Videos with a face in at most half of '
+					'their frames are rejected once detection has seen enough of them to tell', default='app/Wav2Lip/exc/111.mp4')
 parser.add_argument('--audio', type=str, 
 					help='Filepath of video/audio file to use as raw audio source', default='app/Wav2Lip/exc/666.wav')
 parser.add_argument('--outfile', type=str, help='Video path to save result. See default for an e.g.', 
@@ -52,314 +45,111 @@ parser.add_argument('--rotate', default=False, action='store_true',
 
 parser.add_argument('--nosmooth', default=False, action='store_true',
 					help='Prevent smoothing face detections over a short temporal window')
-
-args = parser.parse_args()
-args.img_size = 96
-
-if os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
-	args.static = True
-
-def get_smoothened_boxes(boxes, T):
-	for i in range(len(boxes)):
-		if i + T > len(boxes):
-			window = boxes[len(boxes) - T:]
-		else:
-			window = boxes[i : i + T]
-		boxes[i] = np.mean(window, axis=0)
-	return boxes
-
-def face_detect(images):
-	detector = FaceAlignment(LandmarksType._2D, 
-											flip_input=False, device=device)
-
-	batch_size = args.face_det_batch_size
-	
-	while 1:
-		predictions = []
-		try:
-			for i in tqdm(range(0, len(images), batch_size)):
-				predictions.extend(detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
-		except RuntimeError:
-			if batch_size == 1: 
-				raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
-			batch_size //= 2
-			print('Recovering from OOM error; New batch size: {}'.format(batch_size))
-			continue
-		break
-
-	results = []
-	pady1, pady2, padx1, padx2 = args.pads
-	for rect, image in zip(predictions, images):
-		if rect is None:
-			# 返回 None 表示這一幀沒有人臉，而不是拋出錯誤
-			results.append(None)
-			continue
-
-		y1 = max(0, rect[1] - pady1)
-		y2 = min(image.shape[0], rect[3] + pady2)
-		x1 = max(0, rect[0] - padx1)
-		x2 = min(image.shape[1], rect[2] + padx2)
-		
-		results.append([x1, y1, x2, y2])
-
-	# 過濾掉 None 值
-	valid_results = [r for r in results if r is not None]
-	if len(valid_results) == 0:
-		raise ValueError('No faces detected in any frames! Cannot proceed with lip sync.')
-	
-	# 計算人臉幀比例
-	face_ratio = len(valid_results) / len(results)
-	print(f"  人臉檢測: {len(valid_results)}/{len(results)} 幀 ({face_ratio*100:.1f}%)")
-	
-	if face_ratio < 0.5:
-		raise ValueError(f'Too few faces detected ({face_ratio*100:.1f}% < 50%)! Cannot ensure quality lip sync.')
-	
-	boxes = np.array(valid_results)
-	if not args.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
-	
-	# 為沒有人臉的幀創建佔位符
-	valid_idx = 0
-	final_results = []
-	for i, (image, result) in enumerate(zip(images, results)):
-		if result is None:
-			final_results.append(None)
-		else:
-			x1, y1, x2, y2 = boxes[valid_idx]
-			final_results.append([image[y1: y2, x1:x2], (y1, y2, x1, x2)])
-			valid_idx += 1
-	
-	results = final_results
-
-	del detector
-	return results 
-
-def datagen(frames, mels):
-	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
-
-	if args.box[0] == -1:
-		if not args.static:
-			face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
-		else:
-			face_det_results = face_detect([frames[0]])
-	else:
-		print('Using the specified bounding box instead of face detection...')
-	
-	# 過濾掉 None 結果（沒有人臉的幀）
-	if args.box[0] == -1:
-		valid_frames = [(i, f, r) for i, (f, r) in enumerate(zip(frames, face_det_results)) if r is not None]
-		if len(valid_frames) == 0:
-			raise ValueError('No valid frames with faces detected!')
-		frame_indices, frames, face_det_results = zip(*valid_frames)
-		frames = list(frames)
-		face_det_results = list(face_det_results)
-	else:
-		# 使用指定的 bounding box
-		y1, y2, x1, x2 = args.box
-		face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
-
-	for i, m in enumerate(mels):
-		idx = 0 if args.static else i%len(frames)
-		frame_to_save = frames[idx].copy()
-		
-		# 解包 face_det_results，確保數據有效
-		face_data = face_det_results[idx]
-		if isinstance(face_data, list) and len(face_data) == 2:
-			face, coords = face_data[0], face_data[1]
-		else:
-			raise ValueError(f"Invalid face_det_results format at index {idx}: {type(face_data)}")
-		
-		# 驗證 face 數據
-		if face is None or not isinstance(face, np.ndarray):
-			raise ValueError(f"Face data is None or invalid at index {idx}")
-		if face.size == 0 or face.shape[0] == 0 or face.shape[1] == 0:
-			raise ValueError(f"Face region is empty at index {idx}. Shape: {face.shape}")
-		
-		# 安全地 resize
-		try:
-			face = cv2.resize(face, (args.img_size, args.img_size))
-		except cv2.error as e:
-			print(f"❌ Resize 失敗 at frame {idx}: face shape={face.shape}, error={e}")
-			raise
-			
-		img_batch.append(face)
-		mel_batch.append(m)
-		frame_batch.append(frame_to_save)
-		coords_batch.append(coords)
-
-		if len(img_batch) >= args.wav2lip_batch_size:
-			img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-			img_masked = img_batch.copy()
-			img_masked[:, args.img_size//2:] = 0
-
-			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-			mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
-
-			yield img_batch, mel_batch, frame_batch, coords_batch
-			img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
-
-	if len(img_batch) > 0:
-		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-		img_masked = img_batch.copy()
-		img_masked[:, args.img_size//2:] = 0
-
-		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
-
-		yield img_batch, mel_batch, frame_batch, coords_batch
-
-mel_step_size = 16
-
-def get_device_with_fallback():
-    """智能選擇設備，自動處理不支援的設備類型"""
-    # 優先順序: CUDA > MPS > CPU
-    if torch.cuda.is_available():
-        return 'cuda'
-    
-    # 嘗試使用 MPS（Apple Silicon GPU）
-    if torch.backends.mps.is_available():
-        try:
-            # 測試 face_detection 是否支援 MPS
-            from face_detection import FaceAlignment, LandmarksType
-            test_detector = FaceAlignment(LandmarksType._2D, flip_input=False, device='mps')
-            del test_detector
-            print("✅ face_detection 模組支援 MPS，使用 MPS 加速")
-            return 'mps'
-        except (ValueError, RuntimeError) as e:
-            print(f"⚠️  MPS 可用但 face_detection 模組不支援 (錯誤: {type(e).__name__})")
-            print("   自動降級使用 CPU")
-            return 'cpu'
-    
-    return 'cpu'
-
-device = get_device_with_fallback()
-print(f"🖥️  Wav2Lip 推理設備: {device.upper()}")
-
-def _load(checkpoint_path):
-	if device == 'cuda':
-		checkpoint = torch.load(checkpoint_path)
-	else:
-		checkpoint = torch.load(checkpoint_path,
-								map_location=lambda storage, loc: storage)
-	return checkpoint
-
-def load_model(path):
-	model = Wav2Lip()
-	print("Load checkpoint from: {}".format(path))
-	checkpoint = _load(path)
-	s = checkpoint["state_dict"]
-	new_s = {}
-	for k, v in s.items():
-		new_s[k.replace('module.', '')] = v
-	model.load_state_dict(new_s)
-
-	model = model.to(device)
-	return model.eval()
-
-def run_inference(face_path, audio_path, output_path):
-	args.face = face_path
-	args.audio = audio_path
-	args.outfile = output_path
-	
-	if not os.path.isfile(args.face):
-		raise ValueError('--face argument must be a valid path to video/image file')
-
-	elif args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
-		full_frames = [cv2.imread(args.face)]
-		fps = args.fps
-
-	else:
-		video_stream = cv2.VideoCapture(args.face)
-		fps = video_stream.get(cv2.CAP_PROP_FPS)
-
-		print('Reading video frames...')
-
-		full_frames = []
-		while 1:
-			still_reading, frame = video_stream.read()
-			if not still_reading:
-				video_stream.release()
-				break
-			if args.resize_factor > 1:
-				frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
-
-			if args.rotate:
-				frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
-
-			y1, y2, x1, x2 = args.crop
-			if x2 == -1: x2 = frame.shape[1]
-			if y2 == -1: y2 = frame.shape[0]
-
-			frame = frame[y1:y2, x1:x2]
-
-			full_frames.append(frame)
-
-	print ("Number of frames available for inference: "+str(len(full_frames)))
-
-	if not args.audio.endswith('.wav'):
-		print('Extracting raw audio...')
-		command = 'ffmpeg -y -i {} -strict -2 {}'.format(args.audio, 'temp/temp.wav')
-
-		subprocess.call(command, shell=True)
-		args.audio = 'temp/temp.wav'
-
-	wav = audio.load_wav(args.audio, 16000)
-	mel = audio.melspectrogram(wav)
-	print(mel.shape)
-
-	if np.isnan(mel.reshape(-1)).sum() > 0:
-		raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
-
-	mel_chunks = []
-	mel_idx_multiplier = 80./fps 
-	i = 0
-	while 1:
-		start_idx = int(i * mel_idx_multiplier)
-		if start_idx + mel_step_size > len(mel[0]):
-			mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
-			break
-		mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
-		i += 1
-
-	print("Length of mel chunks: {}".format(len(mel_chunks)))
-
-	full_frames = full_frames[:len(mel_chunks)]
-
-	batch_size = args.wav2lip_batch_size
-	gen = datagen(full_frames.copy(), mel_chunks)
-
-	for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
-												total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
-		if i == 0:
-			model = load_model(args.checkpoint_path)
-			print ("Model loaded")
-
-			frame_h, frame_w = full_frames[0].shape[:-1]
-			out = cv2.VideoWriter('temp/result.avi', 
-									cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
-
-		img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
-		mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
-
-		with torch.no_grad():
-			pred = model(mel_batch, img_batch)
-
-		pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
-		
-		for p, f, c in zip(pred, frames, coords):
-			y1, y2, x1, x2 = c
-			p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
-
-			f[y1:y2, x1:x2] = p
-			out.write(f)
-
-	out.release()
-
-	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
-	subprocess.call(command, shell=platform.system() != 'Windows')
-	
-	return output_path
-
-# if __name__ == '__main__':
-# 	main()
+parser.add_argument('--smooth_method', type=str, default='mean', choices=['mean', 'one_euro', 'kalman'],
+					help='Smoothing of the face boxes: mean over 5 frames, One-Euro filter or Kalman smoother')
+parser.add_argument('--smooth_max_gap', type=int, default=0,
+					help='Interpolate face boxes across runs of up to this many frames where no face was found')
+parser.add_argument('--smooth_outlier_threshold', type=float, default=0.,
+					help='Drop face boxes straying from the median of their neighbours by more than this times '
+					'the face size (e.g. 0.5), before smoothing. 0 keeps every box')
+
+parser.add_argument('--detect_every', type=int, default=1,
+					help='Run face detection only on every Nth frame (and on large motion), interpolating boxes in between')
+parser.add_argument('--keyframe_motion', type=float, default=10.,
+					help='Mean absolute grey-level change from the last keyframe that forces a new keyframe')
+parser.add_argument('--keyframe_iou', type=float, default=0.7,
+					help='Detect more frames between two keyframes whose boxes overlap less than this IoU')
+
+parser.add_argument('--face_track_cache', type=str, default=FACE_TRACK_CACHE,
+					help='Directory of cached face tracks, keyed by video content and detection options '
+					'(default: temp/face_tracks in the Wav2Lip folder). Empty string disables the cache')
+parser.add_argument('--face_track_cache_size', type=int, default=256,
+					help='Size cap of the face track cache in MB; least recently used tracks are evicted first')
+
+parser.add_argument('--vcodec', type=str, default='libx264', help='ffmpeg video codec of the output')
+parser.add_argument('--crf', type=int, default=18, help='Constant rate factor of the output video (lower is better quality)')
+parser.add_argument('--preset', type=str, default='medium', help='Encoder speed/compression preset of the output video')
+parser.add_argument('--encode_threads', type=int, default=0, help='ffmpeg encoder threads (0 lets ffmpeg decide)')
+
+parser.add_argument('--passthrough', default=False, action='store_true',
+					help='Only run Wav2Lip on frames with speech and a face; all other frames are taken from the source '
+					'unchanged, stream-copied between keyframes where possible. Stream copy needs an H.264 source, '
+					'--resize_factor 1 and no --crop or --rotate, so the output has the geometry of the source; '
+					'otherwise every frame is re-encoded. Frames follow the audio in time and the output ends with '
+					'the shorter of video and audio: audio past the last source frame is cut, where the default mode '
+					'loops the video instead')
+parser.add_argument('--vad_threshold', type=float, default=-40.,
+					help='Audio level (dB below the loudest speech) under which a frame counts as silent')
+parser.add_argument('--min_silence', type=float, default=0.5,
+					help='Pauses in speech shorter than this many seconds are still lip-synced')
+parser.add_argument('--speech_pad', type=float, default=0.2,
+					help='Seconds lip-synced before and after each stretch of speech')
+parser.add_argument('--min_copy', type=float, default=2.,
+					help='Shortest stretch of passthrough video, in seconds, that is stream-copied instead of re-encoded')
+
+parser.add_argument('--pipeline_queue_size', type=int, default=8,
+					help='Items buffered between pipelined inference stages (decode, detection, batching, '
+					'Wav2Lip, paste-back, encode). 0 runs every stage serially on the calling thread')
+parser.add_argument('--audio_block_size', type=int, default=16000 * 10,
+					help='Samples of 16 kHz audio read and turned into mel chunks at a time, as the frames are rendered '
+					'(WAV files at 16 kHz are streamed from disk; others are loaded whole first)')
+parser.add_argument('--backend', type=str, default='eager', choices=['eager', 'torchscript', 'onnx'],
+					help='Runtime of the Wav2Lip model: eager PyTorch, frozen TorchScript or ONNX Runtime on the CPU')
+parser.add_argument('--onnx_path', type=str, default=None,
+					help='ONNX export used by --backend onnx (see export_onnx.py). Defaults to the checkpoint path with '
+					'an .onnx suffix, exported on first use if missing')
+parser.add_argument('--ort_threads', type=int, default=0, help='ONNX Runtime intra-op threads (0 uses every core)')
+parser.add_argument('--face_detector', type=str, default='sfd', choices=list(FACE_DETECTORS),
+					help='Face detector: S3FD (most accurate), S3FD in int8 on the CPU (calibrated and cached on first use), '
+					'or the much cheaper OpenCV Haar/LBP cascades or small ONNX model, which are enough for a single '
+					'frontal talking head on CPU')
+parser.add_argument('--face_detector_path', type=str, default=None,
+					help='Model file of the face detector (cascade XML or ONNX) instead of its default')
+parser.add_argument('--min_face_size', type=int, default=0,
+					help='Smallest face, in pixels after --resize_factor, that S3FD has to find. Faces of 32 pixels or '
+					'more skip its finest detection heads, 64 or more the two finest, 128 or more the three finest')
+parser.add_argument('--detector_idle_timeout', type=float, default=300.,
+					help='Seconds an unused face detector stays loaded in the process-wide detector pool')
+parser.add_argument('--detect_face_size', type=int, default=0,
+					help='Detect faces on a downscaled copy of the frames, sized from the first face found so faces are '
+					'about this many pixels (e.g. 100); boxes are scaled back, so cropping and paste-back keep full '
+					'resolution. Use with --resize_factor 1 for high-resolution inputs. 0 detects on the frames as they are')
+parser.add_argument('--detect_min_side', type=int, default=240,
+					help='Shorter side, in pixels, below which --detect_face_size never downscales')
+parser.add_argument('--roi_detection', default=False, action='store_true',
+					help='Once a face is found, detect only in a region around it on the next frames, scanning whole '
+					'frames again when the face is lost, scores low or reaches the edge of the region')
+parser.add_argument('--roi_margin', type=float, default=0.5,
+					help='Margin around the last face, as a fraction of its size, searched with --roi_detection')
+parser.add_argument('--roi_min_score', type=float, default=0.8,
+					help='Detector score below which a face found with --roi_detection is looked for in the whole frame')
+parser.add_argument('--device', type=str, default=None,
+					help='Torch device to run on (cpu or cuda). Defaults to CUDA when available, else CPU')
+parser.add_argument('--paste_workers', type=int, default=2,
+					help='Worker threads used to paste predicted faces back into frames')
+
+
+_engine = None
+
+def config_from_args(args):
+	"""The Wav2LipConfig of parsed command line arguments."""
+	return Wav2LipConfig(**{f.name: getattr(args, f.name) for f in fields(Wav2LipConfig) if hasattr(args, f.name)})
+
+def run_inference(face_path, audio_path, output_path, stats=None, passthrough=None):
+	"""Lip-sync with a process-wide engine using the default options; kept for existing callers.
+
+	New code should create its own Wav2LipEngine, which can also take per-call options.
+	"""
+	global _engine
+	if _engine is None:
+		_engine = Wav2LipEngine()
+	options = {} if passthrough is None else {'passthrough': passthrough}
+	return _engine.run(face_path, audio_path, output_path, stats=stats, **options)
+
+def main(argv=None):
+	args = parser.parse_args(argv)
+	engine = Wav2LipEngine(config_from_args(args))
+	engine.run(args.face, args.audio, args.outfile)
+
+if __name__ == '__main__':
+	main()
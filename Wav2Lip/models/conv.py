@@ -1,6 +1,23 @@
 import torch
 from torch import nn
 from torch.nn import functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+def fuse_for_inference(model):
+    """Fold the BatchNorm of every Conv2d and Conv2dTranspose block of ``model`` into its convolution.
+
+    Puts the model in eval mode, whose BatchNorm running statistics are what
+    gets folded, and returns it. The fused model computes the same outputs
+    without a BatchNorm pass per layer, but can no longer be trained or load
+    checkpoints.
+    """
+    model.eval()
+    for module in model.modules():
+        if isinstance(module, (Conv2d, Conv2dTranspose)):
+            module.fuse_for_inference()
+    return model
+
 
 class Conv2d(nn.Module):
     def __init__(self, cin, cout, kernel_size, stride, padding, residual=False, *args, **kwargs):
@@ -12,6 +29,11 @@ class Conv2d(nn.Module):
         self.act = nn.ReLU()
         self.residual = residual
 
+    def fuse_for_inference(self):
+        if len(self.conv_block) == 2:
+            self.conv_block = nn.Sequential(fuse_conv_bn_eval(self.conv_block[0].eval(), self.conv_block[1].eval()))
+        return self
+
     def forward(self, x):
         out = self.conv_block(x)
         if self.residual:
@@ -39,6 +61,12 @@ class Conv2dTranspose(nn.Module):
                             )
         self.act = nn.ReLU()
 
+    def fuse_for_inference(self):
+        if len(self.conv_block) == 2:
+            self.conv_block = nn.Sequential(fuse_conv_bn_eval(self.conv_block[0].eval(), self.conv_block[1].eval(),
+                                                              transpose=True))
+        return self
+
     def forward(self, x):
         out = self.conv_block(x)
         return self.act(out)
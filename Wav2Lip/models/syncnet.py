@@ -2,7 +2,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
-from .conv import Conv2d
+from .conv import Conv2d, fuse_for_inference
 
 class SyncNet_color(nn.Module):
     def __init__(self):
@@ -52,6 +52,10 @@ class SyncNet_color(nn.Module):
             Conv2d(256, 512, kernel_size=3, stride=1, padding=0),
             Conv2d(512, 512, kernel_size=1, stride=1, padding=0),)
 
+    def fuse_for_inference(self):
+        """Fold every BatchNorm into its convolution for eval-mode use; see models.conv.fuse_for_inference."""
+        return fuse_for_inference(self)
+
     def forward(self, audio_sequences, face_sequences): # audio_sequences := (B, dim, T)
         face_embedding = self.face_encoder(face_sequences)
         audio_embedding = self.audio_encoder(audio_sequences)
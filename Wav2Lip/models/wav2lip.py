@@ -3,7 +3,7 @@ from torch import nn
 from torch.nn import functional as F
 import math
 
-from .conv import Conv2dTranspose, Conv2d, nonorm_Conv2d
+from .conv import Conv2dTranspose, Conv2d, nonorm_Conv2d, fuse_for_inference
 
 class Wav2Lip(nn.Module):
     def __init__(self):
@@ -84,6 +84,10 @@ class Wav2Lip(nn.Module):
             nn.Conv2d(32, 3, kernel_size=1, stride=1, padding=0),
             nn.Sigmoid()) 
 
+    def fuse_for_inference(self):
+        """Fold every BatchNorm into its convolution for eval-mode use; see models.conv.fuse_for_inference."""
+        return fuse_for_inference(self)
+
     def forward(self, audio_sequences, face_sequences):
         # audio_sequences = (B, T, 1, 80, 16)
         B = audio_sequences.size(0)
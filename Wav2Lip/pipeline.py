@@ -0,0 +1,135 @@
+import threading
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class QueueStats(object):
+    """Counters for the bounded queue at the output of one pipeline stage.
+
+    ``producer_blocked`` is the time the stage spent waiting for room in a full
+    queue (its consumer is slower), ``consumer_starved`` the time its consumer
+    spent waiting on an empty queue (this stage is slower). The producer and
+    consumer threads update them through ``record``, under a lock.
+    """
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.items = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.producer_blocked = 0.
+        self.consumer_starved = 0.
+        self._lock = threading.Lock()
+
+    def record(self, blocked=0., starved=0., depth=None):
+        """Add waiting times, and the queue depth after an item was handed over."""
+        with self._lock:
+            self.producer_blocked += blocked
+            self.consumer_starved += starved
+            if depth is not None:
+                self.items += 1
+                self.depth_total += depth
+                self.max_depth = max(self.max_depth, depth)
+
+    @property
+    def mean_depth(self):
+        return self.depth_total / float(max(1, self.items))
+
+    def __repr__(self):
+        with self._lock:
+            return '{}: {} items, depth {:.1f}/{} (max {}), producer blocked {:.2f}s, consumer starved {:.2f}s'.format(
+                self.name, self.items, self.mean_depth, self.maxsize, self.max_depth,
+                self.producer_blocked, self.consumer_starved)
+
+
+class PipelineStats(object):
+    """Per-stage queue statistics, shared by all stages of one run."""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stage(self, name, maxsize):
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = QueueStats(name, maxsize)
+            return self.stages[name]
+
+    def summary(self):
+        return '\n'.join('  ' + repr(s) for s in self.stages.values())
+
+
+class Stage(object):
+    """Iterate ``source`` on a worker thread, handing items over through a bounded queue.
+
+    The worker blocks once ``maxsize`` items are waiting, so a slow consumer
+    applies backpressure all the way up the pipeline. Exceptions raised by the
+    source are re-raised in the consuming thread, and abandoning the iteration
+    stops the worker.
+    """
+
+    def __init__(self, name, source, maxsize, stats=None):
+        self.queue = queue.Queue(maxsize)
+        self.stats = (stats if stats is not None else PipelineStats()).stage(name, maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(source,), name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats.record(blocked=time.perf_counter() - start)
+        return not self._stop.is_set()
+
+    def _run(self, source):
+        error = None
+        try:
+            for item in source:
+                if not self._put((item, None)):
+                    return
+                self.stats.record(depth=self.queue.qsize())
+        except BaseException as e:
+            error = e
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+        self._put((_DONE, error))
+
+    def __iter__(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                item, error = self.queue.get()
+                self.stats.record(starved=time.perf_counter() - start)
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+
+
+def map_stage(name, fn, source, workers, maxsize, stats=None):
+    """Like Stage, but apply ``fn`` to every item on ``workers`` threads, preserving order."""
+    pool = ThreadPoolExecutor(workers, thread_name_prefix=name)
+    stage = Stage(name, (pool.submit(fn, item) for item in source), maxsize, stats)
+    try:
+        for future in stage:
+            yield future.result()
+    finally:
+        stage.close()
+        pool.shutdown(wait=False)
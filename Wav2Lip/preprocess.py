@@ -15,7 +15,7 @@ import numpy as np
 import argparse, os, cv2, traceback, subprocess
 from tqdm import tqdm
 from glob import glob
-import audio
+from dataset_store import MEL_DTYPES, pack_faces, save_faces, save_mel
 from hparams import hparams as hp
 
 import face_detection
@@ -24,13 +24,18 @@ parser = argparse.ArgumentParser()
 
 parser.add_argument('--ngpu', help='Number of GPUs across which to run in parallel', default=1, type=int)
 parser.add_argument('--batch_size', help='Single GPU Face detection batch size', default=32, type=int)
-parser.add_argument("--data_root", help="Root folder of the LRS2 dataset", required=True)
+parser.add_argument("--data_root", help="Root folder of the LRS2 dataset", default=None)
 parser.add_argument("--preprocessed_root", help="Root folder of the preprocessed dataset", required=True)
+parser.add_argument('--mel_dtype', help='Type of the mel spectrograms stored next to each audio.wav for training',
+					default='float32', choices=list(MEL_DTYPES))
+parser.add_argument('--mels_only', help='Only store the mel spectrograms of an already preprocessed dataset',
+					action='store_true')
+parser.add_argument('--pack_only', help='Only pack the per-frame JPEG face crops of a dataset preprocessed before '
+					'into faces.npy', action='store_true')
 
 args = parser.parse_args()
-
-fa = [face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False, 
-									device='cuda:{}'.format(id)) for id in range(args.ngpu)]
+if args.data_root is None and not (args.mels_only or args.pack_only):
+	parser.error('--data_root is required unless --mels_only or --pack_only is given')
 
 template = 'ffmpeg -loglevel panic -y -i {} -strict -2 {}'
 # template2 = 'ffmpeg -hide_banner -loglevel panic -threads 1 -y -i {} -async 1 -ac 1 -vn -acodec pcm_s16le -ar 16000 {}'
@@ -54,17 +59,25 @@ def process_video_file(vfile, args, gpu_id):
 
 	batches = [frames[i:i + args.batch_size] for i in range(0, len(frames), args.batch_size)]
 
-	i = -1
-	for fb in batches:
-		preds = fa[gpu_id].get_detections_for_batch(np.asarray(fb))
+	# The crops are packed, resized to the training size, into one array per video
+	frame_ids, faces = [], []
+
+	# One S3FD per GPU, loaded by the first video on it and shared by the later ones
+	with face_detection.detector_pool.lease('cuda:{}'.format(gpu_id)) as fa:
+		i = -1
+		for fb in batches:
+			preds = fa.get_detections_for_batch(np.asarray(fb))
 
-		for j, f in enumerate(preds):
-			i += 1
-			if f is None:
-				continue
+			for j, f in enumerate(preds):
+				i += 1
+				if f is None:
+					continue
 
-			x1, y1, x2, y2 = f
-			cv2.imwrite(path.join(fulldir, '{}.jpg'.format(i)), fb[j][y1:y2, x1:x2])
+				x1, y1, x2, y2 = f
+				frame_ids.append(i)
+				faces.append(cv2.resize(fb[j][y1:y2, x1:x2], (hp.img_size, hp.img_size)))
+
+	save_faces(fulldir, frame_ids, np.asarray(faces, dtype=np.uint8).reshape(-1, hp.img_size, hp.img_size, 3))
 
 def process_audio_file(vfile, args):
 	vidname = os.path.basename(vfile).split('.')[0]
@@ -77,6 +90,7 @@ def process_audio_file(vfile, args):
 
 	command = template.format(vfile, wavpath)
 	subprocess.call(command, shell=True)
+	save_mel(fulldir, args.mel_dtype)
 
 	
 def mp_handler(job):
@@ -88,7 +102,34 @@ def mp_handler(job):
 	except:
 		traceback.print_exc()
 		
+def store_mels(args):
+	"""Store the mel spectrogram of every audio.wav already under preprocessed_root."""
+	for wavpath in tqdm(glob(path.join(args.preprocessed_root, '*/*/audio.wav'))):
+		try:
+			save_mel(path.dirname(wavpath), args.mel_dtype)
+		except KeyboardInterrupt:
+			exit(0)
+		except:
+			traceback.print_exc()
+
+def pack_jpegs(args):
+	"""Pack the {frame}.jpg face crops of every video already under preprocessed_root."""
+	for vdir in tqdm(sorted(set(path.dirname(f) for f in glob(path.join(args.preprocessed_root, '*/*/*.jpg'))))):
+		try:
+			pack_faces(vdir, hp.img_size)
+		except KeyboardInterrupt:
+			exit(0)
+		except:
+			traceback.print_exc()
+
 def main(args):
+	if args.mels_only or args.pack_only:
+		if args.pack_only:
+			pack_jpegs(args)
+		if args.mels_only:
+			store_mels(args)
+		return
+
 	print('Started processing for {} with {} GPUs'.format(args.data_root, args.ngpu))
 
 	filelist = glob(path.join(args.data_root, '*/*.mp4'))
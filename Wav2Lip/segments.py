@@ -0,0 +1,78 @@
+import bisect
+
+import numpy as np
+
+
+def runs(mask):
+    """Split a 1-D mask into maximal (start, end, value) runs, ``end`` exclusive."""
+    mask = np.asarray(mask, dtype=bool)
+    if len(mask) == 0:
+        return []
+    edges = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+    starts = np.concatenate([[0], edges])
+    ends = np.concatenate([edges, [len(mask)]])
+    return [(int(s), int(e), bool(mask[s])) for s, e in zip(starts, ends)]
+
+
+def close_gaps(mask, max_gap):
+    """Set runs of at most ``max_gap`` False values that lie between two True values."""
+    mask = np.array(mask, dtype=bool)
+    for s, e, value in runs(mask):
+        if not value and s > 0 and e < len(mask) and e - s <= max_gap:
+            mask[s:e] = True
+    return mask
+
+
+def speech_mask(wav, sr, fps, num_frames, threshold_db=-40., floor_db=-60., min_silence=0.5, pad=0.2):
+    """True for each of ``num_frames`` video frames that overlaps speech in ``wav``.
+
+    A frame is voiced when the RMS level of its audio is within
+    ``threshold_db`` of the loud end of the track (its 99th percentile) and
+    above ``floor_db`` dBFS. Pauses shorter than ``min_silence`` seconds are
+    bridged and voiced ranges are widened by ``pad`` seconds on both sides,
+    so the mouth is rendered as it opens and closes.
+    """
+    if num_frames == 0:
+        return np.zeros(0, dtype=bool)
+
+    bounds = np.minimum(np.rint(np.arange(num_frames + 1) * (sr / float(fps))).astype(int), len(wav))
+    csum = np.concatenate([[0.], np.cumsum(np.square(wav, dtype=np.float64))])
+    energy = (csum[bounds[1:]] - csum[bounds[:-1]]) / np.maximum(bounds[1:] - bounds[:-1], 1)
+    level = 10 * np.log10(energy + 1e-12)
+
+    mask = level > max(np.percentile(level, 99) + threshold_db, floor_db)
+    mask = close_gaps(mask, int(round(min_silence * fps)))
+    width = int(round(pad * fps))
+    if width > 0:
+        mask = np.convolve(mask, np.ones(2 * width + 1), mode='same') > 0
+    return mask
+
+
+def plan_segments(render, keyframes, min_copy):
+    """Split frames into ('encode', start, end) and ('copy', start, end) segments.
+
+    ``render`` is True for frames the model has to redraw. A run of frames
+    that do not need it is stream-copied from the source between the first
+    and the last keyframe inside it (the end of the video counts as a
+    keyframe) when that span is at least ``min_copy`` frames long. Everything
+    else, the rendered frames and the ragged ends of the copied runs, is
+    re-encoded.
+    """
+    n = len(render)
+    keys = sorted(set(int(k) for k in keyframes if 0 <= k < n)) + [n]
+
+    segments, pos = [], 0
+    for s, e, value in runs(render):
+        if value:
+            continue
+        first = keys[bisect.bisect_left(keys, s)]
+        last = keys[bisect.bisect_right(keys, e) - 1]
+        if last - first < max(min_copy, 1):
+            continue
+        if pos < first:
+            segments.append(('encode', pos, first))
+        segments.append(('copy', first, last))
+        pos = last
+    if pos < n:
+        segments.append(('encode', pos, n))
+    return segments
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import tempfile
+from glob import glob
+
+import numpy as np
+
+
+def video_fingerprint(path, sample_size=1 << 16, num_samples=16):
+    """Cheap content fingerprint of a video file.
+
+    Hashes the file size, the first and last MiB and ``num_samples`` evenly
+    spaced blocks in between, so multi-GB inputs are fingerprinted without
+    reading them in full.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(1 << 20))
+        for i in range(1, num_samples + 1):
+            f.seek(size * i // (num_samples + 1))
+            h.update(f.read(sample_size))
+        f.seek(max(0, size - (1 << 20)))
+        h.update(f.read(1 << 20))
+    return h.hexdigest()
+
+
+class FaceTrackCache(object):
+    """On-disk store of per-frame face boxes, shared by concurrent jobs.
+
+    Each entry is an ``.npz`` holding ``boxes`` (N x 4 int32, x1, y1, x2, y2),
+    ``valid`` (N bools, False where no face was found) and ``complete`` (True
+    if the track reaches the end of the video). Entries are written to a
+    temporary file and renamed into place, so readers never observe partial
+    writes. Reads refresh an entry's mtime, and the least recently used
+    entries are evicted once the store exceeds ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes=256 << 20):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, video_path, **params):
+        params = json.dumps(params, sort_keys=True, default=list)
+        return hashlib.sha1((video_fingerprint(video_path) + params).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npz')
+
+    def load(self, key, num_frames=None):
+        """Return (boxes, valid) for ``key``, or None if absent or shorter than ``num_frames``."""
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                boxes, valid, complete = entry['boxes'], entry['valid'], bool(entry['complete'])
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+
+        if num_frames is not None and len(boxes) < num_frames and not complete:
+            return None
+        return boxes[:num_frames], valid[:num_frames]
+
+    def save(self, key, boxes, valid, complete):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, boxes=np.asarray(boxes, dtype=np.int32).reshape(-1, 4),
+                         valid=np.asarray(valid, dtype=bool), complete=np.asarray(complete))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in glob(os.path.join(self.root, '*.npz')):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,143 @@
+import os
+import re
+import subprocess
+import tempfile
+import numpy as np
+
+# Codec written by each ffmpeg encoder, for checking whether a source stream
+# can be spliced into the output without re-encoding. Only H.264: the concat
+# demuxer cannot join HEVC segments whose parameter sets differ
+ENCODER_CODECS = {'libx264': 'h264', 'h264_nvenc': 'h264'}
+
+
+class FFmpegWriter(object):
+    """Encode BGR frames and mux an audio track with a single ffmpeg process.
+
+    Frames are streamed to ffmpeg's stdin as raw video, so the output is
+    encoded once, straight to its final codec, with no intermediate file.
+    Mirrors the ``write``/``release`` interface of ``cv2.VideoWriter``.
+    With ``audio_duration``, only that many seconds of the audio are muxed.
+    """
+
+    def __init__(self, path, fps, size, audio_path=None, codec='libx264', crf=18, preset='medium',
+                 threads=0, pix_fmt='yuv420p', profile=None, audio_codec='aac', audio_duration=None, ffmpeg='ffmpeg'):
+        width, height = size
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-nostats',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '{}x{}'.format(width, height),
+                   '-r', str(fps), '-i', '-']
+        if audio_path is not None:
+            command += _audio_input(audio_path, audio_duration) + ['-map', '0:v:0', '-map', '1:a:0', '-c:a', audio_codec]
+        # yuv420p needs even dimensions
+        command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', codec, '-pix_fmt', pix_fmt,
+                    '-threads', str(threads)]
+        if crf is not None:
+            command += ['-crf', str(crf)]
+        if preset:
+            command += ['-preset', preset]
+        if profile:
+            command += ['-profile:v', profile]
+        command.append(path)
+
+        self.path = path
+        self.size = (width, height)
+        # ffmpeg's messages go to a file: a pipe nobody reads until release()
+        # could fill up and stall ffmpeg while write() waits on its stdin
+        self.log = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self.log)
+
+    def write(self, frame):
+        if frame.shape[1::-1] != self.size:
+            raise ValueError('Frame size {} does not match writer size {}'.format(frame.shape[1::-1], self.size))
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.release()
+
+    def release(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        code = proc.wait()
+        with self.log:
+            self.log.seek(0)
+            error = self.log.read().decode(errors='replace')
+        if code != 0:
+            raise RuntimeError('ffmpeg failed to write {}: {}'.format(self.path, error.strip()))
+
+
+def _audio_input(audio_path, duration=None):
+    """ffmpeg input options reading ``audio_path``, cut to ``duration`` seconds if given."""
+    return (['-t', repr(float(duration))] if duration is not None else []) + ['-i', audio_path]
+
+
+def _run(command):
+    proc = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return proc.returncode, proc.stderr.decode(errors='replace')
+
+
+def probe_video(path, ffmpeg='ffmpeg'):
+    """Codec, profile and pixel format of the first video stream of ``path``.
+
+    Parsed from ffmpeg's stream banner, so only the ffmpeg binary is needed.
+    Returns a dict with 'codec', 'profile' (lower case, or None) and
+    'pix_fmt', or None if ``path`` has no video stream.
+    """
+    _, banner = _run([ffmpeg, '-hide_banner', '-i', path])
+    match = re.search(r'Stream #.*?: Video: (\w+)(?: \(([^)]*)\))?[^,]*, (\w+)', banner)
+    if match is None:
+        return None
+    codec, profile, pix_fmt = match.groups()
+    return {'codec': codec, 'profile': profile.lower() if profile else None, 'pix_fmt': pix_fmt}
+
+
+def keyframe_times(path, ffmpeg='ffmpeg'):
+    """Presentation times in seconds of the keyframes of the first video stream.
+
+    Only keyframes are decoded, so this takes a fraction of a second even for
+    long videos.
+    """
+    code, log = _run([ffmpeg, '-hide_banner', '-nostats', '-skip_frame', 'nokey', '-i', path,
+                      '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-'])
+    if code != 0:
+        raise RuntimeError('ffmpeg failed to read keyframes of {}: {}'.format(path, log.strip()))
+    return [float(t) for t in re.findall(r'pts_time:\s*(-?[\d.]+)', log)]
+
+
+def copy_segment(path, start, num_frames, out_path, ffmpeg='ffmpeg'):
+    """Copy ``num_frames`` video frames of ``path`` from the keyframe at ``start`` seconds, without re-encoding."""
+    code, log = _run([ffmpeg, '-y', '-loglevel', 'error', '-ss', repr(start), '-i', path,
+                      '-map', '0:v:0', '-frames:v', str(num_frames), '-c:v', 'copy', out_path])
+    if code != 0:
+        raise RuntimeError('ffmpeg failed to copy {} from {}s: {}'.format(path, start, log.strip()))
+
+
+def concat_segments(paths, out_path, audio_path=None, audio_codec='aac', audio_duration=None, ffmpeg='ffmpeg'):
+    """Join H.264 segments end to end without re-encoding them, muxing in ``audio_path``.
+
+    With ``audio_duration``, only that many seconds of the audio are muxed.
+
+    Copied source video and freshly encoded video have different parameter
+    sets (SPS/PPS), and an MP4 stores only one set in its header. The concat
+    demuxer's auto_convert passes each segment through h264_mp4toannexb,
+    which puts its parameter sets in front of every keyframe, and the MP4
+    muxer keeps them in the samples, so decoders pick up each segment's own
+    set at the splice.
+    """
+    fd, list_path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for p in paths:
+                f.write("file '{}'\n".format(os.path.abspath(p).replace("'", "'\\''")))
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-auto_convert', '1',
+                   '-i', list_path]
+        if audio_path is not None:
+            command += _audio_input(audio_path, audio_duration) + ['-map', '0:v:0', '-map', '1:a:0', '-c:a', audio_codec]
+        code, log = _run(command + ['-c:v', 'copy', out_path])
+    finally:
+        os.remove(list_path)
+    if code != 0:
+        raise RuntimeError('ffmpeg failed to write {}: {}'.format(out_path, log.strip()))
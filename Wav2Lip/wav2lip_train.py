@@ -3,7 +3,7 @@ from tqdm import tqdm
 
 from models import SyncNet_color as SyncNet
 from models import Wav2Lip as Wav2Lip
-import audio
+from dataset_store import load_faces, load_mel
 
 import torch
 from torch import nn
@@ -42,6 +42,8 @@ class Dataset(object):
         self.all_videos = get_image_list(args.data_root, split)
 
     def get_frame_id(self, frame):
+        if type(frame) == int:
+            return frame
         return int(basename(frame).split('.')[0])
 
     def get_window(self, start_frame):
@@ -81,7 +83,7 @@ class Dataset(object):
         
         end_idx = start_idx + syncnet_mel_step_size
 
-        return spec[start_idx : end_idx, :]
+        return np.array(spec[start_idx : end_idx, :], dtype=np.float32)
 
     def get_segmented_mels(self, spec, start_frame):
         mels = []
@@ -105,6 +107,48 @@ class Dataset(object):
 
         return x
 
+    def sample_windows(self, vidname):
+        """A random frame of the video with its window, and the window of another random frame, or None.
+
+        Windows are read from the packed face crops when the video has them,
+        else from its JPEGs. The frame is its number when packed, else its path.
+        """
+        crops = load_faces(vidname, hparams.img_size)
+        if crops is not None:
+            if len(crops) <= 3 * syncnet_T:
+                return None
+            row = random.randrange(len(crops))
+            wrong_row = random.randrange(len(crops))
+            while wrong_row == row:
+                wrong_row = random.randrange(len(crops))
+            window, wrong_window = crops.window(row, syncnet_T), crops.window(wrong_row, syncnet_T)
+            if window is None or wrong_window is None:
+                return None
+            return int(crops.frame_ids[row]), window, wrong_window
+
+        img_names = list(glob(join(vidname, '*.jpg')))
+        if len(img_names) <= 3 * syncnet_T:
+            return None
+
+        img_name = random.choice(img_names)
+        wrong_img_name = random.choice(img_names)
+        while wrong_img_name == img_name:
+            wrong_img_name = random.choice(img_names)
+
+        window_fnames = self.get_window(img_name)
+        wrong_window_fnames = self.get_window(wrong_img_name)
+        if window_fnames is None or wrong_window_fnames is None:
+            return None
+
+        window = self.read_window(window_fnames)
+        if window is None:
+            return None
+
+        wrong_window = self.read_window(wrong_window_fnames)
+        if wrong_window is None:
+            return None
+        return img_name, window, wrong_window
+
     def __len__(self):
         return len(self.all_videos)
 
@@ -112,42 +156,22 @@ class Dataset(object):
         while 1:
             idx = random.randint(0, len(self.all_videos) - 1)
             vidname = self.all_videos[idx]
-            img_names = list(glob(join(vidname, '*.jpg')))
-            if len(img_names) <= 3 * syncnet_T:
-                continue
-            
-            img_name = random.choice(img_names)
-            wrong_img_name = random.choice(img_names)
-            while wrong_img_name == img_name:
-                wrong_img_name = random.choice(img_names)
-
-            window_fnames = self.get_window(img_name)
-            wrong_window_fnames = self.get_window(wrong_img_name)
-            if window_fnames is None or wrong_window_fnames is None:
-                continue
-
-            window = self.read_window(window_fnames)
-            if window is None:
-                continue
-
-            wrong_window = self.read_window(wrong_window_fnames)
-            if wrong_window is None:
+            sample = self.sample_windows(vidname)
+            if sample is None:
                 continue
+            img_name, window, wrong_window = sample
 
             try:
-                wavpath = join(vidname, "audio.wav")
-                wav = audio.load_wav(wavpath, hparams.sample_rate)
-
-                orig_mel = audio.melspectrogram(wav).T
+                orig_mel = load_mel(vidname)
             except Exception as e:
                 continue
 
-            mel = self.crop_audio_window(orig_mel.copy(), img_name)
+            mel = self.crop_audio_window(orig_mel, img_name)
             
             if (mel.shape[0] != syncnet_mel_step_size):
                 continue
 
-            indiv_mels = self.get_segmented_mels(orig_mel.copy(), img_name)
+            indiv_mels = self.get_segmented_mels(orig_mel, img_name)
             if indiv_mels is None: continue
 
             window = self.prepare_window(window)
@@ -30,15 +30,17 @@ class VisualSyncProcessor:
 
     def load_model(self):
         """
-        Load Wav2Lip model (lazy loading).
-        Model is loaded during inference.
+        Create the Wav2Lip engine (lazy loading).
+        The engine loads the model and face detector on first use and keeps
+        them resident for later videos until unload().
         """
-        logger.info("Wav2Lip model will be loaded during inference...")
-        # Wav2Lip's inference.py loads the model internally
-        pass
+        if self.model is None:
+            from Wav2Lip.engine import Wav2LipEngine
+            self.model = Wav2LipEngine(checkpoint_path=self.checkpoint_path)
+        return self.model
 
     def process_video(self, source_path, driving_audio_path, output_path, 
-                     pads=[0, 10, 0, 0], resize_factor=1, nosmooth=False):
+                     pads=[0, 10, 0, 0], resize_factor=1, nosmooth=False, passthrough=False):
         """
         Sync video lips to match audio using Wav2Lip.
         
@@ -49,6 +51,8 @@ class VisualSyncProcessor:
             pads: Padding for face detection [top, bottom, left, right]
             resize_factor: Reduce resolution by this factor (1=original, 2=half)
             nosmooth: Prevent smoothing face detections
+            passthrough: Only lip-sync frames with speech and a face; copy the
+                rest from the source (output follows the audio in time)
             
         Returns:
             Path to output video
@@ -59,18 +63,21 @@ class VisualSyncProcessor:
         logger.info(f"  Output: {output_path}")
         
         try:
-            # Import Wav2Lip inference module
-            from Wav2Lip.inference import run_inference
+            engine = self.load_model()
             
             # Ensure output directory exists
             Path(output_path).parent.mkdir(parents=True, exist_ok=True)
             
             # Run Wav2Lip inference
             logger.info("Running Wav2Lip inference...")
-            result_path = run_inference(
-                face_path=str(source_path),
-                audio_path=str(driving_audio_path),
-                output_path=str(output_path)
+            result_path = engine.run(
+                str(source_path),
+                str(driving_audio_path),
+                str(output_path),
+                pads=tuple(pads),
+                resize_factor=resize_factor,
+                nosmooth=nosmooth,
+                passthrough=passthrough
             )
             
             if result_path and os.path.exists(result_path):
@@ -94,6 +101,7 @@ class VisualSyncProcessor:
         """
         if self.model:
             logger.info("Unloading Wav2Lip model...")
+            self.model.close()
             del self.model
             self.model = None
             device_manager.clear_cache()
@@ -0,0 +1,1059 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add Wav2Lip, whose modules import each other as top-level modules
+sys.path.append(str(Path(__file__).resolve().parent.parent / "Wav2Lip"))
+
+
+def reference_smoothened_boxes(boxes, T):
+    """The per-frame loop face_tracking.get_smoothened_boxes replaced."""
+    for i in range(len(boxes)):
+        if i + T > len(boxes):
+            window = boxes[len(boxes) - T:]
+        else:
+            window = boxes[i: i + T]
+        boxes[i] = np.mean(window, axis=0)
+    return boxes
+
+
+def reference_decode(olist):
+    """The per-anchor loop S3FD's batch_detect decoded candidates with."""
+    import torch
+    from face_detection.detection.sfd.bbox import batch_decode
+    bboxlist = []
+    for i in range(len(olist) // 2):
+        ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+        stride = 2**(i + 2)
+        for _, hindex, windex in zip(*np.where(ocls[:, 1, :, :] > 0.05)):
+            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
+            loc = oreg[:, :, hindex, windex].contiguous().view(len(ocls), 1, 4)
+            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
+            box = batch_decode(loc, priors, [0.1, 0.2])[:, 0]
+            bboxlist.append(torch.cat([box, ocls[:, 1, hindex, windex].unsqueeze(1)], 1).numpy())
+    return np.array(bboxlist) if bboxlist else np.zeros((1, len(olist[0]), 5))
+
+
+class BrightDetector(object):
+    """Detects the bounding box of the non-zero pixels, recording the input sizes."""
+    def __init__(self):
+        self.shapes = []
+
+    def get_detections_for_batch(self, images, scores=False):
+        self.shapes.append(images.shape[1:3])
+        rects = []
+        for image in images:
+            ys, xs = np.nonzero(image[..., 0])
+            score = (1.,) if scores else ()
+            rects.append((xs.min(), ys.min(), xs.max() + 1, ys.max() + 1) + score if len(xs) else None)
+        return rects
+
+
+def write_clip(folder, num_frames, seconds, face_frames=None, fps=25):
+    """A video of a bright square face, shown in the first `face_frames` frames, and `seconds` of noise as its speech."""
+    import os
+    import cv2
+    import soundfile
+
+    face, speech = os.path.join(folder, "face.avi"), os.path.join(folder, "speech.wav")
+    writer = cv2.VideoWriter(face, cv2.VideoWriter_fourcc(*"MJPG"), fps, (160, 120))
+    for i in range(num_frames):
+        frame = np.zeros((120, 160, 3), np.uint8)
+        if face_frames is None or i < face_frames:
+            frame[30:90, 50:110] = 255
+        writer.write(frame)
+    writer.release()
+    rng = np.random.default_rng(0)
+    soundfile.write(speech, 0.3 * rng.normal(size=int(16000 * seconds)), 16000, subtype="PCM_16")
+    return face, speech
+
+
+class TestFaceTracking(unittest.TestCase):
+    def test_smoothened_boxes_match_loop(self):
+        from face_tracking import get_smoothened_boxes
+        rng = np.random.default_rng(0)
+        for n in [0, 1, 3, 5, 6, 100, 1000]:
+            for T in [1, 3, 5]:
+                boxes = rng.integers(0, 1000, (n, 4))
+                np.testing.assert_array_equal(get_smoothened_boxes(boxes.copy(), T),
+                                              reference_smoothened_boxes(boxes.copy(), T))
+
+    def test_stream_matches_offline(self):
+        from face_tracking import smoothen_stream
+        rng = np.random.default_rng(1)
+        boxes = rng.integers(0, 1000, (500, 4))
+        valid = rng.random(500) > 0.2
+        items = [(i, boxes[i] if v else None) for i, v in enumerate(valid)]
+
+        out = list(smoothen_stream(iter(items), T=5, window=32))
+        self.assertEqual([i for i, _ in out], list(range(500)))
+        self.assertEqual([b is None for _, b in out], list(~valid))
+        np.testing.assert_array_equal(np.array([b for _, b in out if b is not None]),
+                                      reference_smoothened_boxes(boxes[valid].copy(), 5))
+
+    def test_long_track(self):
+        from face_tracking import smooth_track
+        rng = np.random.default_rng(2)
+        centre = np.cumsum(rng.normal(size=(100000, 2)), axis=0) + 500
+        boxes = np.concatenate([centre - 60, centre + 60], axis=1)
+        valid = rng.random(100000) > 0.05
+        boxes[rng.integers(0, 100000, 50)] += 400
+
+        for method in ['mean', 'one_euro', 'kalman']:
+            smoothed, mask = smooth_track(boxes, valid, method=method, max_gap=3, outlier_threshold=0.5)
+            self.assertEqual(smoothed.shape, boxes.shape)
+            self.assertGreater(mask.mean(), valid.mean())
+            self.assertLess(np.abs(smoothed[mask] - boxes[mask]).mean(), 10)
+
+
+    def test_smooth_stream(self):
+        from face_tracking import smooth_stream, smooth_track, smoothen_stream
+
+        rng = np.random.default_rng(2)
+        centre = np.cumsum(rng.normal(0, 2, (300, 2)), axis=0) + 500
+        boxes = np.rint(np.concatenate([centre - 60, centre + 60], axis=1)).astype(int)
+        boxes[[50, 170]] += 400  # two detections of something else
+        valid = np.ones(300, bool)
+        valid[[20, 21, 22, 100, 200, 201, 202, 203, 204, 205]] = False  # short gaps, and one too long
+        items = [(i, boxes[i] if v else None) for i, v in enumerate(valid)]
+
+        def streamed(**options):
+            out = list(smooth_stream(iter(items), **options))
+            self.assertEqual([i for i, _ in out], list(range(300)))
+            return np.array([b is not None for _, b in out]), [b for _, b in out]
+
+        kept, got = streamed()
+        expected = [b for _, b in smoothen_stream(iter(items), T=5)]
+        self.assertEqual([None if b is None else list(b) for b in got], [None if b is None else list(b) for b in expected])
+
+        for method, tolerance in [("mean", 0), ("one_euro", 2), ("kalman", 2)]:
+            options = dict(method=method, max_gap=4, outlier_threshold=0.5)
+            offline, offline_kept = smooth_track(boxes, valid, **options)
+            kept, got = streamed(**options)
+            np.testing.assert_array_equal(kept, offline_kept)
+            self.assertTrue(kept[[20, 50, 100, 170]].all())  # short gaps and dropped outliers are filled in
+            self.assertFalse(kept[200])
+            for i in [50, 170]:
+                self.assertLess(np.abs(got[i] - boxes[i - 1]).max(), 50)
+            np.testing.assert_allclose(np.array([b for b in got if b is not None]), offline[kept], atol=tolerance)
+
+    def test_select_keyframes(self):
+        from face_tracking import select_keyframes
+
+        thumbs = [np.zeros((32, 32), np.float32) for _ in range(12)]
+        for i in range(7, 12):
+            thumbs[i] = thumbs[i] + 50  # a cut at frame 7
+        self.assertEqual(select_keyframes(thumbs, 4, 10.), [0, 4, 7, 11])
+        self.assertEqual(select_keyframes(thumbs, 100, 10.), [0, 7, 11])
+        self.assertEqual(select_keyframes(thumbs, 100, 10., first=8), [8, 11])
+
+    def test_keyframe_tracking(self):
+        from face_tracking import keyframe_stream, track_window
+
+        def clip(boxes):
+            """Frames with a bright face at each (x1, y1, x2, y2) box, and none where it is None."""
+            frames = np.zeros((len(boxes), 120, 160, 3), np.uint8)
+            for frame, box in zip(frames, boxes):
+                if box is not None:
+                    x1, y1, x2, y2 = box
+                    frame[y1:y2, x1:x2] = 255
+            return list(frames)
+
+        def detector(frames):
+            """A detect() for `frames`, and the list of frame indices it is run on."""
+            seen = []
+            index = {id(frame): i for i, frame in enumerate(frames)}
+            detect = BrightDetector().get_detections_for_batch
+
+            def run(images):
+                seen.extend(index[id(image)] for image in images)
+                return [None if box is None else tuple(int(v) for v in box) for box in detect(np.array(images))]
+            return run, seen
+
+        # A face drifting right: only keyframes are detected, the rest is interpolated
+        truth = [(10 + i, 20, 50 + i, 60) for i in range(13)]
+        frames = clip(truth)
+        detect, seen = detector(frames)
+        self.assertEqual(track_window(frames, detect, 4, motion_threshold=1e9), truth)
+        self.assertEqual(sorted(seen), [0, 4, 8, 12])
+
+        # A face jumping away between keyframes 4 and 8 is bisected down to the jump
+        truth = [(10, 20, 50, 60)] * 6 + [(100, 60, 140, 100)] * 7
+        frames = clip(truth)
+        detect, seen = detector(frames)
+        self.assertEqual(track_window(frames, detect, 4, motion_threshold=1e9), truth)
+        self.assertEqual(sorted(seen), [0, 4, 5, 6, 8, 12])
+
+        # So is a face appearing, and one vanishing
+        for truth in [[None] * 6 + [(10, 20, 50, 60)] * 7, [(10, 20, 50, 60)] * 3 + [None] * 10]:
+            frames = clip(truth)
+            detect, seen = detector(frames)
+            self.assertEqual(track_window(frames, detect, 4, motion_threshold=1e9), truth)
+
+        # Motion forces a keyframe, and detections already known are not repeated
+        truth = [(10, 20, 50, 60)] * 3 + [(100, 60, 140, 100)] * 3
+        frames = clip(truth)
+        detect, seen = detector(frames)
+        self.assertEqual(track_window(frames, detect, 100, motion_threshold=1., known={0: truth[0]}), truth)
+        self.assertEqual(sorted(seen), [1, 2, 3, 5])  # the cut at 3, the last frame, then 0-3 bisected
+
+        # Streamed over windows, the boxes are the same as over the whole clip
+        truth = [(10 + i, 20 + i, 50 + i, 60 + i) for i in range(30)]
+        frames = clip(truth)
+        detect, seen = detector(frames)
+        pairs = list(keyframe_stream(iter(frames), detect, 4, window=8, motion_threshold=1e9))
+        self.assertEqual([id(frame) for frame, _ in pairs], [id(frame) for frame in frames])
+        self.assertEqual([box for _, box in pairs], truth)
+        self.assertEqual(len(seen), len(set(seen)))  # window ends are carried over, not detected again
+
+
+class TestS3FD(unittest.TestCase):
+    def test_decode_matches_loop(self):
+        import torch
+        from face_detection.detection.sfd.detect import decode_batch
+        torch.manual_seed(0)
+        for batch_size, scale in [(1, 1.), (3, 1.), (3, 0.)]:
+            olist = []
+            for i in range(6):
+                size = 64 >> i
+                olist.append(torch.softmax(scale * 3 * torch.randn(batch_size, 2, size, size // 2 + 1), dim=1))
+                olist.append(torch.randn(batch_size, 4, size, size // 2 + 1))
+            if scale == 0:  # no candidate clears the threshold
+                olist[::2] = [o * torch.tensor([1., 0.]).view(1, 2, 1, 1) for o in olist[::2]]
+            expected = reference_decode(olist)
+            got = decode_batch(olist)
+            self.assertEqual(got.dtype, expected.dtype)
+            np.testing.assert_array_equal(got, expected)
+
+    def test_uint8_input(self):
+        import torch
+        from face_detection.detection.sfd.net_s3fd import s3fd
+        frames = np.random.default_rng(0).integers(0, 256, (2, 24, 40, 3), dtype=np.uint8)
+        expected = torch.from_numpy((frames[..., ::-1] - np.array([104, 117, 123])).transpose(0, 3, 1, 2)).float()
+        net = s3fd()
+        self.assertTrue(torch.equal(net.normalize(torch.from_numpy(frames), bgr=True), expected))
+        self.assertTrue(torch.equal(net.normalize(torch.from_numpy(frames[..., ::-1].copy())), expected))
+
+    def test_min_face_size_skips_heads(self):
+        import torch
+        from face_detection.detection.sfd.detect import decode_batch, first_head, head_outputs
+        from face_detection.detection.sfd.net_s3fd import s3fd
+        self.assertEqual([first_head(size) for size in (0, 31, 32, 64, 128, 1000)], [0, 0, 1, 2, 3, 3])
+        torch.manual_seed(0)
+        net = s3fd().eval()
+        frames = np.random.default_rng(0).integers(0, 256, (2, 64, 96, 3), dtype=np.uint8)
+        full = head_outputs(net, frames, 'cpu')
+        skipped = head_outputs(net, frames, 'cpu', min_face_size=64)
+        self.assertEqual([o is None for o in skipped], [True] * 4 + [False] * 8)
+        for got, expected in zip(skipped[4:], full[4:]):
+            self.assertTrue(torch.allclose(got, expected))
+        np.testing.assert_array_equal(decode_batch(skipped), decode_batch([None] * 4 + full[4:]))
+
+    def test_quantized_s3fd(self):
+        import tempfile
+        import torch
+        from face_detection.detection.sfd.net_s3fd import s3fd
+        from face_detection.detection.sfd.quantized import cached_quantized, load_quantized, quantize
+        torch.manual_seed(0)
+        net = s3fd().eval()
+        frames = np.random.default_rng(0).integers(0, 256, (3, 64, 96, 3), dtype=np.uint8)
+        qnet = quantize(net, frames[:2])
+        with torch.no_grad():
+            expected = net(torch.from_numpy(frames[2:]), bgr=True)
+            got = qnet(torch.from_numpy(frames[2:]), bgr=True)
+            self.assertEqual([o.shape for o in got], [o.shape for o in expected])
+            for a, b in zip(got, expected):
+                self.assertLess(float((a - b).abs().max()), 0.1 * float(b.abs().max()) + 1e-3)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = str(Path(tmp) / "s3fd.int8.pth")
+                torch.save(qnet.state_dict(), path)
+                for a, b in zip(load_quantized(path)(torch.from_numpy(frames[2:]), bgr=True), got):
+                    self.assertTrue(torch.equal(a, b))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            face, _ = write_clip(tmp, 8, 0.1)
+            cached_quantized(net, str(Path(tmp) / "s3fd.pth"), "qnnpack", videos=[face])
+            # Written under a temporary name and renamed into place
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()),
+                             ["face.avi", "s3fd.int8-qnnpack.pth", "speech.wav"])
+
+    def test_batch_nms_matches_nms(self):
+        from face_detection.detection.sfd.bbox import batch_nms, best_detection, nms
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 200, (400, 3, 2))
+        wh = rng.uniform(10, 60, (400, 3, 2))
+        scores = rng.permutation(400 * 3).reshape(400, 3, 1) / 1200.
+        dets = np.concatenate([xy, xy + wh, scores], axis=2).astype(np.float32)
+        dets[:, 2, 4] *= 0.4  # nothing above the score threshold
+
+        kept = batch_nms(dets, 0.3)
+        best = best_detection(dets)
+        for i in range(3):
+            expected = dets[nms(dets[:, i], 0.3), i]
+            expected = expected[expected[:, 4] > 0.5]
+            np.testing.assert_array_equal(kept[i], expected)
+            if len(expected):
+                np.testing.assert_array_equal(best[i], expected[0])
+            else:
+                self.assertIsNone(best[i])
+        self.assertEqual(len(batch_nms(dets, 0.3, top_k=20)[0]), len(nms(dets[np.argsort(-dets[:, 0, 4])[:20], 0], 0.3)))
+
+    def test_onnx_detector(self):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            self.skipTest("onnxruntime is not installed")
+        import tempfile
+        import torch
+        from face_detection.detection.onnx import FaceDetector
+
+        class Fixed(torch.nn.Module):
+            """Three anchors with fixed scores and relative boxes, whatever the input."""
+            def forward(self, x):
+                zero = 0 * x.mean(dim=(1, 2, 3)).view(-1, 1, 1)
+                scores = torch.tensor([[0.2, 0.8], [0.1, 0.9], [0.6, 0.4]]) + zero
+                boxes = torch.tensor([[0.1, 0.1, 0.5, 0.5], [0.12, 0.1, 0.5, 0.52], [0.6, 0.6, 0.9, 0.9]]) + zero
+                return scores, boxes
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "detector.onnx")
+            torch.onnx.export(Fixed(), (torch.zeros(1, 3, 240, 320),), path, dynamo=False,
+                              input_names=["input"], output_names=["scores", "boxes"],
+                              dynamic_axes={"input": {0: "batch"}, "scores": {0: "batch"}, "boxes": {0: "batch"}})
+            detector = FaceDetector("cpu", path_to_detector=path)
+            images = np.zeros((2, 100, 200, 3), dtype=np.uint8)
+            kept = detector.detect_from_batch(images, bgr=True)
+            best = detector.detect_from_batch(images, best_only=True)
+        self.assertEqual([len(k) for k in kept], [1, 1])  # the overlapping 0.8 box is suppressed
+        np.testing.assert_allclose(best[0], [[24, 10, 100, 52, 0.9]], rtol=1e-6)
+        np.testing.assert_allclose(kept[1], best[1])
+
+        # Missing models are not downloaded unverified
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaisesRegex(FileNotFoundError, "download it from https://.*--face_detector_path"):
+                FaceDetector("cpu", path_to_detector=str(Path(tmp) / "version-RFB-320.onnx"))
+            self.assertEqual(list(Path(tmp).iterdir()), [])
+
+    def test_missing_cascade(self):
+        from face_detection.detection.cascade.cascade_detector import find_cascade
+
+        with self.assertRaisesRegex(FileNotFoundError, "data/lbpcascades and pass it with --face_detector_path"):
+            find_cascade("lbpcascade_missing.xml")
+
+
+class TestAudio(unittest.TestCase):
+    def test_torch_mel_matches_librosa(self):
+        import torch
+        import audio
+
+        rng = np.random.default_rng(0)
+        t = np.arange(16000 * 3) / 16000.
+        speechlike = (0.3 * np.sin(2 * np.pi * 180 * t) * (1 + np.sin(2 * np.pi * 3 * t)) +
+                      0.05 * rng.normal(size=t.shape)).astype(np.float32)
+        # Lengths on and off the hop, shorter than one FFT, and a silent one at the clipping floor
+        wavs = [speechlike, speechlike[:12345], speechlike[:4000], speechlike[:300], np.zeros(2000, np.float32)]
+        expected = [audio.librosa_melspectrogram(wav) for wav in wavs]
+        for dtype, tolerance in [(torch.float32, 1e-4), (torch.float64, 1e-6)]:
+            got = audio.melspectrograms(wavs, dtype=dtype, block_frames=50)  # several blocks
+            for e, g in zip(expected, got):
+                self.assertEqual(g.shape, e.shape)
+                self.assertLess(np.abs(g - e).max(), tolerance)
+        # melspectrogram goes through the torch frontend by default (hparams.mel_frontend)
+        np.testing.assert_array_equal(audio.melspectrogram(wavs[2]), audio.melspectrograms([wavs[2]])[0])
+
+    def test_streaming_mel_chunks(self):
+        import audio
+
+        def loop_chunks(mel, fps):  # the engine's previous chunking
+            chunks, i = [], 0
+            while 1:
+                start_idx = int(i * 80. / fps)
+                if start_idx + 16 > len(mel[0]):
+                    chunks.append(mel[:, len(mel[0]) - 16:])
+                    break
+                chunks.append(mel[:, start_idx: start_idx + 16])
+                i += 1
+            return chunks
+
+        rng = np.random.default_rng(0)
+        wav = (0.1 * rng.normal(size=16000 * 3 + 77)).astype(np.float32)
+        mel = audio.melspectrograms([wav])[0]
+        stream, parts, i = audio.MelStream(), [], 0
+        while i < len(wav):
+            size = int(rng.integers(1, 3000))  # blocks shorter and longer than an STFT window
+            parts.append(stream.push(wav[i:i + size]))
+            i += size
+        parts.append(stream.finish())
+        np.testing.assert_allclose(np.concatenate(parts, axis=1), mel, atol=1e-4)
+
+        for fps in [25, 29.97, 24]:
+            expected = loop_chunks(mel, fps)
+            chunks = audio.MelChunks(mel, fps, 16)
+            self.assertEqual(len(chunks), len(expected))
+            self.assertEqual(audio.num_mel_chunks(len(wav), fps, 16), len(expected))
+            for e, c in zip(expected, chunks):
+                np.testing.assert_array_equal(c, e)
+                self.assertTrue(np.shares_memory(c, mel))
+            streamed = list(audio.stream_mel_chunks((wav[j:j + 1234] for j in range(0, len(wav), 1234)), fps, 16))
+            self.assertEqual(len(streamed), len(expected))
+            for e, c in zip(expected, streamed):
+                np.testing.assert_allclose(c, e, atol=1e-4)
+
+    def test_load_wav_matches_librosa(self):
+        import shutil
+        import tempfile
+        import warnings
+        import soundfile
+        import audio
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            at_rate = str(Path(tmp) / "16k.wav")
+            soundfile.write(at_rate, 0.1 * rng.normal(size=16000 * 2), 16000, subtype="PCM_16")
+            wav = audio.load_wav(at_rate, 16000)
+            self.assertEqual(wav.dtype, np.float32)
+            np.testing.assert_array_equal(wav, audio.librosa_load_wav(at_rate, 16000))
+
+            stereo = str(Path(tmp) / "24k.wav")
+            t = np.arange(24000 * 2) / 24000.
+            soundfile.write(stereo, np.stack([np.sin(2 * np.pi * 300 * t), 0.1 * rng.normal(size=t.shape)], 1),
+                            24000, subtype="PCM_16")
+            paths = [stereo]
+            if shutil.which("ffmpeg"):
+                paths.append(str(Path(__file__).resolve().parent.parent / "class3.mp4"))
+            for path in paths:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")  # librosa decoding through audioread
+                    expected = audio.librosa_load_wav(path, 16000)
+                wav = audio.load_wav(path, 16000)
+                self.assertEqual(wav.shape, expected.shape)
+                # Resamplers differ near the Nyquist frequency only, i.e. in the top mel bands
+                diff = np.abs(audio.melspectrogram(wav) - audio.melspectrogram(expected))
+                self.assertLess(diff.mean(), 0.01)
+                self.assertLess(diff[:70].max(), 0.2)
+
+
+class TestDatasetStore(unittest.TestCase):
+    def test_mel_store(self):
+        import os
+        import tempfile
+        import soundfile
+        import audio
+        from dataset_store import MEL_FILE, load_mel, save_mel
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            soundfile.write(os.path.join(tmp, "audio.wav"), 0.1 * rng.normal(size=16000 * 2), 16000, subtype="PCM_16")
+            expected = audio.melspectrogram(audio.load_wav(os.path.join(tmp, "audio.wav"), 16000)).T
+            np.testing.assert_allclose(load_mel(tmp), expected)  # computed while there is no store
+
+            for dtype, tolerance in [("float32", 1e-6), ("float16", 4e-3)]:
+                save_mel(tmp, dtype)
+                mel = load_mel(tmp)
+                self.assertIsInstance(mel, np.memmap)
+                self.assertEqual(mel.dtype, np.dtype(dtype))
+                self.assertEqual(mel.shape, expected.shape)
+                self.assertTrue(mel.flags.c_contiguous)
+                self.assertLessEqual(np.abs(mel - expected).max(), tolerance)
+
+            # A store older than its audio is ignored
+            stored = os.path.getmtime(os.path.join(tmp, MEL_FILE))
+            os.utime(os.path.join(tmp, "audio.wav"), (stored + 10, stored + 10))
+            self.assertNotIsInstance(load_mel(tmp), np.memmap)
+            with self.assertRaises(ValueError):
+                save_mel(tmp, "int8")
+
+    def test_packed_faces(self):
+        import os
+        import tempfile
+        import cv2
+        from dataset_store import load_faces, pack_faces, save_faces
+
+        rng = np.random.default_rng(0)
+        frame_ids = [i for i in range(12) if i not in (4, 9)]  # frames without a face have no crop
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(load_faces(tmp, 96))
+            jpegs = {}
+            for i in frame_ids:
+                cv2.imwrite(os.path.join(tmp, "{}.jpg".format(i)), rng.integers(0, 256, (70, 60, 3), dtype=np.uint8))
+                jpegs[i] = cv2.resize(cv2.imread(os.path.join(tmp, "{}.jpg".format(i))), (96, 96))
+            pack_faces(tmp, 96)
+            self.assertIsNone(load_faces(tmp, 48))  # packed at another size
+
+            crops = load_faces(tmp, 96)
+            self.assertEqual(len(crops), len(frame_ids))
+            np.testing.assert_array_equal(crops.frame_ids, frame_ids)
+            for row, i in enumerate(frame_ids):
+                np.testing.assert_array_equal(crops.faces[row], jpegs[i])
+            window = crops.window(frame_ids.index(5), 3)  # frames 5, 6, 7
+            self.assertEqual(window.shape, (3, 96, 96, 3))
+            self.assertTrue(np.shares_memory(window, crops.faces))
+            self.assertIsNone(crops.window(frame_ids.index(2), 3))  # 2, 3 and 5: frame 4 is missing
+            self.assertIsNone(crops.window(len(frame_ids) - 2, 3))  # past the last crop
+            with self.assertRaises(ValueError):
+                save_faces(tmp, [3, 1], np.zeros((2, 96, 96, 3), np.uint8))
+
+            # Packing again replaces the mapped crops
+            save_faces(tmp, [0, 1], np.full((2, 96, 96, 3), 7, np.uint8))
+            stored = os.path.getmtime(os.path.join(tmp, "faces.npy"))
+            os.utime(os.path.join(tmp, "faces.npy"), (stored + 10, stored + 10))
+            crops = load_faces(tmp, 96)
+            self.assertEqual(len(crops), 2)
+            self.assertTrue((crops.faces[:] == 7).all())
+
+    def test_open_faces_cap(self):
+        import os
+        import tempfile
+        import dataset_store
+        from dataset_store import load_faces, save_faces
+        from hparams import hparams
+
+        saved = hparams.open_videos
+        hparams.set_hparam("open_videos", 2)
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                folders = [os.path.join(tmp, str(i)) for i in range(3)]
+                for folder in folders:
+                    os.mkdir(folder)
+                    save_faces(folder, [0], np.zeros((1, 96, 96, 3), np.uint8))
+                    load_faces(folder, 96)
+                self.assertEqual([key[0] for key in dataset_store._open_faces][-2:], folders[1:])
+                self.assertLessEqual(len(dataset_store._open_faces), 2)  # one open file per mapped video
+                dataset_store._open_faces.clear()
+        finally:
+            hparams.set_hparam("open_videos", saved)
+
+
+class TestTrackCache(unittest.TestCase):
+    def test_face_track_cache(self):
+        import os
+        import tempfile
+        from track_cache import FaceTrackCache
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            video = os.path.join(tmp, "face.mp4")
+            with open(video, "wb") as f:
+                f.write(rng.bytes(1 << 21))
+            cache = FaceTrackCache(os.path.join(tmp, "tracks"), max_bytes=1 << 30)
+
+            key = cache.key(video, pads=(0, 10, 0, 0), resize_factor=2)
+            self.assertEqual(key, cache.key(video, resize_factor=2, pads=[0, 10, 0, 0]))
+            self.assertNotEqual(key, cache.key(video, pads=(0, 10, 0, 0), resize_factor=1))
+            with open(video, "r+b") as f:  # other content in the middle of the file
+                f.seek(1 << 20)
+                f.write(b"\0" * (1 << 16))
+            self.assertNotEqual(key, cache.key(video, pads=(0, 10, 0, 0), resize_factor=2))
+            self.assertIsNone(cache.load(key))
+
+            boxes = rng.integers(0, 1000, (10, 4))
+            valid = rng.random(10) > 0.3
+            cache.save(key, boxes, valid, complete=False)
+            self.assertEqual(os.listdir(cache.root), [key + ".npz"])  # the temporary file was renamed into place
+            loaded_boxes, loaded_valid = cache.load(key, 8)
+            np.testing.assert_array_equal(loaded_boxes, boxes[:8])
+            np.testing.assert_array_equal(loaded_valid, valid[:8])
+            self.assertIsNone(cache.load(key, 12))  # a partial track cannot cover more frames
+            cache.save(key, boxes, valid, complete=True)
+            self.assertEqual(len(cache.load(key, 12)[0]), 10)  # the whole video was tracked
+
+            # loads refresh the mtime, so the least recently used entries go first
+            entries = []
+            for i in range(4):
+                entries.append("entry{}".format(i))
+                cache.save(entries[-1], rng.integers(0, 1000, (20000, 4)), np.ones(20000, bool), complete=True)
+                os.utime(cache._path(entries[-1]), (i, i))
+            os.utime(cache._path(key), (0, 0))
+            self.assertIsNotNone(cache.load(entries[0]))
+            size = os.path.getsize(cache._path(entries[0]))
+            cache.max_bytes = 3 * size
+            cache.save("entry4", np.zeros((0, 4)), np.zeros(0, bool), complete=True)  # saving evicts
+            self.assertEqual(sorted(os.listdir(cache.root)), [e + ".npz" for e in (entries[0], entries[3], "entry4")])
+
+
+class TestSegments(unittest.TestCase):
+    def test_speech_mask(self):
+        from segments import speech_mask
+        sr, fps = 16000, 25
+        rng = np.random.default_rng(0)
+        wav = np.zeros(10 * sr)
+        wav[2 * sr: 4 * sr] = rng.normal(0, 0.1, 2 * sr)
+        wav[4 * sr + 3200: 6 * sr] = rng.normal(0, 0.1, 2 * sr - 3200)
+
+        mask = speech_mask(wav, sr, fps, 250, min_silence=0.5, pad=0.2)
+        expected = np.zeros(250, dtype=bool)
+        expected[45:155] = True
+        np.testing.assert_array_equal(mask, expected)
+        self.assertFalse(speech_mask(np.zeros(sr), sr, fps, 25).any())
+
+    def test_plan_segments(self):
+        from segments import plan_segments
+        render = np.zeros(100, dtype=bool)
+        render[10:20] = True
+        render[70:75] = True
+        keyframes = [0, 15, 30, 45, 60, 90]
+
+        self.assertEqual(plan_segments(render, keyframes, 10),
+                         [('encode', 0, 30), ('copy', 30, 60), ('encode', 60, 90), ('copy', 90, 100)])
+        self.assertEqual(plan_segments(render, keyframes, 40), [('encode', 0, 100)])
+        self.assertEqual(plan_segments(np.zeros(100, dtype=bool), keyframes, 10), [('copy', 0, 100)])
+
+
+class TestBatching(unittest.TestCase):
+    def test_buffers_match_lists(self):
+        import cv2
+        import torch
+        from batching import BatchBuffers
+        rng = np.random.default_rng(0)
+        faces = [rng.integers(0, 256, (int(rng.integers(60, 200)), 120, 3), dtype=np.uint8) for _ in range(5)]
+        mels = [rng.normal(size=(80, 16)) for _ in range(5)]
+
+        img = np.asarray([cv2.resize(f, (96, 96)) for f in faces])
+        masked = img.copy()
+        masked[:, 48:] = 0
+        img = np.concatenate((masked, img), axis=3) / 255.
+        expected_img = torch.FloatTensor(np.transpose(img, (0, 3, 1, 2)))
+        expected_mel = torch.FloatTensor(np.asarray(mels)[:, None])
+
+        buffers = BatchBuffers(8, 96, (80, 16))
+        for _ in range(2):  # reused buffers give the same batch
+            buffers.release()
+            for f, m in zip(faces, mels):
+                buffers.add(f, m)
+            img_batch, mel_batch = buffers.tensors()
+            self.assertTrue(torch.equal(img_batch, expected_img))
+            self.assertTrue(torch.equal(mel_batch, expected_mel))
+
+    def test_paste_faces(self):
+        import cv2
+        import torch
+        from batching import paste_faces, quantise
+        pred = torch.rand(2, 3, 96, 96)
+        faces = quantise(pred)
+        np.testing.assert_array_equal(faces, (pred.numpy().transpose(0, 2, 3, 1) * 255.).astype(np.uint8))
+
+        frames = [np.zeros((100, 100, 3), np.uint8) for _ in range(3)]
+        paste_faces(faces, frames, [(10, 50, 20, 80), None, (0, 100, 0, 100)])
+        np.testing.assert_array_equal(frames[0][10:50, 20:80], cv2.resize(faces[0], (60, 40)))
+        self.assertEqual(frames[0].sum(), frames[0][10:50, 20:80].sum())
+        self.assertFalse(frames[1].any())
+        np.testing.assert_array_equal(frames[2], cv2.resize(faces[1], (100, 100)))
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stage(self):
+        import threading
+        from pipeline import PipelineStats, Stage
+
+        stats = PipelineStats()
+        self.assertEqual(list(Stage("numbers", iter(range(100)), 4, stats)), list(range(100)))
+        self.assertEqual(stats.stages["numbers"].items, 100)
+        self.assertLessEqual(stats.stages["numbers"].max_depth, 4)
+
+        def failing():
+            yield 1
+            raise KeyError("decode failed")
+
+        with self.assertRaisesRegex(KeyError, "decode failed"):  # re-raised on the consuming thread
+            list(Stage("failing", failing(), 2))
+
+        # A consumer that stops early stops every stage up the chain, which close their sources
+        closed = threading.Event()
+
+        def endless():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+
+        first = Stage("first", endless(), 2)
+        second = Stage("second", iter(first), 2)
+        items = iter(second)
+        self.assertEqual([next(items) for _ in range(3)], [0, 1, 2])
+        items.close()
+        second._thread.join(5)
+        first._thread.join(5)
+        self.assertFalse(second._thread.is_alive())
+        self.assertFalse(first._thread.is_alive())
+        self.assertTrue(closed.is_set())
+
+    def test_map_stage(self):
+        import time
+        from pipeline import map_stage
+
+        rng = np.random.default_rng(0)
+        delays = rng.random(40) * 0.01
+
+        def work(i):
+            time.sleep(delays[i])  # later items often finish first
+            return i * i
+
+        self.assertEqual(list(map_stage("square", work, iter(range(40)), 4, 3)), [i * i for i in range(40)])
+
+        def fail(i):
+            if i == 5:
+                raise ValueError("bad item")
+            return i
+
+        with self.assertRaisesRegex(ValueError, "bad item"):
+            list(map_stage("fail", fail, iter(range(10)), 2, 2))
+
+    def test_serial_pipeline(self):
+        import threading
+        from dataclasses import replace
+        from engine import Wav2LipEngine, _Job
+
+        engine = Wav2LipEngine(device="cpu", checkpoint_path="missing.pth")
+        job = _Job(engine, replace(engine.config, pipeline_queue_size=0), "face.mp4", None, None)
+        source = iter(range(3))
+        self.assertIs(job.stage("decode", source), source)  # no worker thread
+
+        threads = threading.active_count()
+        frames = np.zeros((4, 32, 32, 3), np.uint8)
+        faces = job.stage("detect", ((frame[:8, :8], (0, 8, 0, 8), frame) for frame in frames))
+        self.assertIsInstance(job.render(faces, iter([])), map)  # pasted on the calling thread
+        self.assertEqual(threading.active_count(), threads)
+
+
+class TestVideoIO(unittest.TestCase):
+    def test_ffmpeg_writer(self):
+        import os
+        import subprocess
+        import tempfile
+        import cv2
+        import soundfile
+        from video_io import FFmpegWriter
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            speech = os.path.join(tmp, "speech.wav")
+            soundfile.write(speech, 0.1 * rng.normal(size=16000), 16000, subtype="PCM_16")
+            for width, height in [(64, 48), (97, 75)]:  # odd sizes are padded to even for yuv420p
+                out = os.path.join(tmp, "out_{}x{}.mp4".format(width, height))
+                writer = FFmpegWriter(out, 25, (width, height), audio_path=speech, preset="ultrafast")
+                for _ in range(10):
+                    writer.write(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+                with self.assertRaises(ValueError):
+                    writer.write(np.zeros((height + 1, width, 3), np.uint8))
+                writer.release()
+                writer.release()  # a second release does nothing
+
+                self.assertGreater(os.path.getsize(out), 1000)
+                streams = subprocess.run(["ffmpeg", "-hide_banner", "-i", out], stderr=subprocess.PIPE).stderr.decode()
+                self.assertEqual(streams.count("Stream #0:"), 2)
+                self.assertIn("Audio: aac", streams)
+                capture = cv2.VideoCapture(out)
+                self.assertEqual(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), width + width % 2)
+                self.assertEqual(int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)), height + height % 2)
+                count = 0
+                while capture.grab():
+                    count += 1
+                capture.release()
+                self.assertEqual(count, 10)
+
+            writer = FFmpegWriter(os.path.join(tmp, "out.mp4"), 25, (64, 48), audio_path=os.path.join(tmp, "missing.wav"))
+            with self.assertRaisesRegex(RuntimeError, "missing.wav"):  # ffmpeg's message is kept
+                writer.write(np.zeros((48, 64, 3), np.uint8))
+                writer.release()
+
+    def test_concat_segments(self):
+        import os
+        import subprocess
+        import tempfile
+        import cv2
+        from video_io import FFmpegWriter, concat_segments, copy_segment, keyframe_times
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # A source whose parameter sets differ from the re-encoded segments'
+            source = os.path.join(tmp, "source.mp4")
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=25",
+                            "-frames:v", "75", "-c:v", "libx264", "-preset", "ultrafast", "-g", "25",
+                            "-pix_fmt", "yuv420p", source], check=True)
+            times = keyframe_times(source)
+            self.assertEqual(len(times), 3)
+
+            capture = cv2.VideoCapture(source)
+            frames = [capture.read()[1] for _ in range(75)]
+            capture.release()
+            paths = [os.path.join(tmp, "segment_{}.mp4".format(i)) for i in range(3)]
+            for path, start in [(paths[0], 0), (paths[2], 50)]:
+                writer = FFmpegWriter(path, 25, (160, 120), crf=18, preset="medium", profile="high")
+                for frame in frames[start:start + 25]:
+                    writer.write(frame)
+                writer.release()
+            copy_segment(source, times[1], 25, paths[1])
+
+            out = os.path.join(tmp, "out.mp4")
+            concat_segments(paths, out)
+            decode = subprocess.run(["ffmpeg", "-loglevel", "error", "-i", out, "-f", "null", "-"],
+                                    stderr=subprocess.PIPE)
+            self.assertEqual(decode.stderr.decode(), "")
+            capture = cv2.VideoCapture(out)
+            decoded = [frame for ok, frame in iter(capture.read, (False, None))]
+            capture.release()
+            self.assertEqual(len(decoded), 75)
+            for i in range(25, 50):  # the copied frames come out as they went in
+                np.testing.assert_array_equal(decoded[i], frames[i])
+
+
+class TestEngine(unittest.TestCase):
+    def test_cli_config(self):
+        saved = sys.argv
+        sys.argv = ["inference.py", "--unknown-flag"]
+        try:
+            import inference  # parses nothing at import
+        finally:
+            sys.argv = saved
+        from engine import Wav2LipConfig
+        config = inference.config_from_args(inference.parser.parse_args(
+            ["--resize_factor", "1", "--pads", "0", "20", "0", "0", "--nosmooth"]))
+        self.assertEqual(config.resize_factor, 1)
+        self.assertEqual(list(config.pads), [0, 20, 0, 0])
+        self.assertTrue(config.nosmooth)
+        config = inference.config_from_args(inference.parser.parse_args(["--smooth_method", "kalman", "--smooth_max_gap", "3"]))
+        self.assertEqual((config.smooth_method, config.smooth_max_gap), ("kalman", 3))
+        defaults = inference.config_from_args(inference.parser.parse_args([]))
+        self.assertEqual(defaults.crop, list(Wav2LipConfig().crop))
+        self.assertEqual(defaults.wav2lip_batch_size, Wav2LipConfig().wav2lip_batch_size)
+        self.assertEqual(defaults.face_track_cache, Wav2LipConfig().face_track_cache)
+        self.assertTrue(Path(defaults.face_track_cache).is_absolute())  # not wherever the caller runs from
+
+    def test_fixed_options(self):
+        from engine import Wav2LipEngine
+        engine = Wav2LipEngine(device="cpu", checkpoint_path="missing.pth")
+        with self.assertRaises(ValueError):
+            engine.run("face.mp4", "speech.wav", "out.mp4", checkpoint_path="other.pth")
+        with self.assertRaises(ValueError):
+            engine.run("missing.mp4", "speech.wav", "out.mp4", resize_factor=1)
+        self.assertEqual(engine.config.resize_factor, 2)
+
+    def test_proxy_detection(self):
+        from dataclasses import replace
+        from engine import Wav2LipEngine, _Job
+
+        frames = np.zeros((2, 2160, 3840, 3), dtype=np.uint8)
+        frames[0, 800:1200, 1000:1400] = 255
+        engine = Wav2LipEngine(device="cpu", checkpoint_path="missing.pth")
+        job = _Job(engine, replace(engine.config, detect_face_size=100, pads=(0, 0, 0, 0)), "face.mp4", None, None)
+        job._detector = BrightDetector()
+        boxes = job.face_detect(list(frames))
+        self.assertAlmostEqual(job.detect_scale, 0.25, delta=0.02)  # sized from a face measured on the 240p probe
+        self.assertEqual(job._detector.shapes[-1], (round(2160 * job.detect_scale), round(3840 * job.detect_scale)))
+        np.testing.assert_allclose(boxes[0], [1000, 800, 1400, 1200], atol=4)
+        self.assertIsNone(boxes[1])
+
+        # a face drifting right, then jumping out of the region around it
+        frames = np.zeros((6, 1080, 1920, 3), dtype=np.uint8)
+        for i, x in enumerate([600, 610, 620, 630, 1500, 1510]):
+            frames[i, 400:700, x:x + 300] = 255
+        job = _Job(engine, replace(engine.config, roi_detection=True, face_det_batch_size=2, pads=(0, 0, 0, 0)),
+                   "face.mp4", None, None)
+        job._detector = BrightDetector()
+        boxes = job.face_detect(list(frames))
+        self.assertEqual([tuple(b) for b in boxes], [(x, 400, x + 300, 700) for x in [600, 610, 620, 630, 1500, 1510]])
+        self.assertEqual(job._detector.shapes[:2], [(1080, 1920), (608, 608)])
+        self.assertEqual((job.roi_detections, job.full_detections), (4, 4))  # the last batch is found again in full
+
+    def test_face_stream(self):
+        import os
+        import tempfile
+        import cv2
+        from dataclasses import replace
+        from engine import Wav2LipEngine, _Job, count_frames
+
+        frames = np.zeros((20, 64, 64, 3), dtype=np.uint8)
+        frames[:3, 10:40, 20:50] = 255  # a face in the first 3 frames only
+        consumed = []
+
+        def file_reader():
+            """Reads `frames` once, like a file removed after the first pass."""
+            passes = []
+
+            def reader(limit):
+                passes.append(limit)
+                for frame in frames[:limit] if len(passes) == 1 else []:
+                    consumed.append(frame)
+                    yield frame
+            return reader
+
+        engine = Wav2LipEngine(device="cpu", checkpoint_path="missing.pth")
+        config = replace(engine.config, nosmooth=True, face_track_cache="", pads=(0, 0, 0, 0), face_det_batch_size=2)
+        job = _Job(engine, config, "missing.mp4", None, None)
+        job._detector = BrightDetector()
+        stream = job.face_stream(6, reader=file_reader())
+        self.assertEqual(len([next(stream) for _ in range(3)]), 3)
+        with self.assertRaisesRegex(ValueError, "read again"):  # instead of reading nothing forever
+            next(stream)
+
+        consumed.clear()
+        job = _Job(engine, config, "missing.mp4", None, None)
+        job._detector = BrightDetector()
+        stream = job.face_stream(20, reader=file_reader())
+        self.assertEqual(len([next(stream) for _ in range(3)]), 3)
+        with self.assertRaisesRegex(ValueError, "Too few faces"):  # 11 of 20 frames without a face
+            next(stream)
+        self.assertLess(len(consumed), 20)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "face.avi")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 64))
+            for frame in frames[:10]:
+                writer.write(frame)
+            writer.release()
+            self.assertEqual(count_frames(path), 10)
+        self.assertEqual(count_frames("missing.mp4"), 0)
+
+    def test_rejected_clip_leaves_no_output(self):
+        import os
+        import tempfile
+        from contextlib import nullcontext
+        import torch
+        from engine import Wav2LipEngine
+
+        with tempfile.TemporaryDirectory() as tmp:
+            face, speech = write_clip(tmp, 200, 8., face_frames=90)  # the face is gone after frame 90
+            engine = Wav2LipEngine(device="cpu", checkpoint_path="missing.pth", face_track_cache="", resize_factor=1,
+                                   nosmooth=True, wav2lip_batch_size=8)
+            engine._model = lambda mel, img: torch.zeros(len(img), 3, 96, 96)
+            engine.lease_detector = lambda config=None: nullcontext(BrightDetector())
+            with self.assertRaisesRegex(ValueError, "Too few faces"):
+                engine.run(face, speech, os.path.join(tmp, "out.mp4"))
+            self.assertEqual(sorted(os.listdir(tmp)), ["face.avi", "speech.wav"])
+
+    def test_passthrough_cuts_longer_audio(self):
+        import os
+        import re
+        import subprocess
+        import tempfile
+        from contextlib import nullcontext
+        import cv2
+        import soundfile
+        import torch
+        from engine import Wav2LipEngine
+
+        engine = Wav2LipEngine(device="cpu", checkpoint_path="missing.pth", face_track_cache="", resize_factor=1,
+                               wav2lip_batch_size=8, preset="ultrafast", min_copy=0.5)
+        engine._model = lambda mel, img: torch.zeros(len(img), 3, 96, 96)
+        engine.lease_detector = lambda config=None: nullcontext(BrightDetector())
+        with tempfile.TemporaryDirectory() as tmp:
+            clip, speech = write_clip(tmp, 100, 10.)
+            wav, _ = soundfile.read(speech)
+            wav[16000:16000 * 3] = 0  # silent from 1 to 3 s, so that stretch is copied from the source
+            soundfile.write(speech, wav, 16000, subtype="PCM_16")
+            face = os.path.join(tmp, "face.mp4")
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", clip, "-c:v", "libx264", "-preset", "ultrafast",
+                            "-g", "10", "-pix_fmt", "yuv420p", face], check=True)
+
+            for name, options in [("single.mp4", {"resize_factor": 2}), ("spliced.mp4", {})]:
+                out = os.path.join(tmp, name)
+                engine.run(face, speech, out, passthrough=True, **options)
+                capture = cv2.VideoCapture(out)
+                count = 0
+                while capture.grab():
+                    count += 1
+                capture.release()
+                self.assertEqual(count, 100)
+                banner = subprocess.run(["ffmpeg", "-hide_banner", "-i", out], stderr=subprocess.PIPE).stderr.decode()
+                self.assertIn("Audio:", banner)
+                h, m, sec = re.search(r"Duration: (\d+):(\d+):([\d.]+)", banner).groups()
+                self.assertLess(float(sec) + 60 * int(m), 4.2)  # 4 s of video, not 10 s of audio
+
+    def test_detector_pool(self):
+        import threading
+        import time
+        from unittest import mock
+        from face_detection import DetectorPool
+
+        built = []
+
+        def build(*args, **kwargs):
+            time.sleep(0.05)  # a slow weight load, overlapping the other threads' leases
+            built.append(kwargs["device"])
+            return object()
+
+        pool = DetectorPool(idle_timeout=None)
+        detectors = []
+
+        def lease(device):
+            with pool.lease(device, "sfd", path_to_detector="s3fd.pth") as detector:
+                detectors.append(detector)
+
+        with mock.patch("face_detection.pool.FaceAlignment", side_effect=build):
+            threads = [threading.Thread(target=lease, args=("cpu",)) for _ in range(4)]
+            threads.append(threading.Thread(target=lease, args=("cuda",)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(built), ["cpu", "cuda"])
+            self.assertEqual(len(set(map(id, detectors))), 2)
+            self.assertEqual(len(pool.loaded()), 2)
+
+            with pool.lease("cpu", "sfd", idle_timeout=0.05, path_to_detector="s3fd.pth"):
+                self.assertEqual(pool.release_idle(), 1)  # only the unleased cuda detector
+            time.sleep(0.3)
+            self.assertEqual(pool.loaded(), [])
+            self.assertEqual(len(built), 2)
+
+
+class TestBackends(unittest.TestCase):
+    def test_backends_match_eager(self):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            self.skipTest("onnxruntime is not installed")
+        import tempfile
+        import torch
+        from backends import EagerBackend, OnnxBackend, TorchScriptBackend, export_onnx
+        from batching import BatchBuffers
+        from models import Wav2Lip
+
+        torch.manual_seed(0)
+        model = Wav2Lip().eval()
+        eager = EagerBackend(model, "cpu")
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            onnx = OnnxBackend(export_onnx(model, str(Path(tmp) / "wav2lip.onnx")))
+            for backend in [TorchScriptBackend(model, "cpu"), onnx]:
+                for batch_size in [1, 5]:  # batch size is dynamic
+                    buffers = BatchBuffers(8, 96, (80, 16))
+                    for _ in range(batch_size):
+                        buffers.add(rng.integers(0, 256, (120, 100, 3), dtype=np.uint8), rng.normal(size=(80, 16)))
+                    img, mel = buffers.tensors()
+                    expected = eager(mel, img)
+                    pred = backend(mel, img)
+                    self.assertEqual(pred.shape, (batch_size, 3, 96, 96))
+                    self.assertLess((pred - expected).abs().max().item(), 1e-5)
+
+    def test_fuse_for_inference(self):
+        import copy
+        import torch
+        from models import SyncNet_color, Wav2Lip
+
+        torch.manual_seed(0)
+        for model, inputs in [(Wav2Lip(), (torch.randn(2, 1, 80, 16), torch.rand(2, 6, 96, 96))),
+                              (SyncNet_color(), (torch.randn(2, 1, 80, 16), torch.rand(2, 15, 48, 96)))]:
+            # Running statistics away from their defaults, so folding them is exercised
+            for module in model.modules():
+                if isinstance(module, torch.nn.BatchNorm2d):
+                    module.running_mean.uniform_(-0.5, 0.5)
+                    module.running_var.uniform_(0.5, 2.)
+                    module.weight.data.uniform_(0.5, 1.5)
+                    module.bias.data.uniform_(-0.5, 0.5)
+            model.eval()
+            fused = copy.deepcopy(model).fuse_for_inference()
+            self.assertFalse(any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules()))
+            self.assertIs(fused.fuse_for_inference(), fused)  # fusing again changes nothing
+            with torch.no_grad():
+                expected, got = model(*inputs), fused(*inputs)
+            for e, g in zip(expected if isinstance(expected, tuple) else [expected], got if isinstance(got, tuple) else [got]):
+                self.assertLess((e - g).abs().max().item(), 1e-4 * max(1., e.abs().max().item()))
+
+
+if __name__ == "__main__":
+    unittest.main()